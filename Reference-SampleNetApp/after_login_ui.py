@@ -12,7 +12,7 @@ from p2p_stream import P2PStream
 import errno
 
 class AfterLoginUI:
-    def __init__(self, mode, identifier, user_id, conn, channel_id=None):
+    def __init__(self, mode, identifier, user_id, conn, channel_id=None, session_token=None):
         self.mode = mode
         self.identifier = identifier
         self.user_id = user_id
@@ -21,12 +21,25 @@ class AfterLoginUI:
         self.status = "N/A" if mode == "visitor" else None
 
         self.conn.setblocking(False)
+        # Resuming after a dropped connection (RESUME <token> <last event seq>)
+        self.session_token = session_token
+        self.last_event_seq = 0
+        self.server_addr = self.conn.sock.getpeername()
+        self.resume_timeout = 20  # seconds to keep reconnecting; the server keeps the session for 30
 
         self.channels = {}
+        self.channels_version = None  # version of the last GET_CHANNELS snapshot applied
         self.selected_channel_id = str(channel_id) if channel_id is not None else None
         self.user_id_to_username = {user_id: identifier}
         self.user_id_to_status = {user_id: self.status}
+        self.pending_usernames = set()
+        self.pending_statuses = set()
         self.displayed_messages = set()
+        # History paging for the selected channel (GET_MESSAGES_PAGE)
+        self.message_page_size = 50
+        self.oldest_message_seq = None
+        self.has_older_messages = False
+        self.loading_older_messages = False
         self.joined_channels = set()
         self.response_queue = queue.Queue()
         self.status_response_queue = queue.Queue()
@@ -155,107 +168,170 @@ class AfterLoginUI:
         self.root.mainloop()
 
     def fetch_own_status(self):
+        """GET_STATUS for ourselves before the listener starts; events that arrive first are left for it."""
+        events = []
         try:
-            self.conn.sendall(f"GET_STATUS {self.user_id}".encode())
+            self.conn.send_command(f"GET_STATUS {self.user_id}")
             print(f"[AfterLoginUI] Sent GET_STATUS request for own user_id {self.user_id}")
-            start_time = time.time()
-            timeout = 2.0
-            while time.time() - start_time < timeout:
-                try:
-                    response = self.conn.recv(1024).decode().strip()
-                    if response:
-                        print(f"[AfterLoginUI] Received status response for own user_id {self.user_id}: {response}")
-                        command = response.split()
-                        if command[0] == "STATUS" and command[1] == self.user_id:
-                            return command[2]
-                except socket.error as e:
-                    if e.errno != errno.EWOULDBLOCK:
-                        print(f"[AfterLoginUI] Socket error fetching own status for {self.identifier} (ID: {self.user_id}): {e}")
-                        return None
-                    time.sleep(0.01)
-            print(f"[AfterLoginUI] Timeout fetching own status for {self.identifier} (ID: {self.user_id})")
+            deadline = time.time() + 2.0
+            while True:
+                response = self.conn.recv_frame(timeout=max(deadline - time.time(), 0))
+                if response is None:
+                    print(f"[AfterLoginUI] Timeout fetching own status for {self.identifier} (ID: {self.user_id})")
+                    return None
+                if response.startswith("EVENT"):
+                    # Pushed before the reply: listen_for_updates handles it like any other event
+                    events.append(response)
+                    continue
+                response = response.strip()
+                print(f"[AfterLoginUI] Received status response for own user_id {self.user_id}: {response}")
+                command = response.split()
+                if command[0] == "STATUS" and command[1] == self.user_id:
+                    return command[2]
+                return None
+        except socket.error as e:
+            print(f"[AfterLoginUI] Socket error fetching own status for {self.identifier} (ID: {self.user_id}): {e}")
             return None
         except Exception as e:
             print(f"[AfterLoginUI] Error fetching own status for {self.identifier} (ID: {self.user_id}): {e}")
             return None
+        finally:
+            self.conn.unread(events)
 
     def fetch_channels(self):
         try:
-            self.conn.sendall("GET_CHANNELS".encode())
+            if self.channels_version is None:
+                self.conn.send_command("GET_CHANNELS")
+            else:
+                # The server answers NOT_MODIFIED if nothing changed since our snapshot
+                self.conn.send_command(f"GET_CHANNELS_IF_NEWER {self.channels_version}")
             print(f"[AfterLoginUI] Sent GET_CHANNELS request for {self.identifier} (ID: {self.user_id})")
         except Exception as e:
             print(f"[AfterLoginUI] Error fetching channels for {self.identifier} (ID: {self.user_id}): {e}")
 
-    def fetch_messages(self, channel_id):
+    def fetch_channel_content(self, channel_id):
+        """Pipeline the newest message page and GET_ACTIVE_STREAMS for a channel in one write."""
         try:
-            self.conn.sendall(f"GET_MESSAGES {channel_id}".encode())
-            print(f"[AfterLoginUI] Sent GET_MESSAGES request for channel {channel_id}")
+            self.conn.send_commands([f"GET_MESSAGES_PAGE {channel_id} limit={self.message_page_size}", f"GET_ACTIVE_STREAMS {channel_id}"])
+            print(f"[AfterLoginUI] Sent GET_MESSAGES_PAGE and GET_ACTIVE_STREAMS requests for channel {channel_id}")
         except Exception as e:
-            print(f"[AfterLoginUI] Error fetching messages for channel {channel_id}: {e}")
+            print(f"[AfterLoginUI] Error fetching content for channel {channel_id}: {e}")
 
-    def fetch_active_streams(self, channel_id):
+    def fetch_older_messages(self):
+        """Request the page before the oldest displayed message, once at a time."""
+        if not self.selected_channel_id or not self.has_older_messages or self.loading_older_messages:
+            return
+        self.loading_older_messages = True
         try:
-            self.conn.sendall(f"GET_ACTIVE_STREAMS {channel_id}".encode())
-            print(f"[AfterLoginUI] Sent GET_ACTIVE_STREAMS request for channel {channel_id}")
+            self.conn.send_command(f"GET_MESSAGES_PAGE {self.selected_channel_id} before={self.oldest_message_seq} limit={self.message_page_size}")
+            print(f"[AfterLoginUI] Sent GET_MESSAGES_PAGE request for messages before {self.oldest_message_seq} in channel {self.selected_channel_id}")
         except Exception as e:
-            print(f"[AfterLoginUI] Error fetching active streams for channel {channel_id}: {e}")
+            self.loading_older_messages = False
+            print(f"[AfterLoginUI] Error fetching older messages for channel {self.selected_channel_id}: {e}")
+
+    def on_message_view(self, first, last):
+        """yscrollcommand of the message canvas: runs on every scroll (scrollbar, wheel, keys, new content)."""
+        self.message_scrollbar.set(first, last)
+        if float(first) <= 0.0:
+            self.fetch_older_messages()
+
+    def on_message_wheel(self, event):
+        # <MouseWheel> on Windows/macOS, <Button-4>/<Button-5> on X11
+        step = -1 if event.num == 4 or event.delta > 0 else 1
+        self.message_canvas.yview_scroll(step, "units")
+        # Already at the top the view does not move and yscrollcommand stays quiet
+        self.on_message_view(*self.message_canvas.yview())
+
+    def bind_message_wheel(self, bind):
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            if bind:
+                self.message_canvas.bind_all(sequence, self.on_message_wheel)
+            else:
+                self.message_canvas.unbind_all(sequence)
+
+    def apply_message_page(self, page):
+        """Show a MESSAGES_PAGE response: the newest page on channel open, older pages prepended."""
+        lines = page.split("\n")
+        header = lines[0].split()
+        channel_id = header[1]
+        fields = dict(field.split("=", 1) for field in header[2:])
+        if channel_id != str(self.selected_channel_id):
+            return
+        older_page = self.oldest_message_seq is not None
+        if fields["first"] != "-":
+            first_seq = int(fields["first"])
+            if older_page and first_seq >= self.oldest_message_seq:
+                return  # stale response for a page already shown
+            self.oldest_message_seq = first_seq
+        self.has_older_messages = fields["older"] == "1"
+        self.loading_older_messages = False
+        children = self.message_scrollable_frame.winfo_children()
+        anchor = children[0] if older_page and children else None
+        for line in lines[1:]:
+            try:
+                user_id = line.split()[2]
+                timestamp, msg = line.split(maxsplit=3)[3].split(" | ", 1)
+                self.display_message(self.get_username(user_id), timestamp, msg, before=anchor)
+            except (IndexError, ValueError) as e:
+                print(f"[AfterLoginUI] Error parsing MESSAGE in page: {line}, error: {e}")
+        if anchor is not None:
+            # Keep the message that was at the top in view instead of jumping to the oldest one
+            self.message_canvas.update_idletasks()
+            height = self.message_scrollable_frame.winfo_height()
+            if height:
+                self.message_canvas.yview_moveto(anchor.winfo_y() / height)
+        elif not older_page:
+            # Open the channel at its newest message; older pages load as the top comes into view
+            self.message_canvas.update_idletasks()
+            self.message_canvas.yview_moveto(1.0)
+        print(f"[AfterLoginUI] Displayed page of {len(lines) - 1} messages for channel {channel_id}, older messages available: {self.has_older_messages}")
+
+    def request_user_info(self, user_ids, stale_statuses=()):
+        """Resolve every unknown user_id with one GET_USERNAMES and one GET_STATUSES, in one write.
+
+        The responses are applied by the listener thread as they arrive, so the
+        caller never waits for a round trip. Statuses in stale_statuses are fetched
+        again even if cached: the server only pushes STATUS for users that share a
+        channel with us, so a cached status can be outdated once we meet them in one.
+        """
+        usernames = []
+        statuses = []
+        stale_statuses = set(stale_statuses)
+        for user_id in dict.fromkeys(list(user_ids) + list(stale_statuses)):
+            if user_id not in self.user_id_to_username and user_id not in self.pending_usernames:
+                self.pending_usernames.add(user_id)
+                usernames.append(user_id)
+            if (user_id not in self.user_id_to_status or user_id in stale_statuses) and user_id not in self.pending_statuses:
+                self.pending_statuses.add(user_id)
+                statuses.append(user_id)
+        commands = []
+        if usernames:
+            commands.append(f"GET_USERNAMES {' '.join(usernames)}")
+        if statuses:
+            commands.append(f"GET_STATUSES {' '.join(statuses)}")
+        if not commands:
+            return
+        try:
+            self.conn.send_commands(commands)
+            print(f"[AfterLoginUI] Requested {len(usernames)} usernames and {len(statuses)} statuses")
+        except Exception as e:
+            print(f"[AfterLoginUI] Error requesting user info for {user_ids}: {e}")
+            self.pending_usernames.difference_update(user_ids)
+            self.pending_statuses.difference_update(user_ids)
 
     def fetch_username(self, user_id):
         if user_id in self.user_id_to_username:
             return self.user_id_to_username[user_id]
-        try:
-            self.conn.sendall(f"GET_USERNAME {user_id}".encode())
-            while True:
-                try:
-                    response = self.conn.recv(1024).decode().strip()
-                    if response:
-                        break
-                except socket.error as e:
-                    if e.errno != errno.EWOULDBLOCK:
-                        raise e
-                    continue
-            print(f"[AfterLoginUI] Received username response for user_id {user_id}: {response}")
-            command = response.split()
-            if command[0] == "USERNAME":
-                _, fetched_user_id, username = command
-                self.user_id_to_username[fetched_user_id] = username
-                return username
-            else:
-                print(f"[AfterLoginUI] Username not found for user_id {user_id}")
-                return user_id
-        except Exception as e:
-            print(f"[AfterLoginUI] Error fetching username for user_id {user_id}: {e}")
-            return user_id
+        # Show the raw ID until the listener receives the USERNAME response
+        self.request_user_info([user_id])
+        return user_id
 
     def fetch_status(self, user_id):
         if user_id in self.user_id_to_status:
             return self.user_id_to_status[user_id]
-        try:
-            self.conn.sendall(f"GET_STATUS {user_id}".encode())
-            print(f"[AfterLoginUI] Sent GET_STATUS request for user_id {user_id}")
-            while True:
-                try:
-                    response = self.conn.recv(1024).decode().strip()
-                    if response:
-                        break
-                except socket.error as e:
-                    if e.errno != errno.EWOULDBLOCK:
-                        raise e
-                    continue
-            print(f"[AfterLoginUI] Received status response for user_id {user_id}: {response}")
-            command = response.split()
-            if command[0] == "STATUS":
-                _, fetched_user_id, status = command
-                self.user_id_to_status[fetched_user_id] = status
-                return status
-            else:
-                print(f"[AfterLoginUI] Status not found for user_id {user_id}, assuming Offline")
-                self.user_id_to_status[user_id] = "Offline"
-                return "Offline"
-        except Exception as e:
-            print(f"[AfterLoginUI] Error fetching status for user_id {user_id}: {e}")
-            self.user_id_to_status[user_id] = "Offline"
-            return "Offline"
+        # Assume Offline until the listener receives the STATUS response
+        self.request_user_info([user_id])
+        return "Offline"
 
     def get_status_color(self, status=None):
         if status is None:
@@ -274,19 +350,63 @@ class AfterLoginUI:
     def listen_for_updates(self):
         while self.running:
             try:
-                data = self.conn.recv(1024).decode()
-                if not data:
+                try:
+                    frames = self.conn.recv_frames()
+                except ConnectionError:
                     print(f"[AfterLoginUI] Connection closed by server for {self.identifier} (ID: {self.user_id})")
+                    if self.running and self.resume_connection():
+                        continue
                     break
-                print(f"[AfterLoginUI] Received update for {self.identifier} (ID: {self.user_id}): {data}")
-                messages = data.strip().split("\n")
+                if not frames:
+                    time.sleep(0.01)
+                    continue
+                print(f"[AfterLoginUI] Received update for {self.identifier} (ID: {self.user_id}): {frames}")
+                messages = []
+                for frame in frames:
+                    if frame.startswith("MESSAGES_PAGE "):
+                        messages.append(frame)  # a page is applied as one unit
+                    else:
+                        messages.extend(frame.split("\n"))
+                refresh_member_list = False
+                refresh_channel_lists = False
+                lookup_ids = []  # user_ids seen in this batch, resolved with one request at the end
+                stale_status_ids = []  # users we now share a channel with; their cached status may be outdated
+                resume_failed = False
                 for message in messages:
                     if not message:
                         continue
-                    command = message.split()
+                    command = message.split("\n", 1)[0].split()
                     print(f"[AfterLoginUI] Parsed command: {command}, length: {len(command)}")
 
-                    if command[0] == "NO_CHANNELS":
+                    if command[0] == "EVENT":
+                        # Sequence number of the pushed event on the following lines, sent back on RESUME
+                        try:
+                            self.last_event_seq = int(command[1])
+                        except (ValueError, IndexError) as e:
+                            print(f"[AfterLoginUI] Error parsing EVENT message: {message}, error: {e}")
+
+                    elif command[0] == "RESUMED":
+                        print(f"[AfterLoginUI] Session resumed for {self.identifier} (ID: {self.user_id}), {command[2] if len(command) > 2 else '?'} missed events replayed")
+                        # Lookups in flight when the connection dropped were lost with it
+                        self.pending_usernames.clear()
+                        self.pending_statuses.clear()
+                        for channel in self.channels.values():
+                            lookup_ids.extend(channel["regular_members"] + channel["visitors"] + [channel["host"]])
+
+                    elif command[0] == "RESUME_FAILED":
+                        print(f"[AfterLoginUI] Could not resume the session for {self.identifier} (ID: {self.user_id})")
+                        resume_failed = True
+
+                    elif command[0] == "CHANNELS_VERSION":
+                        try:
+                            self.channels_version = int(command[1])
+                        except (ValueError, IndexError) as e:
+                            print(f"[AfterLoginUI] Error parsing CHANNELS_VERSION message: {message}, error: {e}")
+
+                    elif command[0] == "NOT_MODIFIED":
+                        print(f"[AfterLoginUI] Channel list unchanged since version {self.channels_version}")
+
+                    elif command[0] == "NO_CHANNELS":
                         self.channels = {}
                         self.update_channel_lists()
                         print(f"[AfterLoginUI] No channels available, cleared channel list")
@@ -317,28 +437,60 @@ class AfterLoginUI:
                                 "visitors": visitors
                             }
                             print(f"[AfterLoginUI] Parsed CHANNEL: channel_id={channel_id}, name={channel_name}, host={host}, regular_members={regular_members}, visitors={visitors}")
-                            all_ids = regular_members + visitors + [host]
-                            for member_id in all_ids:
-                                if member_id not in self.user_id_to_username:
-                                    self.fetch_username(member_id)
-                                if member_id not in self.user_id_to_status:
-                                    self.fetch_status(member_id)
-                            self.update_channel_lists()
+                            lookup_ids.extend(regular_members + visitors + [host])
+                            refresh_channel_lists = True
                             if str(self.selected_channel_id) == str(channel_id):
                                 print(f"[AfterLoginUI] Channel {channel_id} is currently selected, updating member list")
-                                self.update_member_list(channel_id)
+                                refresh_member_list = True
                         except (ValueError, IndexError) as e:
                             print(f"[AfterLoginUI] Error parsing CHANNEL message: {message}, error: {e}")
 
-                    elif command[0] == "UPDATE_CHANNELS":
+                    elif command[0] == "CHANNEL_ADDED":
                         try:
                             channel_id = int(command[1])
-                            host = command[2]
-                            channel_name = " ".join(command[3:])
-                            print(f"[AfterLoginUI] Received UPDATE_CHANNELS for channel {channel_id}, fetching updated channel list")
-                            self.fetch_channels()
+                            host, kind = command[2], command[3]
+                            channel_name = " ".join(command[4:])
+                            self.channels[channel_id] = {
+                                "name": channel_name,
+                                "host": host,
+                                "regular_members": [host] if kind == "regular" else [],
+                                "visitors": [host] if kind == "visitor" else []
+                            }
+                            print(f"[AfterLoginUI] Added channel {channel_id} ({channel_name}) hosted by {host}")
+                            lookup_ids.append(host)
+                            refresh_channel_lists = True
                         except (ValueError, IndexError) as e:
-                            print(f"[AfterLoginUI] Error parsing UPDATE_CHANNELS message: {message}, error: {e}")
+                            print(f"[AfterLoginUI] Error parsing CHANNEL_ADDED message: {message}, error: {e}")
+
+                    elif command[0] in ("MEMBER_JOINED", "MEMBER_LEFT"):
+                        try:
+                            channel_id = int(command[1])
+                            user_id = command[2]
+                            channel = self.channels.get(channel_id)
+                            if channel is None:
+                                # Missed the CHANNEL_ADDED; resynchronize from a full snapshot
+                                print(f"[AfterLoginUI] {command[0]} for unknown channel {channel_id}, fetching channel list")
+                                self.fetch_channels()
+                                continue
+                            if command[0] == "MEMBER_JOINED":
+                                members = channel["visitors"] if command[3] == "visitor" else channel["regular_members"]
+                                if user_id not in members:
+                                    members.append(user_id)
+                                lookup_ids.append(user_id)
+                                if user_id == self.user_id:
+                                    stale_status_ids.extend(channel["regular_members"] + channel["visitors"])
+                                elif self.user_id in channel["regular_members"] + channel["visitors"]:
+                                    stale_status_ids.append(user_id)
+                            else:
+                                for members in (channel["regular_members"], channel["visitors"]):
+                                    if user_id in members:
+                                        members.remove(user_id)
+                            print(f"[AfterLoginUI] Applied {command[0]} for user_id {user_id} in channel {channel_id}")
+                            refresh_channel_lists = True
+                            if str(self.selected_channel_id) == str(channel_id):
+                                refresh_member_list = True
+                        except (ValueError, IndexError) as e:
+                            print(f"[AfterLoginUI] Error parsing {command[0]} message: {message}, error: {e}")
 
                     elif command[0] == "CHANNEL_CREATED":
                         try:
@@ -348,8 +500,8 @@ class AfterLoginUI:
                             print(f"[AfterLoginUI] Error parsing CHANNEL_CREATED message: {message}, error: {e}")
 
                     elif command[0] == "JOIN_SUCCESS":
+                        # The MEMBER_JOINED broadcast updates self.channels
                         print(f"[AfterLoginUI] {self.identifier} (ID: {self.user_id}) successfully joined channel {self.selected_channel_id}")
-                        self.fetch_channels()
 
                     elif command[0] == "ALREADY_MEMBER":
                         print(f"[AfterLoginUI] {self.identifier} (ID: {self.user_id}) is already a member of channel {self.selected_channel_id}")
@@ -372,6 +524,13 @@ class AfterLoginUI:
                     elif command[0] == "NO_MESSAGES":
                         pass
 
+                    elif command[0] == "MESSAGES_PAGE":
+                        try:
+                            self.apply_message_page(message)
+                        except (IndexError, ValueError, KeyError) as e:
+                            self.loading_older_messages = False
+                            print(f"[AfterLoginUI] Error parsing MESSAGES_PAGE: {command}, error: {e}")
+
                     elif command[0] in ["VISITOR_NOT_ALLOWED", "CHANNEL_NOT_FOUND", "NOT_A_MEMBER"]:
                         error_msg = {
                             "VISITOR_NOT_ALLOWED": "Visitors cannot send messages.",
@@ -389,20 +548,34 @@ class AfterLoginUI:
                         self.response_queue.put(("ERROR", message))
                         print(f"[AfterLoginUI] Queued error response for LEAVE_CHANNEL: {message}")
 
+                    elif command[0] == "STATUS_BATCH":
+                        # Header of a coalesced presence frame; its STATUS lines follow in this batch
+                        print(f"[AfterLoginUI] Received presence batch of {command[1] if len(command) > 1 else '?'} updates")
+
                     elif command[0] == "STATUS":
                         try:
                             _, user_id, status = command
                             self.user_id_to_status[user_id] = status
+                            self.pending_statuses.discard(user_id)
                             print(f"[AfterLoginUI] Updated status for user_id {user_id}: {status}")
-                            if self.selected_channel_id:
-                                channel = self.channels.get(int(self.selected_channel_id))
-                                if channel:
-                                    all_members = [channel["host"]] + channel["regular_members"] + channel["visitors"]
-                                    if user_id in all_members:
-                                        self.update_member_list(int(self.selected_channel_id))
+                            if self.is_selected_channel_member(user_id):
+                                refresh_member_list = True
                         except (ValueError, IndexError) as e:
                             print(f"[AfterLoginUI] Error parsing STATUS message: {message}, error: {e}")
 
+                    elif command[0] in ("USERNAME", "USERNAME_NOT_FOUND"):
+                        try:
+                            user_id = command[1]
+                            # Unknown IDs are displayed as-is, like before
+                            username = command[2] if command[0] == "USERNAME" else user_id
+                            self.user_id_to_username[user_id] = username
+                            self.pending_usernames.discard(user_id)
+                            print(f"[AfterLoginUI] Received username for user_id {user_id}: {username}")
+                            if self.is_selected_channel_member(user_id):
+                                refresh_member_list = True
+                        except IndexError as e:
+                            print(f"[AfterLoginUI] Error parsing {command[0]} message: {message}, error: {e}")
+
                     elif command[0] == "STATUS_UPDATED" or command[0] == "INVALID_STATUS" or command[0] == "USER_NOT_FOUND":
                         self.status_response_queue.put((command[0], message))
                         print(f"[AfterLoginUI] Queued status response: {message}")
@@ -482,11 +655,23 @@ class AfterLoginUI:
                         self.update_stream_toggle_button()
                         self.cleanup_own_stream_ui()
 
+                if lookup_ids or stale_status_ids:
+                    self.request_user_info(lookup_ids, stale_statuses=stale_status_ids)
+                if refresh_channel_lists:
+                    self.update_channel_lists()
+                if refresh_member_list and self.selected_channel_id:
+                    self.update_member_list(int(self.selected_channel_id))
+                if resume_failed:
+                    self.root.after(0, lambda: messagebox.showerror("Disconnected", "Lost the connection to the server. Please log in again."))
+                    break
+
             except socket.error as e:
                 if e.errno == errno.EWOULDBLOCK:
                     continue
                 else:
                     print(f"[AfterLoginUI] Socket error in listener for {self.identifier} (ID: {self.user_id}): {e}")
+                    if self.running and self.resume_connection():
+                        continue
                     break
             except Exception as e:
                 print(f"[AfterLoginUI] Error in listener for {self.identifier} (ID: {self.user_id}): {e}")
@@ -494,6 +679,41 @@ class AfterLoginUI:
 
         print(f"[AfterLoginUI] Listener thread exiting for {self.identifier} (ID: {self.user_id})")
 
+    def resume_connection(self):
+        """Reconnect after a dropped connection and send RESUME; the listener handles the reply.
+
+        Returns False if there is no session token or the server stays unreachable
+        for resume_timeout seconds.
+        """
+        if not self.session_token:
+            return False
+        deadline = time.time() + self.resume_timeout
+        while self.running and time.time() < deadline:
+            try:
+                sock = socket.create_connection(self.server_addr, timeout=2)
+            except OSError as e:
+                print(f"[AfterLoginUI] Reconnect to {self.server_addr} failed: {e}, retrying")
+                time.sleep(1)
+                continue
+            sock.setblocking(False)
+            self.conn.reconnect(sock)
+            try:
+                self.conn.send_command(f"RESUME {self.session_token} {self.last_event_seq}")
+            except OSError as e:
+                print(f"[AfterLoginUI] Error sending RESUME: {e}")
+                continue
+            print(f"[AfterLoginUI] Reconnected to {self.server_addr}, resuming after event {self.last_event_seq}")
+            return True
+        return False
+
+    def is_selected_channel_member(self, user_id):
+        if not self.selected_channel_id:
+            return False
+        channel = self.channels.get(int(self.selected_channel_id))
+        if not channel:
+            return False
+        return user_id == channel["host"] or user_id in channel["regular_members"] or user_id in channel["visitors"]
+
     def process_status_responses(self):
         while self.running:
             try:
@@ -745,6 +965,9 @@ class AfterLoginUI:
             return
 
         self.displayed_messages.clear()
+        self.oldest_message_seq = None
+        self.has_older_messages = False
+        self.loading_older_messages = False
         print(f"[AfterLoginUI] Cleared displayed messages for channel {channel_id}")
 
         # Hide the own stream UI if it exists
@@ -769,7 +992,9 @@ class AfterLoginUI:
         message_frame.pack(fill="both", expand=True, padx=10)
 
         canvas = Canvas(message_frame, bg=self.main_color, highlightthickness=0)
+        self.message_canvas = canvas
         scrollbar = ttk.Scrollbar(message_frame, orient="vertical", command=canvas.yview)
+        self.message_scrollbar = scrollbar
         self.message_scrollable_frame = tk.Frame(canvas, bg=self.main_color)
 
         self.message_scrollable_frame.bind(
@@ -778,7 +1003,10 @@ class AfterLoginUI:
         )
 
         canvas.create_window((0, 0), window=self.message_scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
+        # Scrolling to the top, by any means, loads the previous page of history
+        canvas.configure(yscrollcommand=self.on_message_view)
+        canvas.bind("<Enter>", lambda e: self.bind_message_wheel(True))
+        canvas.bind("<Leave>", lambda e: self.bind_message_wheel(False))
 
         scrollbar.pack(side="right", fill="y")
         canvas.pack(side="left", fill="both", expand=True)
@@ -835,11 +1063,10 @@ class AfterLoginUI:
                     self.stream_toggle_button.config(state="disabled")
 
         if self.user_id in all_members:
-            self.fetch_messages(channel_id)
-            self.fetch_active_streams(channel_id)
+            self.fetch_channel_content(channel_id)
             self.update_member_list(channel_id)
 
-    def display_message(self, username, timestamp, message):
+    def display_message(self, username, timestamp, message, before=None):
         message_id = f"{self.selected_channel_id}:{username}:{timestamp}:{message}"
         if message_id in self.displayed_messages:
             print(f"[AfterLoginUI] Skipped duplicate message: {message_id}")
@@ -847,14 +1074,17 @@ class AfterLoginUI:
         self.displayed_messages.add(message_id)
         msg_text = f"{username} ({timestamp}): {message}"
         msg_label = tk.Label(self.message_scrollable_frame, text=msg_text, font=("Arial", 10), bg=self.main_color, fg=self.text_color, anchor="w", wraplength=400, justify="left")
-        msg_label.pack(fill="x", padx=5, pady=2)
+        if before is not None:
+            msg_label.pack(fill="x", padx=5, pady=2, before=before)
+        else:
+            msg_label.pack(fill="x", padx=5, pady=2)
         print(f"[AfterLoginUI] Displayed message: {msg_text}")
 
     def send_message(self):
         message = self.message_entry.get().strip()
         if message and self.selected_channel_id:
             try:
-                self.conn.sendall(f"SEND_MESSAGE {self.user_id} {self.selected_channel_id} {message}".encode())
+                self.conn.send_command(f"SEND_MESSAGE {self.user_id} {self.selected_channel_id} {message}")
                 print(f"[AfterLoginUI] Sent SEND_MESSAGE request for {self.identifier} (ID: {self.user_id}): {message}")
             except Exception as e:
                 print(f"[AfterLoginUI] Error sending message for {self.identifier} (ID: {self.user_id}): {e}")
@@ -862,7 +1092,7 @@ class AfterLoginUI:
 
     def join_channel(self, channel_id):
         try:
-            self.conn.sendall(f"JOIN_CHANNEL {self.user_id} {channel_id}".encode())
+            self.conn.send_command(f"JOIN_CHANNEL {self.user_id} {channel_id}")
             print(f"[AfterLoginUI] Sent JOIN_CHANNEL request for channel {channel_id}")
             self.joined_channels.add(channel_id)
             print(f"[AfterLoginUI] Added channel {channel_id} to joined channels for {self.identifier} (ID: {self.user_id})")
@@ -883,7 +1113,7 @@ class AfterLoginUI:
             return
 
         try:
-            self.conn.sendall(f"LEAVE_CHANNEL {self.user_id} {channel_id}".encode())
+            self.conn.send_command(f"LEAVE_CHANNEL {self.user_id} {channel_id}")
             print(f"[AfterLoginUI] Sent LEAVE_CHANNEL request for channel {channel_id}")
             self.joined_channels.discard(channel_id)
             print(f"[AfterLoginUI] Removed channel {channel_id} from joined channels for {self.identifier} (ID: {self.user_id})")
@@ -900,7 +1130,6 @@ class AfterLoginUI:
                     if response_type == "LEAVE_SUCCESS":
                         print(f"[AfterLoginUI] Successfully left channel {channel_id}")
                         self.selected_channel_id = None
-                        self.fetch_channels()
                         for widget in self.content_frame.winfo_children():
                             widget.destroy()
                         tk.Label(self.content_frame, text="You have left the channel.", font=("Arial", 12), bg=self.main_color, fg=self.text_color).pack(pady=10)
@@ -949,7 +1178,7 @@ class AfterLoginUI:
                 print(f"[AfterLoginUI] Channel creation failed: empty channel name")
                 return
             try:
-                self.conn.sendall(f"CREATE_CHANNEL {self.user_id} {channel_name}".encode())
+                self.conn.send_command(f"CREATE_CHANNEL {self.user_id} {channel_name}")
                 print(f"[AfterLoginUI] Sent CREATE_CHANNEL request for {self.identifier} (ID: {self.user_id}): {channel_name}")
                 dialog.destroy()
             except Exception as e:
@@ -972,7 +1201,7 @@ class AfterLoginUI:
             return
 
         try:
-            self.conn.sendall(f"SET_STATUS {self.user_id} {new_status}".encode())
+            self.conn.send_command(f"SET_STATUS {self.user_id} {new_status}")
             print(f"[AfterLoginUI] Sent SET_STATUS request for {self.identifier} (ID: {self.user_id}): {new_status}")
             self.last_status_change = current_time
         except Exception as e:
@@ -1074,11 +1303,17 @@ class AfterLoginUI:
 
         if self.mode == "authenticated" and self.status != "Invisible":
             try:
-                self.conn.sendall(f"SET_STATUS {self.user_id} Offline".encode())
+                self.conn.send_command(f"SET_STATUS {self.user_id} Offline")
                 print(f"[AfterLoginUI] Sent SET_STATUS Offline for {self.identifier} (ID: {self.user_id}) on logout")
             except Exception as e:
                 print(f"[AfterLoginUI] Error sending SET_STATUS Offline: {e}")
 
+        try:
+            # Without this the server would keep the session resumable for its grace period
+            self.conn.send_command("LOGOUT")
+        except Exception as e:
+            print(f"[AfterLoginUI] Error sending LOGOUT: {e}")
+
         try:
             if self.listener_thread and self.listener_thread.is_alive():
                 self.listener_thread.join(timeout=1.0)
@@ -0,0 +1,67 @@
+"""Resolving a channel's members: one round trip per ID versus GET_USERNAMES/GET_STATUSES.
+
+Starts a threaded server in a scratch directory, registers --members users and
+resolves all of them the way the original client did (a blocking GET_USERNAME and
+GET_STATUS per member) and with the two batch commands sent in one write.
+Loopback round trips are cheap, so the gap grows with real network latency;
+the round-trip count is the figure to compare.
+
+    python benchmarks/bench_batch_lookups.py --members 200
+"""
+import argparse
+import socket
+import tempfile
+import time
+
+from bench_server_modes import free_port, start_server
+from bench_utils import format_seconds
+from framing import FramedConnection
+
+
+def per_id(conn, user_ids):
+    for user_id in user_ids:
+        for command in (f"GET_USERNAME {user_id}", f"GET_STATUS {user_id}"):
+            conn.send_command(command)
+            conn.recv_frame(timeout=5)
+    return 2 * len(user_ids)
+
+
+def batched(conn, user_ids):
+    ids = " ".join(user_ids)
+    conn.send_commands([f"GET_USERNAMES {ids}", f"GET_STATUSES {ids}"])
+    conn.recv_frame(timeout=5)
+    conn.recv_frame(timeout=5)
+    return 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--members", type=int, default=200)
+    args = parser.parse_args()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        proc = start_server("threaded", port, workdir)
+        try:
+            conn = FramedConnection(socket.create_connection(("127.0.0.1", port)))
+            for i in range(args.members):
+                conn.send_command(f"REGISTER user{i} pw")
+                conn.recv_frame(timeout=5)
+            user_ids = [str(i + 1) for i in range(args.members)]
+            print(f"{args.members} members")
+            print(f"{'lookup':>28} {'round trips':>12} {'time':>10}")
+            for label, resolve in (("GET_USERNAME + GET_STATUS", per_id), ("GET_USERNAMES + GET_STATUSES", batched)):
+                best, trips = float("inf"), 0
+                for _ in range(5):
+                    start = time.perf_counter()
+                    trips = resolve(conn, user_ids)
+                    best = min(best, time.perf_counter() - start)
+                print(f"{label:>28} {trips:>12} {format_seconds(best):>10}")
+            conn.close()
+        finally:
+            proc.kill()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Request-path cost of log_connection: background writer versus open/append/print per event.
+
+The previous implementation reopened connection_log.txt, checked rotation and
+printed the line on every call; it is reproduced inline below. The new
+log_connection only queues the event, so the table also reports how long the
+writer thread takes to get everything onto disk.
+
+    python benchmarks/bench_connection_log.py --events 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from bench_utils import format_seconds, quiet
+from connection_logger import ConnectionLogger
+
+DETAILS = "Broadcasted message to alice in channel 1: MESSAGE 1 2 2025-04-22T07:04:01 | hello"
+
+
+def legacy_log_connection(path, event_type, source, details):
+    timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    log_entry = f"[{timestamp}] {event_type} | Source: {source} | Details: {details}\n"
+    with open(path, 'a') as f:
+        f.write(log_entry)
+    print(f"[Server] Logged: {log_entry.strip()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "connection_log.txt")
+        with quiet():
+            start = time.perf_counter()
+            for _ in range(args.events):
+                legacy_log_connection(path, "NOTIFICATION_SENT", "Centralized Server", DETAILS)
+            legacy = time.perf_counter() - start
+
+        logger = ConnectionLogger(path, max_bytes=sys.maxsize)
+        with quiet():
+            logger.start()
+        start = time.perf_counter()
+        for _ in range(args.events):
+            logger.log("NOTIFICATION_SENT", "Centralized Server", DETAILS)
+        queued = time.perf_counter() - start
+        logger.flush()
+        drained = time.perf_counter() - start
+        logger.close()
+
+    print(f"{args.events} events")
+    print(f"{'':>28} {'total':>10} {'per event':>10}")
+    print(f"{'open/append/print per event':>28} {format_seconds(legacy):>10} {format_seconds(legacy / args.events):>10}")
+    print(f"{'queue put (request path)':>28} {format_seconds(queued):>10} {format_seconds(queued / args.events):>10}")
+    print(f"{'queue put + writer drained':>28} {format_seconds(drained):>10} {format_seconds(drained / args.events):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""GET_CHANNELS cost: rebuilding the response every call versus the cached snapshot.
+
+Creates --channels channels with --members members each (a tenth of them
+visitors) and times the previous per-call rebuild, a cached GET_CHANNELS,
+GET_CHANNELS_IF_NEWER with a current version, and a GET_CHANNELS right after
+one join (only that channel's line is re-rendered).
+
+    python benchmarks/bench_get_channels.py --channels 1000 --members 50
+"""
+import argparse
+
+from bench_utils import format_seconds, load_server, quiet, timeit
+
+
+def rebuild(server):
+    response = []
+    for channel_id, channel in server.channels.items():
+        response.append(server.format_channel(channel_id, channel))
+    return "\n".join(response)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--channels", type=int, default=1000)
+    parser.add_argument("--members", type=int, default=50)
+    args = parser.parse_args()
+
+    server = load_server()
+    with quiet():
+        for i in range(args.members):
+            if i % 10 == 0:
+                server.handle_visitor(f"VISITOR guest{i}", None)
+            else:
+                server.handle_register(f"REGISTER user{i} pw")
+        member_ids = list(server.visitor_id_to_name) + list(server.user_id_to_username)
+        for _ in range(args.channels):
+            response = server.handle_create_channel(f"CREATE_CHANNEL {member_ids[-1]} bench room")
+            channel_id = response.split()[1]
+            server.channels[channel_id]["members"] = dict.fromkeys(member_ids)
+        server.rebuild_membership_index()
+        server.channels_changed()
+
+        version, _ = server.get_channels_snapshot()
+        rows = [
+            ("rebuild every call (before)", timeit(lambda: rebuild(server), repeat=5)),
+            ("cached GET_CHANNELS", timeit(lambda: server.handle_get_channels("GET_CHANNELS"), repeat=5, number=100)),
+            ("GET_CHANNELS_IF_NEWER, unchanged",
+             timeit(lambda: server.handle_get_channels_if_newer(f"GET_CHANNELS_IF_NEWER {version}"), repeat=5, number=1000)),
+        ]
+
+        def join_then_get():
+            server.channels_changed(channel_id)
+            server.handle_get_channels("GET_CHANNELS")
+        rows.append(("GET_CHANNELS after one join", timeit(join_then_get, repeat=5, number=10)))
+
+    print(f"{args.channels} channels x {args.members} members")
+    for label, seconds in rows:
+        print(f"{label:>34} {format_seconds(seconds):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Handler microbenchmarks on synthetic state, saved as JSON baselines to diff between commits.
+
+Every case runs in a fresh process that writes users.json and channels.json of
+the case's size, imports server.py on them and calls the handlers through
+process_command, as a client's command would run (sessions are in-process
+stand-ins that only count frames):
+- get_channels: GET_CHANNELS right after a change to every channel, after a
+  change to one channel, and cached;
+- send_message: SEND_MESSAGE to a channel whose members are all connected;
+- get_messages: GET_MESSAGES and the newest and oldest GET_MESSAGES_PAGE of a
+  channel with a long history;
+- disconnect: end_session() of a visitor who is in several channels, with
+  many other clients online.
+
+--grid quick takes a few seconds; --grid full (a few minutes) goes up to 100k users, 10k
+channels, 5k members per channel and 1M messages of history. --save writes the
+results (best of several runs, in seconds) to a JSON file; --compare diffs them
+against such a file and exits with status 1 if a measurement got slower by more
+than --threshold.
+
+    python benchmarks/bench_handlers.py --grid quick --save benchmarks/baselines/quick.json
+    python benchmarks/bench_handlers.py --grid quick --compare benchmarks/baselines/quick.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+
+from bench_utils import StubSession, format_seconds, load_server, quiet, timeit
+
+GRIDS = {
+    "quick": {
+        "get_channels": [dict(users=10, channels=10, members=1), dict(users=1000, channels=100, members=100),
+                         dict(users=10000, channels=1000, members=100)],
+        "send_message": [dict(members=1), dict(members=100), dict(members=1000)],
+        "get_messages": [dict(history=1000), dict(history=10000)],
+        "disconnect": [dict(online=10, channels=10, joined=1), dict(online=1000, channels=1000, joined=10),
+                       dict(online=10000, channels=1000, joined=100)],
+    },
+}
+GRIDS["full"] = {
+    "get_channels": GRIDS["quick"]["get_channels"] + [dict(users=100000, channels=10000, members=10),
+                                                      dict(users=10000, channels=100, members=5000)],
+    "send_message": GRIDS["quick"]["send_message"] + [dict(members=5000)],
+    "get_messages": GRIDS["quick"]["get_messages"] + [dict(history=100000), dict(history=1000000)],
+    "disconnect": GRIDS["quick"]["disconnect"] + [dict(online=100000, channels=10000, joined=10)],
+}
+
+
+def write_state(users, channels=(), workdir="."):
+    """Write users.json with users user0..user<n-1> (IDs 1..n) and channels.json with channels=[(host, members)]."""
+    user_db = {"users": {f"user{i}": {"password": "pw", "status": "Online", "user_id": str(i + 1)} for i in range(users)},
+               "next_user_id": users + 1}
+    channel_db = {"channels": {str(c + 1): {"name": f"room{c}", "host": host, "members": members}
+                               for c, (host, members) in enumerate(channels)},
+                  "next_id": len(channels) + 1}
+    with open(os.path.join(workdir, "users.json"), "w") as f:
+        json.dump(user_db, f)
+    with open(os.path.join(workdir, "channels.json"), "w") as f:
+        json.dump(channel_db, f)
+
+
+def connect(server, user_id):
+    session = StubSession(server.get_username_by_user_id(user_id), user_id)
+    server.add_connected_client(session)
+    server.index_session(session)
+    return session
+
+
+def bench_get_channels(users, channels, members):
+    ids = [str(i + 1) for i in range(users)]
+    layout = [(ids[c % users], [ids[(c + m) % users] for m in range(min(members, users))]) for c in range(channels)]
+    server = load_server(lambda workdir: write_state(users, layout, workdir))
+
+    def one_changed():
+        server.channels_changed("1")
+        server.process_command("GET_CHANNELS", None, None)
+
+    def all_changed():
+        server.channels_changed()
+        server.process_command("GET_CHANNELS", None, None)
+
+    return {
+        "GET_CHANNELS, all changed": timeit(all_changed),
+        "GET_CHANNELS, one changed": timeit(one_changed, number=10),
+        "GET_CHANNELS, cached": timeit(lambda: server.process_command("GET_CHANNELS", None, None), number=1000),
+    }
+
+
+def bench_send_message(members):
+    ids = [str(i + 1) for i in range(members)]
+    server = load_server(lambda workdir: write_state(members, [(ids[0], ids)], workdir))
+    sessions = [connect(server, user_id) for user_id in ids]
+    command = "SEND_MESSAGE 1 1 benchmark message"
+    result = {"SEND_MESSAGE": timeit(lambda: server.process_command(command, None, None), number=100)}
+    assert sessions[-1].frames, "SEND_MESSAGE reached no member"
+    return result
+
+
+def bench_get_messages(history):
+    server = load_server(lambda workdir: write_state(1, [("1", ["1"])], workdir))
+    for n in range(history):
+        server.message_store.append("1", {"user_id": "1", "message": f"message {n}", "timestamp": "2024-01-01T00:00:00"})
+    repeat = 3 if history > 10000 else 5
+    return {
+        "GET_MESSAGES": timeit(lambda: server.process_command("GET_MESSAGES 1", None, None), repeat=repeat),
+        "GET_MESSAGES_PAGE, newest": timeit(lambda: server.process_command("GET_MESSAGES_PAGE 1", None, None), number=100),
+        "GET_MESSAGES_PAGE, oldest": timeit(lambda: server.process_command("GET_MESSAGES_PAGE 1 before=50", None, None),
+                                            number=100),
+    }
+
+
+def bench_disconnect(online, channels, joined):
+    ids = [str(i + 1) for i in range(online)]
+    server = load_server(lambda workdir: write_state(online, [(ids[c % online], [ids[c % online]])
+                                                              for c in range(channels)], workdir))
+    for user_id in ids:
+        connect(server, user_id)
+    best = float("inf")
+    for i in range(5):
+        visitor_id = server.handle_visitor(f"VISITOR guest{i}", None).split()[2]
+        for c in range(joined):
+            server.process_command(f"JOIN_CHANNEL {visitor_id} {c * channels // joined + 1}", None, None)
+        session = connect(server, visitor_id)
+        best = min(best, timeit(lambda: server.end_session(session), repeat=1))
+        assert visitor_id not in server.user_channels, "end_session left the visitor in a channel"
+    return {"visitor end_session": best}
+
+
+BENCHMARKS = {
+    "get_channels": bench_get_channels,
+    "send_message": bench_send_message,
+    "get_messages": bench_get_messages,
+    "disconnect": bench_disconnect,
+}
+
+
+def run_case(name, params, results):
+    try:
+        with quiet():
+            results.put(BENCHMARKS[name](**params))
+    except Exception as e:
+        results.put(RuntimeError(f"{name} {params}: {type(e).__name__}: {e}"))
+        raise
+
+
+def run_grid(grid, only=None):
+    """Run every case of a grid in its own process; returns {"<benchmark> <measurement> [<params>]": seconds}."""
+    context = multiprocessing.get_context("fork")
+    results = {}
+    for name, cases in GRIDS[grid].items():
+        if only and name not in only:
+            continue
+        for params in cases:
+            label = " ".join(f"{key}={value}" for key, value in params.items())
+            queue = context.Queue()
+            process = context.Process(target=run_case, args=(name, params, queue))
+            process.start()
+            measured = queue.get()
+            process.join()
+            if isinstance(measured, Exception):
+                raise measured
+            for measurement, seconds in measured.items():
+                key = f"{name} {measurement} [{label}]"
+                results[key] = seconds
+                print(f"{key:<78} {format_seconds(seconds):>10}", flush=True)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Print each measurement against the baseline; returns the keys that got slower than allowed."""
+    slower = []
+    print(f"\n{'measurement':<78} {'baseline':>10} {'now':>10} {'ratio':>6}")
+    for key, seconds in results.items():
+        before = baseline["results"].get(key)
+        if before is None:
+            print(f"{key:<78} {'-':>10} {format_seconds(seconds):>10}    new")
+            continue
+        ratio = seconds / before
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  SLOWER"
+            slower.append(key)
+        elif ratio < 1 / (1 + threshold):
+            flag = "  faster"
+        print(f"{key:<78} {format_seconds(before):>10} {format_seconds(seconds):>10} {ratio:>6.2f}{flag}")
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--grid", choices=sorted(GRIDS), default="quick")
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="diff the results against this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.5,
+                        help="slowdown (as a fraction) that --compare reports as a regression")
+    args = parser.parse_args()
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    save_path = os.path.abspath(args.save) if args.save else None
+
+    results = run_grid(args.grid, args.only)
+    if save_path:
+        with open(save_path, "w") as f:
+            json.dump({
+                "grid": args.grid,
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "results": results,
+            }, f, indent=2)
+            f.write("\n")
+        print(f"Saved {len(results)} measurements to {save_path}")
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        print(f"Baseline: commit {baseline.get('commit')}, Python {baseline.get('python')}, {baseline.get('cpus')} CPUs")
+        slower = compare(results, baseline, args.threshold)
+        if slower:
+            print(f"{len(slower)} measurements slower than the baseline by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
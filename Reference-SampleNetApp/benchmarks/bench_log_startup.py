@@ -0,0 +1,49 @@
+"""Connection log startup cost: counting every line versus reading the file size.
+
+The server used to count the records of connection_log.txt at startup to drive
+record-based rotation. Rotation is now size-based, so start() only stats the file.
+
+    python benchmarks/bench_log_startup.py --records 10000 1000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from bench_utils import format_seconds, quiet, timeit
+from connection_logger import ConnectionLogger
+
+LINE = "[2025-04-22 07:04:01] CONNECTION_ESTABLISHED | Source: Centralized Server | Details: Client connected from ('127.0.0.1', 52144)\n"
+
+
+def count_lines(path):
+    with open(path, 'r') as f:
+        return sum(1 for _ in f)
+
+
+def start_logger(path):
+    logger = ConnectionLogger(path, max_bytes=sys.maxsize)
+    with quiet():
+        logger.start()
+    logger.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, nargs="+", default=[10000, 1000000])
+    args = parser.parse_args()
+
+    print(f"{'records':>10} {'log size':>10} {'count lines':>12} {'start()':>10}")
+    for records in args.records:
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "connection_log.txt")
+            with open(path, 'w') as f:
+                f.writelines(LINE for _ in range(records))
+            size_mb = os.path.getsize(path) / 1e6
+            counting = timeit(lambda: count_lines(path), repeat=3)
+            starting = timeit(lambda: start_logger(path), repeat=3)
+        print(f"{records:>10} {size_mb:>8.1f}MB {format_seconds(counting):>12} {format_seconds(starting):>10}")
+
+
+if __name__ == "__main__":
+    main()
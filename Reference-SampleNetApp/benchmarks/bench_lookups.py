@@ -0,0 +1,87 @@
+"""Reverse-index lookups in server.py versus the previous linear scans.
+
+Builds 100k registered users (plus 10k visitors and 10k logged-in client
+addresses) and times get_username_by_user_id, is_visitor and the GET_PEERS
+client_addr match against the scans they replaced.
+
+    python benchmarks/bench_lookups.py --users 100000
+"""
+import argparse
+
+from bench_utils import format_seconds, load_server, quiet, timeit
+
+
+def linear_get_username_by_user_id(server, user_id):
+    for username, info in server.users.items():
+        if info["user_id"] == user_id:
+            return username
+    for username, vid in server.visitor_ids.items():
+        if vid == user_id:
+            return username
+    return None
+
+
+def linear_is_visitor(server, user_id):
+    return user_id in server.visitor_ids.values()
+
+
+def linear_username_by_client_addr(server, client_addr):
+    for user, info in server.users.items():
+        if "client_addr" in info and info["client_addr"] == client_addr:
+            return user
+    return None
+
+
+def populate(server, num_users, num_visitors, num_online):
+    # Persistence is not what is measured; skip rewriting users.json per register
+    server.save_users = lambda *usernames: None
+    with quiet():
+        for i in range(num_users):
+            server.handle_register(f"REGISTER user{i} pw")
+        for i in range(num_visitors):
+            server.handle_visitor(f"VISITOR guest{i}", None)
+        for i in range(num_online):
+            username = f"user{i * (num_users // num_online)}"
+            client_addr = f"10.0.{i // 256}.{i % 256}:5000"
+            server.users[username]["client_addr"] = client_addr
+            server.client_addr_to_username[client_addr] = username
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--visitors", type=int, default=10000)
+    parser.add_argument("--online", type=int, default=10000)
+    args = parser.parse_args()
+
+    server = load_server()
+    populate(server, args.users, args.visitors, args.online)
+    last_user = str(args.users)  # worst case for the linear scan
+    last_visitor = server.visitor_ids[f"guest{args.visitors - 1}"]
+    last_addr = f"10.0.{(args.online - 1) // 256}.{(args.online - 1) % 256}:5000"
+
+    cases = [
+        ("username of last user",
+         lambda: linear_get_username_by_user_id(server, last_user),
+         lambda: server.get_username_by_user_id(last_user)),
+        ("username of last visitor",
+         lambda: linear_get_username_by_user_id(server, last_visitor),
+         lambda: server.get_username_by_user_id(last_visitor)),
+        ("is_visitor(regular user)",
+         lambda: linear_is_visitor(server, last_user),
+         lambda: server.is_visitor(last_user)),
+        ("user for client_addr",
+         lambda: linear_username_by_client_addr(server, last_addr),
+         lambda: server.client_addr_to_username.get(last_addr)),
+    ]
+    print(f"{args.users} users, {args.visitors} visitors, {args.online} online")
+    print(f"{'lookup':<28} {'linear scan':>12} {'index':>12} {'speedup':>10}")
+    for name, linear, indexed in cases:
+        assert linear() == indexed(), name
+        linear_time = timeit(linear, repeat=3, number=5)
+        indexed_time = timeit(indexed, repeat=3, number=10000)
+        print(f"{name:<28} {format_seconds(linear_time):>12} {format_seconds(indexed_time):>12} {linear_time / indexed_time:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
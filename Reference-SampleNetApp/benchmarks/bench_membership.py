@@ -0,0 +1,67 @@
+"""Channel membership: member lists and full channel scans versus member sets and the user->channels index.
+
+Creates --channels channels of --members members, plus one visitor who is a
+member of a single channel, and times:
+- a permission check for the last member of a big channel (SEND_MESSAGE and
+  START_STREAM do one per command), as a list and as a set;
+- finding the visitor's channels (presence routing, reconnects, disconnect
+  cleanup), by scanning every channel and through user_channels;
+- the visitor's whole disconnect cleanup, drop_user_state().
+
+    python benchmarks/bench_membership.py --channels 10000 --members 50
+"""
+import argparse
+
+from bench_utils import format_seconds, load_server, quiet, timeit
+
+
+def scan_channels(member_lists, user_id):
+    """How memberships were found before: a scan of every channel's member list."""
+    return [channel_id for channel_id, members in member_lists.items() if user_id in members]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--channels", type=int, default=10000)
+    parser.add_argument("--members", type=int, default=50)
+    args = parser.parse_args()
+
+    server = load_server()
+    with quiet():
+        member_ids = []
+        for i in range(args.members):
+            server.handle_register(f"REGISTER user{i} pw")
+            member_ids.append(server.users[f"user{i}"]["user_id"])
+        for _ in range(args.channels):
+            response = server.handle_create_channel(f"CREATE_CHANNEL {member_ids[0]} bench room")
+            server.channels[response.split()[1]]["members"] = dict.fromkeys(member_ids)
+        server.rebuild_membership_index()
+        visitor_id = server.handle_visitor("VISITOR guest", None).split()[2]
+        server.handle_join_channel(f"JOIN_CHANNEL {visitor_id} 1")
+        member_lists = {channel_id: list(channel["members"]) for channel_id, channel in server.channels.items()}
+        big_set = dict.fromkeys(str(i) for i in range(100000))
+        big_list = list(big_set)
+        last = big_list[-1]
+
+        rows = [
+            ("member check, 100k-member list (before)", timeit(lambda: last in big_list, number=100)),
+            ("member check, 100k-member set", timeit(lambda: last in big_set, number=100000)),
+            (f"visitor's channels, scan of {args.channels} channels (before)",
+             timeit(lambda: scan_channels(member_lists, visitor_id))),
+            ("visitor's channels, user_channels", timeit(lambda: list(server.user_channels.get(visitor_id, ())), number=100000)),
+        ]
+
+        best = float("inf")
+        for i in range(5):
+            visitor_id = server.handle_visitor(f"VISITOR guest{i}", None).split()[2]
+            server.handle_join_channel(f"JOIN_CHANNEL {visitor_id} 1")
+            best = min(best, timeit(lambda: server.drop_user_state(f"guest{i}", visitor_id), repeat=1))
+        rows.append(("visitor disconnect cleanup (drop_user_state)", best))
+
+    print(f"{args.channels} channels x {args.members} members")
+    for label, seconds in rows:
+        print(f"{label:>52} {format_seconds(seconds):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Per-message write cost: append-only message log versus rewriting messages.json.
+
+For each history size the channel is pre-filled, then the time to persist one
+more message is measured with both approaches. The full rewrite is skipped for
+sizes above --max-rewrite because it grows linearly.
+
+    python benchmarks/bench_message_log.py --history 1000 100000 1000000
+"""
+import argparse
+import json
+import os
+import tempfile
+
+from bench_utils import format_seconds, timeit
+from message_log import MessageLog
+
+RECORD = {"user_id": "1", "message": "hello from the benchmark", "timestamp": "2025-04-22T07:04:01"}
+
+
+def rewrite_cost(history, path):
+    message_db = {"messages": {"1": [dict(RECORD) for _ in range(history)]}}
+
+    def save():
+        message_db["messages"]["1"].append(dict(RECORD))
+        with open(path, "w") as f:
+            json.dump(message_db, f)
+    return timeit(save, repeat=3, number=1)
+
+
+def append_cost(history, directory):
+    log = MessageLog(directory)
+    # Fill the history through the same code path, in bulk
+    for _ in range(history):
+        log.append("1", RECORD)
+    cost = timeit(lambda: log.append("1", RECORD), repeat=5, number=200)
+    log.close()
+    return cost
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--history", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--max-rewrite", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'history':>10} {'append':>12} {'full rewrite':>14}")
+    for history in args.history:
+        with tempfile.TemporaryDirectory() as workdir:
+            append = append_cost(history, os.path.join(workdir, "message_log"))
+            rewrite = rewrite_cost(history, os.path.join(workdir, "messages.json")) if history <= args.max_rewrite else None
+        rewrite_text = format_seconds(rewrite) if rewrite is not None else "skipped"
+        print(f"{history:>10} {format_seconds(append):>12} {rewrite_text:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Resident memory of message history: everything in RAM versus the tiered store.
+
+Fills a message log with --channels x --messages records, then opens it in a
+fresh process twice: once replaying every record into memory (what the server
+did before) and once through TieredMessageStore, which keeps only the newest
+MESSAGE_HOT_SIZE records per channel. It also times a cold page read and a
+cached page read.  Linux only (reads /proc/self/status).
+
+    python benchmarks/bench_message_store.py --channels 100 --messages 10000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_utils import format_seconds
+from message_log import MessageLog
+from message_store import TieredMessageStore
+
+RECORD = {"user_id": "1", "message": "hello from the benchmark, a message of typical length", "timestamp": "2025-04-22T07:04:01"}
+
+
+def rss_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+def measure(directory, mode):
+    """Runs in a child process; prints a JSON line with the RSS growth and page timings."""
+    before = rss_kb()
+    log = MessageLog(directory)
+    result = {}
+    if mode == "full":
+        history = log.load_all()
+        result["records"] = sum(len(records) for records in history.values())
+    else:
+        store = TieredMessageStore(log)
+        store.load()
+        channel_id = store.channel_ids()[0]
+        start = time.perf_counter()
+        store.page(channel_id, before=store.count(channel_id) // 2)
+        result["cold_page"] = time.perf_counter() - start
+        start = time.perf_counter()
+        store.page(channel_id, before=store.count(channel_id) // 2)
+        result["cached_page"] = time.perf_counter() - start
+        result["records"] = store.stats()["hot_records"]
+    result["rss_kb"] = rss_kb() - before
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--channels", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=10000, help="messages per channel")
+    parser.add_argument("--measure", choices=["full", "tiered"], help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        measure(args.dir, args.measure)
+        return
+
+    with tempfile.TemporaryDirectory() as workdir:
+        directory = os.path.join(workdir, "message_log")
+        log = MessageLog(directory)
+        for channel in range(args.channels):
+            for _ in range(args.messages):
+                log.append(str(channel), RECORD)
+        log.close()
+
+        print(f"{args.channels} channels x {args.messages} messages")
+        print(f"{'store':>8} {'records in RAM':>15} {'RSS growth':>11} {'cold page':>10} {'cached page':>12}")
+        for mode in ("full", "tiered"):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), "--measure", mode, "--dir", directory],
+                                    capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            cold = format_seconds(result["cold_page"]) if "cold_page" in result else "-"
+            cached = format_seconds(result["cached_page"]) if "cached_page" in result else "-"
+            print(f"{mode:>8} {result['records']:>15} {result['rss_kb'] / 1024:>9.1f}MB {cold:>10} {cached:>12}")
+
+
+if __name__ == "__main__":
+    main()
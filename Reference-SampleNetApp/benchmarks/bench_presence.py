@@ -0,0 +1,69 @@
+"""Presence fan-out: STATUS to every client, only to clients sharing a channel, and coalesced.
+
+Logs --users users in and spreads them over channels of --channel-size members,
+then has every user change status --changes times in a burst (a login storm).
+Sessions are in-process stand-ins that only count frames, so the figures are
+server-side frame counts and CPU time. The routed run sends every change at
+once (window 0); the coalesced run flushes the aggregator once at the end, as
+if the burst fit in one PRESENCE_WINDOW.
+
+    python benchmarks/bench_presence.py --users 1000 --channel-size 10 --changes 10
+"""
+import argparse
+import time
+
+from bench_utils import StubSession, format_seconds, load_server, quiet
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--channel-size", type=int, default=10)
+    parser.add_argument("--changes", type=int, default=10, help="status changes per user in the burst")
+    args = parser.parse_args()
+
+    server = load_server()
+    with quiet():
+        sessions = []
+        for i in range(args.users):
+            server.handle_register(f"REGISTER user{i} pw")
+            sessions.append(StubSession(f"user{i}", str(i + 1)))
+        for start in range(0, args.users, args.channel_size):
+            members = [session.user_id for session in sessions[start:start + args.channel_size]]
+            response = server.handle_create_channel(f"CREATE_CHANNEL {members[0]} bench room")
+            server.channels[response.split()[1]]["members"] = dict.fromkeys(members)
+        server.rebuild_membership_index()
+        for session in sessions:
+            server.connected_clients.append(session)
+            server.index_session(session)
+
+        def status(change):
+            return "Invisible" if change % 2 == 0 else "Online"
+
+        rows = []
+        for label, window, send in (
+                ("broadcast to all (before)", 0,
+                 lambda s, change: server.broadcast(f"STATUS {s.user_id} {status(change)}", exclude_conn=s.conn, presence=True)),
+                ("shared channels only", 0,
+                 lambda s, change: server.broadcast_presence(s.user_id, status(change), exclude_conn=s.conn)),
+                ("shared channels, coalesced", 3600,
+                 lambda s, change: server.broadcast_presence(s.user_id, status(change), exclude_conn=s.conn))):
+            server.presence_aggregator.delay = window
+            for session in sessions:
+                session.frames = 0
+            start = time.perf_counter()
+            for change in range(args.changes):
+                for session in sessions:
+                    send(session, change)
+            server.presence_aggregator.flush()
+            elapsed = time.perf_counter() - start
+            rows.append((label, sum(session.frames for session in sessions), elapsed / (args.users * args.changes)))
+
+    print(f"{args.users} online users, channels of {args.channel_size}, {args.changes} status changes each")
+    print(f"{'fan-out':>28} {'frames':>9} {'per change':>11}")
+    for label, frames, per_change in rows:
+        print(f"{label:>28} {frames:>9} {format_seconds(per_change):>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Reconnect cost: logging in again and resynchronizing versus RESUME.
+
+Starts a threaded server with --channels channels of --members members, logs a
+user in who is a member of all of them, drops their connection, has another
+member send --missed messages, and reconnects twice: once the way a client
+without a token must (LOGIN, GET_CHANNELS, GET_USERNAMES/GET_STATUSES for
+every member and the newest history page of each channel), and once with
+RESUME. Reports round trips, bytes received and wall time over loopback.
+
+    python benchmarks/bench_resume.py --channels 20 --members 50 --missed 10
+"""
+import argparse
+import socket
+import tempfile
+import time
+
+from bench_server_modes import free_port, start_server
+from bench_utils import format_seconds
+from framing import FramedConnection
+
+
+def connect(port):
+    return FramedConnection(socket.create_connection(("127.0.0.1", port)))
+
+
+def member_ids(channel_line):
+    """User IDs in a CHANNEL <id> <host> <count> <name> <nv> <visitors...> <nr> <regulars...> line."""
+    fields = channel_line.split()
+    num_visitors = int(fields[5])
+    return [fields[2]] + fields[6:6 + num_visitors] + fields[7 + num_visitors:]
+
+
+def request(conn, command, received):
+    conn.send_command(command)
+    frame = conn.recv_frame(timeout=5)
+    received[0] += len(frame.encode()) + 4
+    return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--channels", type=int, default=20)
+    parser.add_argument("--members", type=int, default=50)
+    parser.add_argument("--missed", type=int, default=10, help="messages sent while disconnected")
+    args = parser.parse_args()
+
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        proc = start_server("threaded", port, workdir)
+        try:
+            admin = connect(port)
+            for i in range(args.members):
+                request(admin, f"REGISTER user{i} pw", [0])
+            writer = connect(port)
+            request(writer, "LOGIN user0 pw", [0])
+            for c in range(args.channels):
+                request(writer, f"CREATE_CHANNEL 1 room{c}", [0])
+            for i in range(1, args.members):
+                member = connect(port)
+                request(member, f"LOGIN user{i} pw", [0])
+                member.send_commands([f"JOIN_CHANNEL {i + 1} {c + 1}" for c in range(args.channels)])
+                time.sleep(0.05)
+                if i != 1:
+                    member.send_command("LOGOUT")
+                    member.close()
+            for c in range(args.channels):
+                for m in range(50):
+                    request(writer, f"SEND_MESSAGE 1 {c + 1} history message {m}", [0])
+
+            rows = []
+            for label in ("LOGIN + full resync (before)", "RESUME"):
+                user = connect(port)
+                token = request(user, "LOGIN user1 pw", [0]).split()[2]
+                user.setblocking(False)
+                time.sleep(0.3)
+                last_seq = 0
+                for frame in iter(lambda: user.recv_frame(timeout=0.3), None):
+                    if frame.startswith("EVENT "):
+                        last_seq = int(frame.split()[1])
+                user.close()
+                time.sleep(0.3)
+                for m in range(args.missed):
+                    request(writer, f"SEND_MESSAGE 1 1 sent while away {m}", [0])
+                time.sleep(0.3)
+
+                received = [0]
+                trips = 0
+                start = time.perf_counter()
+                conn = connect(port)
+                if label == "RESUME":
+                    conn.send_command(f"RESUME {token} {last_seq}")
+                    trips += 1
+                    while True:
+                        frame = conn.recv_frame(timeout=5)
+                        received[0] += len(frame.encode()) + 4
+                        if frame.startswith("RESUMED") or frame.startswith("RESUME_FAILED"):
+                            break
+                else:
+                    request(conn, "LOGIN user1 pw", received)
+                    channels = request(conn, "GET_CHANNELS", received)
+                    ids = sorted({uid for line in channels.splitlines()[1:] for uid in member_ids(line)})
+                    conn.send_commands([f"GET_USERNAMES {' '.join(ids)}", f"GET_STATUSES {' '.join(ids)}"])
+                    for _ in range(2):
+                        received[0] += len(conn.recv_frame(timeout=5).encode()) + 4
+                    conn.send_commands([f"GET_MESSAGES_PAGE {c + 1}" for c in range(args.channels)])
+                    for _ in range(args.channels):
+                        received[0] += len(conn.recv_frame(timeout=5).encode()) + 4
+                    trips += 4
+                elapsed = time.perf_counter() - start
+                rows.append((label, trips, received[0], elapsed))
+                conn.send_command("LOGOUT")
+                conn.close()
+                time.sleep(0.3)
+        finally:
+            proc.kill()
+            proc.wait()
+
+    print(f"{args.channels} channels x {args.members} members, {args.missed} messages missed")
+    print(f"{'reconnect':>30} {'round trips':>12} {'bytes':>9} {'time':>10}")
+    for label, trips, size, elapsed in rows:
+        print(f"{label:>30} {trips:>12} {size:>9} {format_seconds(elapsed):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Compare the threaded and event-loop server modes under many idle clients.
+
+For every mode the server is started in a scratch directory, N idle control
+connections are opened (each one sends a single GET_STATUS so it is really
+being served), and the server's thread count and resident memory are read
+from /proc.  Linux only.
+
+    python benchmarks/bench_server_modes.py --clients 100 1000 3000
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_SCRIPT = os.path.join(SERVER_DIR, "server.py")
+sys.path.insert(0, SERVER_DIR)
+
+from framing import encode_frame
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+def proc_status(pid):
+    """Return (threads, rss_kb) of a process from /proc/<pid>/status."""
+    threads, rss_kb = 0, 0
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("Threads:"):
+                threads = int(line.split()[1])
+            elif line.startswith("VmRSS:"):
+                rss_kb = int(line.split()[1])
+    return threads, rss_kb
+
+
+def start_server(mode, port, workdir, *extra_args):
+    proc = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, "--mode", mode, "--host", "127.0.0.1", "--port", str(port), *extra_args],
+        cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"server in {mode} mode did not start")
+
+
+def measure(mode, num_clients):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        proc = start_server(mode, port, workdir)
+        clients = []
+        try:
+            time.sleep(0.5)
+            base_threads, base_rss = proc_status(proc.pid)
+            for _ in range(num_clients):
+                c = socket.create_connection(("127.0.0.1", port))
+                c.sendall(encode_frame("GET_STATUS 1"))
+                c.recv(1024)
+                clients.append(c)
+            time.sleep(0.5)
+            threads, rss = proc_status(proc.pid)
+            return {
+                "mode": mode,
+                "clients": num_clients,
+                "threads": threads,
+                "rss_mb": rss / 1024,
+                "rss_per_client_kb": (rss - base_rss) / max(num_clients, 1),
+                "idle_threads": base_threads,
+            }
+        finally:
+            for c in clients:
+                c.close()
+            proc.kill()
+            proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[100, 1000, 3000])
+    parser.add_argument("--modes", nargs="+", default=["threaded", "eventloop"])
+    args = parser.parse_args()
+
+    print(f"{'mode':<10} {'clients':>8} {'threads':>8} {'RSS MB':>8} {'KB/client':>10}")
+    for num_clients in args.clients:
+        for mode in args.modes:
+            r = measure(mode, num_clients)
+            print(f"{r['mode']:<10} {r['clients']:>8} {r['threads']:>8} {r['rss_mb']:>8.1f} {r['rss_per_client_kb']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
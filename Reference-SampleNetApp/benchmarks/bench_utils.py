@@ -0,0 +1,88 @@
+"""Helpers shared by the benchmark scripts.
+
+server.py loads its JSON databases and opens the connection log in the current
+directory at import time, so benchmarks import it from a scratch directory and
+silence its per-command prints while measuring.
+"""
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SERVER_DIR not in sys.path:
+    sys.path.insert(0, SERVER_DIR)
+
+
+class StubSession:
+    """In-process stand-in for a logged-in ClientSession: counts the frames pushed to it.
+
+    With record_messages it also keeps the text of every MESSAGE event, per channel,
+    in received (decoding costs time, so benchmarks that only count leave it off).
+    """
+    def __init__(self, username, user_id, record_messages=False):
+        self.username = username
+        self.user_id = user_id
+        self.conn = object()
+        self.addr = ("127.0.0.1", 0)
+        self.resume = None
+        self.streams = set()
+        self.closed = False
+        self.detached = False
+        self.frames = 0
+        self.record_messages = record_messages
+        self.received = {}  # {channel_id: [message text]}
+
+    def send_event(self, seq, frame, presence=False):
+        return self.send_frame(frame, presence)
+
+    def send_frame(self, frame, presence=False):
+        self.frames += 1
+        if self.record_messages:
+            for line in frame[4:].decode().split("\n"):
+                if line.startswith("MESSAGE "):
+                    channel_id = line.split()[1]
+                    self.received.setdefault(channel_id, []).append(line.split(" | ", 1)[1])
+        return True
+
+
+def load_server(setup=None):
+    """Import server.py with a scratch directory as its working directory.
+
+    setup(workdir), if given, runs before the import, e.g. to write the
+    users.json and channels.json the server then loads.
+    """
+    workdir = tempfile.mkdtemp(prefix="segment_chat_bench_")
+    os.chdir(workdir)
+    if setup is not None:
+        setup(workdir)
+    with quiet():
+        import server
+    return server
+
+
+@contextlib.contextmanager
+def quiet():
+    """Discard everything printed inside the block."""
+    with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+        yield
+
+
+def timeit(func, repeat=5, number=1):
+    """Best-of-repeat seconds per call of func()."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def format_seconds(seconds):
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.2f} us"
@@ -0,0 +1,125 @@
+"""Message throughput of the server with 1..N worker processes (--workers).
+
+For every worker count a server is started in threaded mode, --channels
+channels are created and --clients clients, spread over several load generator
+processes, log in, join one channel each and send messages back to back for
+--seconds seconds, each waiting for MESSAGE_SENT before sending the next.
+Reports messages/sec accepted and MESSAGE events/sec delivered to the clients.
+The load generators run on the same machine, so on few cores they compete with
+the workers; the CPU count is printed with the results.
+
+    python benchmarks/bench_workers.py --workers 1 2 4 --clients 40 --channels 4 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+
+from bench_server_modes import free_port, start_server
+from framing import FramedConnection
+
+
+def command(conn, text, counts=None):
+    """Send one command and return its response, counting MESSAGE events received on the way."""
+    conn.send_command(text)
+    while True:
+        frame = conn.recv_frame()
+        if not frame.startswith("EVENT "):
+            return frame
+        if counts is not None and "\nMESSAGE " in frame:
+            counts["delivered"] += 1
+
+
+def run_client(port, index, channel_id, barrier, stop_at, counts):
+    conn = FramedConnection(socket.create_connection(("127.0.0.1", port)))
+    command(conn, f"REGISTER load{index} pw")
+    user_id = command(conn, f"LOGIN load{index} pw").split()[1]
+    command(conn, f"JOIN_CHANNEL {user_id} {channel_id}")
+    barrier.wait()
+    while time.time() < stop_at.value:
+        if command(conn, f"SEND_MESSAGE {user_id} {channel_id} load message", counts) == "MESSAGE_SENT":
+            counts["sent"] += 1
+    # Deliveries of the last messages still in flight
+    conn.sock.settimeout(1.0)
+    try:
+        while True:
+            if "\nMESSAGE " in conn.recv_frame():
+                counts["delivered"] += 1
+    except OSError:
+        pass
+    conn.close()
+
+
+def load_process(port, indexes, channels, barrier, stop_at, results):
+    threads = []
+    counts = [{"sent": 0, "delivered": 0} for _ in indexes]
+    for index, client_counts in zip(indexes, counts):
+        thread = threading.Thread(target=run_client,
+                                  args=(port, index, index % channels + 1, barrier, stop_at, client_counts))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    results.put((sum(c["sent"] for c in counts), sum(c["delivered"] for c in counts)))
+
+
+def measure(workers, args):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as workdir:
+        proc = start_server("threaded", port, workdir, "--workers", str(workers))
+        try:
+            time.sleep(1.0)  # let every worker bind the port
+            host = FramedConnection(socket.create_connection(("127.0.0.1", port)))
+            command(host, "REGISTER host pw")
+            host_id = command(host, "LOGIN host pw").split()[1]
+            for c in range(args.channels):
+                command(host, f"CREATE_CHANNEL {host_id} room{c}")
+            barrier = multiprocessing.Barrier(args.clients + 1)
+            stop_at = multiprocessing.Value("d", float("inf"))
+            results = multiprocessing.Queue()
+            procs = [multiprocessing.Process(target=load_process,
+                                             args=(port, range(p, args.clients, args.procs), args.channels,
+                                                   barrier, stop_at, results))
+                     for p in range(args.procs)]
+            for p in procs:
+                p.start()
+            barrier.wait()
+            start = time.time()
+            stop_at.value = start + args.seconds
+            sent = delivered = 0
+            for _ in procs:
+                s, d = results.get()
+                sent += s
+                delivered += d
+            for p in procs:
+                p.join()
+            host.close()
+        finally:
+            proc.terminate()
+            proc.wait()
+    return sent / args.seconds, delivered / args.seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=40)
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--procs", type=int, default=4, help="load generator processes")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients in {args.channels} channels, {args.seconds:g} s per run, {os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'messages/s':>11} {'deliveries/s':>13} {'speedup':>8}")
+    base = None
+    for workers in args.workers:
+        sent, delivered = measure(workers, args)
+        base = base or sent
+        print(f"{workers:>8} {sent:>11.0f} {delivered:>13.0f} {sent / base:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
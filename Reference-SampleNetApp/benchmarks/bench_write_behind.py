@@ -0,0 +1,55 @@
+"""Disk writes and request-path cost of a login burst: write-behind versus write-through.
+
+Registers --users accounts, then logs all of them in through handle_login and
+counts how many times users.json is actually written, first with
+--max-staleness 0 (every save writes the file, as before) and then with the
+write-behind window.
+
+    python benchmarks/bench_write_behind.py --users 1000 --max-staleness 1.0
+"""
+import argparse
+import time
+
+from bench_utils import format_seconds, load_server, quiet
+
+
+def login_burst(server, names, max_staleness):
+    writer = server.users_writer
+    writer.delay = max_staleness
+    for name in names:
+        server.users[name]["status"] = "Offline"
+    server.flush_state()
+    flushes_before = writer.flushes
+    with quiet():
+        start = time.perf_counter()
+        for name in names:
+            server.handle_login(f"LOGIN {name} pw", None)
+        elapsed = time.perf_counter() - start
+        # Let the flusher drain the burst before counting writes
+        time.sleep(max_staleness + 0.5)
+        server.flush_state()
+    return elapsed, writer.flushes - flushes_before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--max-staleness", type=float, default=1.0)
+    args = parser.parse_args()
+
+    server = load_server()
+    names = [f"user{i}" for i in range(args.users)]
+    with quiet():
+        for name in names:
+            server.handle_register(f"REGISTER {name} pw")
+        server.flush_state()
+
+    print(f"{args.users} logins")
+    print(f"{'mode':>14} {'burst time':>12} {'per login':>12} {'file writes':>12}")
+    for label, staleness in (("write-through", 0), (f"behind {args.max_staleness:g}s", args.max_staleness)):
+        elapsed, writes = login_burst(server, names, staleness)
+        print(f"{label:>14} {format_seconds(elapsed):>12} {format_seconds(elapsed / args.users):>12} {writes:>12}")
+
+
+if __name__ == "__main__":
+    main()
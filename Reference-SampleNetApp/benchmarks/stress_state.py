@@ -0,0 +1,164 @@
+"""Stress test of the shared server state: many threads joining, leaving and sending at once.
+
+Loads server.py in-process with --users users in --channels channels, then runs
+--threads threads for --seconds seconds. Each thread owns a slice of the users
+and, through process_command, makes them join and leave random channels, send
+messages, read GET_CHANNELS and drop and re-open their session. Sessions are
+in-process stand-ins that record the MESSAGE events pushed to them.
+
+Afterwards it checks that:
+- no handler raised;
+- every channel still has its host, and user_channels matches the member sets;
+- channel_sessions holds exactly the live sessions of each channel's members;
+- every channel's message seqs are contiguous and match the MESSAGE_SENT count;
+- every session saw each channel's messages in seq order;
+- GET_CHANNELS agrees with the final state.
+
+It runs once with shared channels (every thread uses every channel) and once
+with disjoint channels (each thread keeps to its own), and prints throughput
+and how often a channel or user stripe was contended. Exits non-zero if a
+check fails.
+
+    python benchmarks/stress_state.py --threads 16 --users 160 --channels 16 --seconds 5
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+
+from bench_utils import StubSession, load_server, quiet
+from state_locks import StripedLock
+
+
+def connect(server, username, user_id):
+    session = StubSession(username, user_id, record_messages=True)
+    server.add_connected_client(session)
+    server.index_session(session)
+    return session
+
+
+def disconnect(server, session):
+    session.closed = True
+    server.unindex_session(session)
+    server.remove_connected_client(session)
+
+
+def run(server, args, disjoint):
+    server.channel_locks = StripedLock("channels", args.stripes)
+    server.user_locks = StripedLock("users", args.stripes)
+    prefix = "d" if disjoint else "s"
+    host = f"{prefix}host"
+    server.handle_register(f"REGISTER {host} pw")
+    host_id = server.users[host]["user_id"]
+    channel_ids = [server.handle_create_channel(f"CREATE_CHANNEL {host_id} {prefix}room{c}").split()[1]
+                   for c in range(args.channels)]
+    user_ids = []
+    for i in range(args.users):
+        server.handle_register(f"REGISTER {prefix}user{i} pw")
+        user_ids.append(server.users[f"{prefix}user{i}"]["user_id"])
+    sessions = {user_id: connect(server, f"{prefix}user{i}", user_id) for i, user_id in enumerate(user_ids)}
+    all_sessions = list(sessions.values())
+    sent = {channel_id: 0 for channel_id in channel_ids}
+    sent_lock = threading.Lock()
+    errors = []
+    ops = [0] * args.threads
+    stop_at = time.perf_counter() + args.seconds
+
+    def worker(index):
+        rng = random.Random(index)
+        mine = user_ids[index::args.threads]
+        choices = channel_ids[index::args.threads] if disjoint else channel_ids
+        n = 0
+        while time.perf_counter() < stop_at:
+            user_id = rng.choice(mine)
+            channel_id = rng.choice(choices)
+            op = rng.random()
+            try:
+                if op < 0.25:
+                    server.process_command(f"JOIN_CHANNEL {user_id} {channel_id}", None, None)
+                elif op < 0.4:
+                    server.process_command(f"LEAVE_CHANNEL {user_id} {channel_id}", None, None)
+                elif op < 0.85:
+                    n += 1
+                    if server.process_command(f"SEND_MESSAGE {user_id} {channel_id} t{index}-{n}", None, None) == "MESSAGE_SENT":
+                        with sent_lock:
+                            sent[channel_id] += 1
+                elif op < 0.95:
+                    server.process_command("GET_CHANNELS", None, None)
+                else:
+                    disconnect(server, sessions[user_id])
+                    sessions[user_id] = connect(server, sessions[user_id].username, user_id)
+                    all_sessions.append(sessions[user_id])
+            except Exception as e:
+                errors.append(f"{type(e).__name__}: {e}")
+            ops[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    snapshot = server.process_command("GET_CHANNELS", None, None)
+
+    failures = list(errors[:5])
+    live = set(sessions.values())
+    for channel_id in channel_ids:
+        members = server.channels[channel_id]["members"]
+        if host_id not in members:
+            failures.append(f"channel {channel_id}: host is no longer a member")
+        if {user_id for user_id in user_ids if channel_id in server.user_channels.get(user_id, ())} != set(members) - {host_id}:
+            failures.append(f"channel {channel_id}: user_channels out of step with members")
+        expected = {session for session in live if session.user_id in members}
+        if set(server.channel_sessions.get(channel_id, ())) != expected:
+            failures.append(f"channel {channel_id}: channel_sessions out of step with members")
+        count = server.message_store.count(channel_id)
+        records = server.message_store.read(channel_id, 0, count)
+        if [r["seq"] for r in records] != list(range(count)) or count != sent[channel_id]:
+            failures.append(f"channel {channel_id}: {count} messages stored, seqs not contiguous or {sent[channel_id]} sent")
+        position = {record["message"]: i for i, record in enumerate(records)}
+        for session in all_sessions:
+            seen = [position[text] for text in session.received.get(channel_id, ())]
+            if seen != sorted(seen):
+                failures.append(f"channel {channel_id}: {session.username} got messages out of seq order")
+                break
+        if server.format_channel(channel_id, server.channels[channel_id]) not in snapshot:
+            failures.append(f"channel {channel_id}: GET_CHANNELS is stale")
+    for session in live:
+        disconnect(server, session)
+    return sum(ops) / elapsed, server.channel_locks.stats(), server.user_locks.stats(), failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--users", type=int, default=160)
+    parser.add_argument("--channels", type=int, default=16)
+    parser.add_argument("--stripes", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    server = load_server()
+    server.presence_aggregator.delay = 0
+    server.users_writer.delay = server.channels_writer.delay = 3600
+    sys.setswitchinterval(1e-5)  # switch threads often, inside critical sections too
+
+    print(f"{args.threads} threads, {args.users} users, {args.channels} channels, {args.stripes} stripes, {args.seconds:g} s")
+    print(f"{'channels':>9} {'ops/s':>8} {'channel stripe waits':>21} {'user stripe waits':>18} {'checks':>7}")
+    failed = False
+    for disjoint in (False, True):
+        with quiet():
+            rate, channel_stats, user_stats, failures = run(server, args, disjoint)
+        print(f"{'disjoint' if disjoint else 'shared':>9} {rate:>8.0f} "
+              f"{channel_stats['contended']:>9} / {channel_stats['acquired']:<9} "
+              f"{user_stats['contended']:>7} / {user_stats['acquired']:<8} {'ok' if not failures else 'FAILED':>7}")
+        for failure in failures:
+            print(f"  {failure}")
+        failed = failed or bool(failures)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
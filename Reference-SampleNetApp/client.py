@@ -2,25 +2,29 @@ import socket
 import argparse
 from multiprocessing import Process
 from threading import Thread
-from login_ui import LoginUI
-from after_login_ui import AfterLoginUI
+from framing import FramedConnection
 import time
 import sys
 
 def new_connection(tid, host, port):
+    # The UIs need Tkinter and OpenCV; a headless --scenario run does not
+    from login_ui import LoginUI
+    from after_login_ui import AfterLoginUI
+
     print(f'Process ID {tid} connecting to {host}:{port}')
     client_socket = socket.socket()
     try:
         client_socket.connect((host, port))
+        conn = FramedConnection(client_socket)
 
-        def after_login(mode, identifier, user_id):
-            # Launch AfterLoginUI with the provided user_id
+        def after_login(mode, identifier, user_id, session_token=None):
+            # Launch AfterLoginUI with the provided user_id; the token lets it RESUME after a dropped connection
             if user_id:
-                AfterLoginUI(mode, identifier, user_id, client_socket)
+                AfterLoginUI(mode, identifier, user_id, conn, session_token=session_token)
             else:
                 print(f"Failed to obtain user_id for {identifier}. Cannot launch AfterLoginUI.")
 
-        login_ui = LoginUI(client_socket, after_login)
+        login_ui = LoginUI(conn, after_login)
         login_ui.root.mainloop()
 
     except Exception as e:
@@ -49,8 +53,18 @@ if __name__ == "__main__":
     parser.add_argument('--server-ip', help='IP address of the server')
     parser.add_argument('--server-port', type=int, help='Port number of the server')
     parser.add_argument('--client-num', type=int, help='Number of client processes to spawn')
+    parser.add_argument('--scenario',
+                        help='Run a load scenario file (JSON) with headless simulated users instead of the UI')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='With --scenario: load generator processes to spread the simulated users over')
+    parser.add_argument('--seed', type=int, default=1, help='With --scenario: random seed for the simulated users')
+    parser.add_argument('--report', help='With --scenario: also write the results as JSON to this file')
     args = parser.parse_args()
     host = args.server_ip
     port = args.server_port
     cnum = args.client_num
-    connect_server(cnum, host, port)
\ No newline at end of file
+    if args.scenario:
+        from load_client import run_scenario
+        run_scenario(host, port, args.scenario, args.processes, args.seed, args.report)
+    else:
+        connect_server(cnum, host, port)
\ No newline at end of file
@@ -0,0 +1,92 @@
+import bisect
+import threading
+import time
+
+# Histogram buckets grow geometrically by 2^(1/4) (~19% wide) from 1 microsecond to
+# about 2 minutes, so percentiles are accurate to one bucket with constant memory.
+BUCKET_BOUNDS = [1e-6 * 2 ** (i / 4) for i in range(110)]
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (in seconds) for one command verb."""
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, elapsed, failed=False):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, elapsed)] += 1
+        self.count += 1
+        self.total += elapsed
+        if failed:
+            self.errors += 1
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def merge(self, other):
+        """Add the samples of another histogram (e.g. from another process) to this one."""
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.errors += other.errors
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile (capped at the max seen)."""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                bound = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class CommandRegistry:
+    """Maps command verbs to handlers and times every call per verb."""
+    def __init__(self):
+        self.handlers = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def register(self, verb, handler):
+        """Register handler(data, addr, conn) for an exact verb."""
+        self.handlers[verb] = handler
+        self.histograms[verb] = LatencyHistogram()
+
+    def dispatch(self, verb, data, addr, conn):
+        """Run the handler for verb; returns None if the verb is unknown."""
+        handler = self.handlers.get(verb)
+        if handler is None:
+            return None
+        failed = True
+        start = time.perf_counter()
+        try:
+            response = handler(data, addr, conn)
+            failed = False
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.histograms[verb].record(elapsed, failed)
+
+    def stats(self):
+        """Return {verb: summary} for every verb that has been called at least once."""
+        with self.lock:
+            return {verb: histogram.summary() for verb, histogram in self.histograms.items() if histogram.count}
@@ -0,0 +1,157 @@
+import gzip
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+
+_STOP = object()
+
+
+class ConnectionLogger:
+    """Background writer for connection_log.txt.
+
+    log() only puts a tuple on a queue; a dedicated thread formats the records,
+    writes them through one buffered file handle, flushes every flush_records
+    records or flush_interval seconds (whichever comes first) and rotates the
+    file once it reaches max_bytes. Rotation state is just the file offset, so
+    starting up costs the same whatever the log size. Rotated files are gzipped
+    by a background thread. With echo set the writer also prints each line.
+    """
+    def __init__(self, path, max_bytes, flush_interval=0.5, flush_records=256, echo=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.flush_records = flush_records
+        self.echo = echo
+        self.queue = queue.SimpleQueue()
+        self.file = None
+        self.size = 0  # bytes in the current file
+        self.thread = None
+        self.written = 0
+        self.rotations = 0
+
+    def start(self):
+        """Open the file at its end and start the writer thread."""
+        if os.path.exists(self.path):
+            self.size = os.path.getsize(self.path)
+            print(f"[Server] Log file {self.path} exists ({self.size} bytes).")
+        else:
+            print(f"[Server] Creating new log file {self.path}.")
+            self.size = 0
+        # Rotated files left uncompressed by an earlier run that stopped mid-compression
+        leftovers = self.rotated_files()
+        if leftovers:
+            self._compress_in_background(leftovers)
+        self.file = open(self.path, 'a', buffering=64 * 1024)
+        self.thread = threading.Thread(target=self._run, name="connection-logger", daemon=True)
+        self.thread.start()
+
+    def rotated_files(self):
+        """Uncompressed rotated logs (<base>_<timestamp><ext>) next to the live log."""
+        directory = os.path.dirname(self.path) or "."
+        base, ext = os.path.splitext(os.path.basename(self.path))
+        return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                      if name.startswith(f"{base}_") and name.endswith(ext))
+
+    def log(self, event_type, source, details):
+        """Queue one event; formatting and disk I/O happen on the writer thread."""
+        self.queue.put((time.time(), event_type, source, details))
+
+    def flush(self, timeout=None):
+        """Block until everything queued so far is written to the file."""
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def close(self):
+        if self.thread is None:
+            return
+        self.queue.put(_STOP)
+        self.thread.join()
+        self.thread = None
+
+    def _run(self):
+        unflushed = 0
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if item is not None and item is not _STOP and not isinstance(item, threading.Event):
+                self._write(item)
+                unflushed += 1
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if unflushed < self.flush_records:
+                    continue
+            self._flush_file()
+            unflushed = 0
+            deadline = None
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                self.file.close()
+                return
+
+    def _write(self, item):
+        created, event_type, source, details = item
+        timestamp = datetime.fromtimestamp(created, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        log_entry = f"[{timestamp}] {event_type} | Source: {source} | Details: {details}\n"
+        if self.size >= self.max_bytes:
+            self._rotate()
+        try:
+            self.file.write(log_entry)
+            self.size += len(log_entry.encode())
+            self.written += 1
+        except Exception as e:
+            print(f"[Server] Error writing to log file {self.path}: {e}")
+        if self.echo:
+            print(f"[Server] Logged: {log_entry.strip()}")
+
+    def _flush_file(self):
+        try:
+            self.file.flush()
+        except Exception as e:
+            print(f"[Server] Error flushing log file {self.path}: {e}")
+
+    def _rotate(self):
+        """Rename the full log to connection_log_<timestamp>.txt, start a new one and gzip the old one."""
+        print(f"[Server] Log file {self.path} has reached {self.size} bytes. Rotating log file.")
+        self.file.close()
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
+        base, ext = os.path.splitext(self.path)
+        backup_file = f"{base}_{timestamp}{ext}"
+        suffix = 1
+        while os.path.exists(backup_file) or os.path.exists(backup_file + ".gz"):  # several rotations within one second
+            backup_file = f"{base}_{timestamp}_{suffix}{ext}"
+            suffix += 1
+        try:
+            os.rename(self.path, backup_file)
+            print(f"[Server] Backed up log file to {backup_file}.")
+            self._compress_in_background([backup_file])
+        except Exception as e:
+            print(f"[Server] Error backing up log file to {backup_file}: {e}.")
+        self.file = open(self.path, 'a', buffering=64 * 1024)
+        self.size = 0
+        self.rotations += 1
+
+    def _compress_in_background(self, paths):
+        thread = threading.Thread(target=self._compress, args=(paths,), name="connection-log-gzip", daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def _compress(paths):
+        for path in paths:
+            tmp = f"{path}.gz.tmp"
+            try:
+                with open(path, 'rb') as src, gzip.open(tmp, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                os.replace(tmp, f"{path}.gz")
+                os.remove(path)
+            except Exception as e:
+                print(f"[Server] Error compressing rotated log {path}: {e}")
@@ -0,0 +1,81 @@
+import threading
+import time
+
+RETRY_DELAY = 1.0  # seconds to back off before retrying a failed write
+
+
+
+class DelayedFlush:
+    """Base for buffers that a background thread flushes once the oldest pending change is delay seconds old.
+
+    Subclasses record a change under self.cond and call self.schedule(); take()
+    detaches the pending batch (called with self.cond held) and write(batch) hands
+    it on, returning False if it failed (after putting the batch back). flush()
+    runs them one at a time, so batches go out in order, and a failed write is
+    retried by the background thread no sooner than retry_delay seconds later.
+    With a delay of 0, schedule() tells the caller to flush() synchronously
+    instead.
+    """
+    def __init__(self, name, delay):
+        self.name = name
+        self.delay = delay
+        self.cond = threading.Condition()
+        self.pending_since = None
+        self.thread = None
+        self.flush_lock = threading.Lock()  # one flush at a time (flusher thread vs shutdown)
+        self.flushes = 0
+        self.retry_delay = RETRY_DELAY
+        self.retry_at = None  # monotonic time before which a failed write is not retried
+
+    def schedule(self):
+        """Start the delay for a new change; call with self.cond held. Returns True if the caller should flush() now."""
+        if self.pending_since is None:
+            self.pending_since = time.monotonic()
+            self.cond.notify()
+        if self.delay <= 0:
+            return True
+        self._start_thread()
+        return False
+
+    def _start_thread(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name=f"flush-{self.name}", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.pending_since is None:
+                    self.cond.wait()
+                due = self.pending_since + self.delay
+                if self.retry_at is not None:
+                    due = max(due, self.retry_at)
+                delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self.flush()
+
+    def flush(self):
+        """Hand pending changes to write() now; returns True if something was written."""
+        with self.flush_lock:
+            with self.cond:
+                if self.pending_since is None:
+                    return False
+                self.pending_since = None
+                batch = self.take()
+            if not self.write(batch):
+                # back off, even with a delay of 0 where no later change may come to retry it
+                with self.cond:
+                    self.retry_at = time.monotonic() + self.retry_delay
+                    self._start_thread()
+                    self.cond.notify()
+                return False
+            self.retry_at = None
+            self.flushes += 1
+            return True
+
+    def take(self):
+        raise NotImplementedError
+
+    def write(self, batch):
+        raise NotImplementedError
@@ -0,0 +1,122 @@
+import socket
+import struct
+import threading
+import errno
+import time
+
+# Every control message (client command, server response or server push) is sent as
+# one frame: a 4-byte big-endian payload length followed by the UTF-8 payload.
+# A response may span several lines; the receiver splits the payload on "\n".
+FRAME_HEADER = struct.Struct('!I')
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+
+def encode_frame(text):
+    """Encode one message as a length-prefixed frame."""
+    payload = text.encode()
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+def encode_frames(texts):
+    """Encode several messages into a single buffer so they can be pipelined in one write."""
+    return b"".join(encode_frame(text) for text in texts)
+
+
+class FrameDecoder:
+    """Per-connection reassembly buffer turning a byte stream back into frames."""
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE):
+        self.buffer = bytearray()
+        self.max_frame_size = max_frame_size
+
+    def feed(self, data):
+        """Append received bytes and return every complete frame, in order."""
+        self.buffer.extend(data)
+        frames = []
+        offset = 0
+        header_size = FRAME_HEADER.size
+        while len(self.buffer) - offset >= header_size:
+            (length,) = FRAME_HEADER.unpack_from(self.buffer, offset)
+            if length > self.max_frame_size:
+                raise ValueError(f"Frame of {length} bytes exceeds the {self.max_frame_size} byte limit")
+            end = offset + header_size + length
+            if len(self.buffer) < end:
+                break
+            frames.append(self.buffer[offset + header_size:end].decode())
+            offset = end
+        if offset:
+            del self.buffer[:offset]
+        return frames
+
+
+class FramedConnection:
+    """Client-side control connection speaking the framed protocol.
+
+    Sends are serialized with a lock so frames written from the UI thread and the
+    streaming threads never interleave. Reads go through a single FrameDecoder so
+    frames split or merged by TCP are reassembled correctly.
+    """
+    def __init__(self, sock):
+        self.sock = sock
+        self.decoder = FrameDecoder()
+        self.pending = []
+        self.send_lock = threading.Lock()
+
+    def send_command(self, command):
+        with self.send_lock:
+            self.sock.sendall(encode_frame(command))
+
+    def send_commands(self, commands):
+        """Pipeline several commands in one write; responses come back in the same order."""
+        if not commands:
+            return
+        with self.send_lock:
+            self.sock.sendall(encode_frames(commands))
+
+    def recv_frames(self):
+        """Return the frames available now; [] if the socket would block.
+
+        Raises ConnectionError when the server closed the connection.
+        """
+        if self.pending:
+            frames, self.pending = self.pending, []
+            return frames
+        try:
+            data = self.sock.recv(65536)
+        except socket.error as e:
+            if e.errno in (errno.EWOULDBLOCK, errno.EAGAIN):
+                return []
+            raise
+        if not data:
+            raise ConnectionError("Connection closed by server")
+        return self.decoder.feed(data)
+
+    def recv_frame(self, timeout=None):
+        """Wait for the next frame; returns None on timeout."""
+        start_time = time.time()
+        while timeout is None or time.time() - start_time < timeout:
+            frames = self.recv_frames()
+            if frames:
+                self.pending = frames[1:] + self.pending
+                return frames[0]
+            time.sleep(0.01)
+        return None
+
+    def unread(self, frames):
+        """Put frames back so that the next recv_frames() returns them first, in order."""
+        self.pending = list(frames) + self.pending
+
+    def reconnect(self, sock):
+        """Continue on a new socket (after a dropped connection); unread data of the old one is discarded."""
+        with self.send_lock:
+            self.sock = sock
+            self.decoder = FrameDecoder()
+            self.pending = []
+
+    def setblocking(self, flag):
+        self.sock.setblocking(flag)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,494 @@
+import heapq
+import json
+import multiprocessing
+import random
+import selectors
+import socket
+import time
+from collections import deque
+
+from command_registry import LatencyHistogram
+from framing import FrameDecoder, FramedConnection, encode_frame
+
+# Responses meaning a command did not do what the simulated user asked for
+ERROR_RESPONSES = {"INVALID_COMMAND", "LOGIN_FAILED", "USER_NOT_FOUND", "INVALID_STATUS", "CHANNEL_NOT_FOUND",
+                   "NOT_A_MEMBER", "HOST_CANNOT_LEAVE", "VISITOR_NOT_ALLOWED", "NO_STREAM", "RESUME_FAILED",
+                   "INVALID_PAGE_REQUEST", "SERVER_BUSY"}
+
+# What a simulated user can do once logged in and joined, at a rate per second set by the scenario
+ACTIONS = ("SEND_MESSAGE", "SET_STATUS", "START_STREAM", "GET_CHANNELS", "GET_MESSAGES_PAGE", "RESUME")
+
+SCENARIO_DEFAULTS = {"duration": 30.0, "ramp_up": 5.0, "channels": 10, "prefix": "load", "password": "pw"}
+GROUP_DEFAULTS = {"kind": "user", "count": 1, "join": 1, "rates": {}, "stream_seconds": 10.0}
+
+
+def load_scenario(path):
+    """Read a scenario file and fill in the defaults; raises ValueError if it is malformed.
+
+    {
+      "duration": 30, "ramp_up": 5, "channels": 20, "prefix": "load",
+      "groups": [
+        {"name": "member", "kind": "user", "count": 500, "join": 3,
+         "rates": {"SEND_MESSAGE": 0.2, "SET_STATUS": 0.02, "START_STREAM": 0.002}, "stream_seconds": 10},
+        {"name": "guest", "kind": "visitor", "count": 1500, "join": 2, "rates": {"GET_MESSAGES_PAGE": 0.05}}
+      ]
+    }
+
+    Every simulated user of a group logs in (kind "user", registered beforehand)
+    or enters as a visitor, joins `join` of the scenario's channels at random and
+    then performs each action at its rate, at exponentially distributed intervals,
+    until `duration` seconds after the last user started. Logins are spread over
+    the first `ramp_up` seconds.
+    """
+    with open(path) as f:
+        scenario = dict(SCENARIO_DEFAULTS, **json.load(f))
+    groups = []
+    for group in scenario.get("groups", []):
+        group = dict(GROUP_DEFAULTS, **group)
+        name = group.get("name", "")
+        if not name or any(c.isspace() for c in name):
+            raise ValueError(f"group name {name!r} must be a non-empty word")
+        if group["kind"] not in ("user", "visitor"):
+            raise ValueError(f"group {name}: kind must be 'user' or 'visitor', not {group['kind']!r}")
+        unknown = set(group["rates"]) - set(ACTIONS)
+        if unknown:
+            raise ValueError(f"group {name}: unknown actions {sorted(unknown)}; known: {', '.join(ACTIONS)}")
+        groups.append(group)
+    if not groups:
+        raise ValueError("a scenario needs at least one group")
+    if scenario["channels"] < 1:
+        raise ValueError("a scenario needs at least one channel")
+    scenario["groups"] = groups
+    return scenario
+
+
+def request(conn, command):
+    """Send one command on a blocking FramedConnection and return its response, skipping pushed events."""
+    conn.send_command(command)
+    while True:
+        frame = conn.recv_frame()
+        if not frame.startswith("EVENT "):
+            return frame
+
+
+def prepare(host, port, scenario):
+    """Register the scenario's users and create its channels; returns the channel IDs."""
+    prefix, password = scenario["prefix"], scenario["password"]
+    owner = f"{prefix}_host"
+    names = [owner] + [f"{prefix}_{group['name']}{i}" for group in scenario["groups"]
+                       if group["kind"] == "user" for i in range(group["count"])]
+    conn = FramedConnection(socket.create_connection((host, port)))
+    try:
+        for start in range(0, len(names), 500):
+            batch = names[start:start + 500]
+            conn.send_commands([f"REGISTER {name} {password}" for name in batch])
+            for name in batch:
+                response = conn.recv_frame()
+                if response not in ("REGISTER_SUCCESS", "USERNAME_TAKEN"):
+                    raise RuntimeError(f"REGISTER {name} failed: {response}")
+        response = request(conn, f"LOGIN {owner} {password}")
+        if not response.startswith("LOGIN_SUCCESS"):
+            raise RuntimeError(f"LOGIN {owner} failed: {response} (registered earlier with another password?)")
+        owner_id = response.split()[1]
+        channel_ids = []
+        for c in range(scenario["channels"]):
+            response = request(conn, f"CREATE_CHANNEL {owner_id} {prefix}_room{c}")
+            if not response.startswith("CHANNEL_CREATED"):
+                raise RuntimeError(f"CREATE_CHANNEL failed: {response}")
+            channel_ids.append(response.split()[1])
+        request(conn, "LOGOUT")
+        return channel_ids
+    finally:
+        conn.close()
+
+
+class SimulatedUser:
+    """One headless client on a non-blocking socket, driven by its LoadRunner's event loop.
+
+    Commands may be pipelined: responses come back in order, so each one is matched
+    with the oldest command still waiting, while EVENT frames are pushes: they
+    advance last_seq, the seq a RESUME continues from, and LIVESTREAM_START/STOP
+    events keep live_streams current so a user only starts a stream in a channel
+    without one.
+    """
+    def __init__(self, runner, group, name, rng):
+        self.runner = runner
+        self.group = group
+        self.name = name
+        self.rng = rng
+        self.sock = None
+        self.decoder = None
+        self.outbuf = bytearray()
+        self.waiting = deque()  # (verb, send time, callback) of commands awaiting a response
+        self.user_id = None
+        self.token = None
+        self.last_seq = 0
+        self.channels = []
+        self.streaming = None  # channel ID of the stream this user runs
+        self.live_streams = set()  # channels with another user's stream running
+        self.status = "Online"
+        self.sent = 0
+        self.scheduled = False
+        self.active = False  # logged in and joined; scheduled actions only run while set
+        self.connected = False
+        self.dead = False
+
+    def connect(self, on_connected):
+        self.sock = socket.socket()
+        self.sock.setblocking(False)
+        self.decoder = FrameDecoder()
+        self.outbuf = bytearray()
+        self.connected = False
+        self.on_connected = on_connected
+        self.sock.connect_ex((self.runner.host, self.runner.port))
+        self.runner.sel.register(self.sock, selectors.EVENT_WRITE, self)
+
+    def send(self, command, callback=None):
+        self.waiting.append((command.split(maxsplit=1)[0], time.perf_counter(), callback))
+        self.outbuf += encode_frame(command)
+        if self.connected:
+            self.runner.sel.modify(self.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, self)
+
+    def on_ready(self, mask):
+        if not self.connected:
+            error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if error:
+                self.runner.connect_errors += 1
+                self.close(lost=True)
+                return
+            self.connected = True
+            self.runner.sel.modify(self.sock, selectors.EVENT_READ, self)
+            self.on_connected()
+            return
+        try:
+            if mask & selectors.EVENT_READ:
+                data = self.sock.recv(65536)
+                if not data:
+                    raise ConnectionError("closed by server")
+                for frame in self.decoder.feed(data):
+                    self.on_frame(frame)
+                if self.sock is None:
+                    return  # a response made the user give up
+            if mask & selectors.EVENT_WRITE:
+                sent = self.sock.send(self.outbuf)
+                del self.outbuf[:sent]
+                if not self.outbuf:
+                    self.runner.sel.modify(self.sock, selectors.EVENT_READ, self)
+        except BlockingIOError:
+            pass
+        except OSError:
+            self.runner.dropped += 1
+            self.close(lost=True)
+
+    def on_frame(self, frame):
+        if frame.startswith("EVENT "):
+            self.runner.events += 1
+            header, _, message = frame.partition("\n")
+            self.last_seq = int(header.split()[1])
+            if message.startswith("LIVESTREAM_"):
+                fields = message.split()
+                if fields[0] == "LIVESTREAM_START":
+                    self.live_streams.add(fields[2])
+                elif fields[0] == "LIVESTREAM_STOP":
+                    self.live_streams.discard(fields[2])
+            return
+        verb, sent_at, callback = self.waiting.popleft()
+        self.runner.record(verb, time.perf_counter() - sent_at, frame.split(maxsplit=1)[0])
+        if callback:
+            callback(frame)
+
+    def close(self, lost=False):
+        """Close the socket; with lost=True the user gives up and its unanswered commands count as errors."""
+        if self.sock is not None:
+            self.runner.sel.unregister(self.sock)
+            self.sock.close()
+            self.sock = None
+        self.connected = False
+        if lost:
+            self.dead = True
+            self.active = False
+            for verb, _, _ in self.waiting:
+                self.runner.record(verb, None, "NO_RESPONSE")
+            self.waiting.clear()
+
+    # Lifecycle: log in, join, act
+
+    def start(self):
+        self.connect(self.log_in)
+
+    def log_in(self):
+        if self.group["kind"] == "user":
+            self.send(f"LOGIN {self.name} {self.runner.scenario['password']}", self.on_login)
+        else:
+            self.send(f"VISITOR {self.name}", self.on_login)
+
+    def on_login(self, response):
+        fields = response.split()
+        if fields[0] == "LOGIN_SUCCESS":  # LOGIN_SUCCESS user_id [session_token]
+            self.user_id, self.token = fields[1], fields[2] if len(fields) > 2 else None
+        elif fields[0] == "WELCOME_VISITOR":  # WELCOME_VISITOR name user_id [session_token]
+            self.user_id, self.token = fields[2], fields[3] if len(fields) > 3 else None
+        else:
+            self.close(lost=True)
+            return
+        self.runner.logged_in += 1
+        wanted = self.rng.sample(self.runner.channel_ids, min(self.group["join"], len(self.runner.channel_ids)))
+        remaining = [len(wanted)]
+
+        def on_join(channel_id, response):
+            if response.startswith(("JOIN_SUCCESS", "ALREADY_MEMBER")):
+                self.channels.append(channel_id)
+                if "\nLIVESTREAM_START " in response:
+                    self.live_streams.add(channel_id)
+            remaining[0] -= 1
+            if not remaining[0]:
+                self.begin()
+
+        for channel_id in wanted:
+            self.send(f"JOIN_CHANNEL {self.user_id} {channel_id}", lambda r, c=channel_id: on_join(c, r))
+        if not wanted:
+            self.begin()
+
+    def begin(self):
+        self.active = True
+        if not self.scheduled:  # not again after logging in anew
+            self.scheduled = True
+            for action, rate in self.group["rates"].items():
+                if rate > 0:
+                    self.schedule(action, rate)
+
+    def schedule(self, action, rate):
+        self.runner.at(time.monotonic() + self.rng.expovariate(rate), lambda: self.act(action, rate))
+
+    def act(self, action, rate):
+        if self.dead or self.runner.stopping:
+            return
+        self.schedule(action, rate)
+        if not self.active:
+            return  # reconnecting
+        channel_id = self.rng.choice(self.channels) if self.channels else None
+        if action == "SEND_MESSAGE" and channel_id:
+            self.sent += 1
+            self.send(f"SEND_MESSAGE {self.user_id} {channel_id} {self.name} message {self.sent}")
+        elif action == "SET_STATUS":
+            self.status = "Invisible" if self.status == "Online" else "Online"
+            self.send(f"SET_STATUS {self.user_id} {self.status}")
+        elif action == "START_STREAM" and self.streaming is None:
+            idle = [c for c in self.channels if c not in self.live_streams]
+            if not idle:
+                return
+            self.streaming = channel_id = self.rng.choice(idle)
+            self.send(f"START_STREAM {self.user_id} {channel_id} 127.0.0.1 9", self.on_stream_started)
+        elif action == "GET_CHANNELS":
+            self.send("GET_CHANNELS")
+        elif action == "GET_MESSAGES_PAGE" and channel_id:
+            self.send(f"GET_MESSAGES_PAGE {channel_id}")
+        elif action == "RESUME" and self.token and not self.waiting:
+            self.active = False
+            self.close()
+            self.connect(self.resume)
+
+    def on_stream_started(self, response):
+        if response != "STREAM_STARTED":
+            self.streaming = None
+            return
+        self.runner.at(time.monotonic() + self.group["stream_seconds"], self.stop_stream)
+
+    def stop_stream(self):
+        if self.streaming is not None and self.active and not self.runner.stopping:
+            self.send(f"STOP_STREAM {self.user_id} {self.streaming}")
+            self.streaming = None
+
+    def resume(self):
+        self.send(f"RESUME {self.token} {self.last_seq}", self.on_resumed)
+
+    def on_resumed(self, response):
+        if response.startswith("RESUMED"):
+            self.active = True
+        else:
+            self.channels = []
+            self.log_in()  # the session expired: start over
+
+    def finish(self):
+        """Stop a running stream and log out; the connection closes once the responses are in."""
+        if self.dead or not self.active:
+            return
+        if self.streaming is not None and self.active:
+            self.send(f"STOP_STREAM {self.user_id} {self.streaming}")
+        if self.user_id:
+            self.send("LOGOUT")
+
+
+class LoadRunner:
+    """Runs a slice of a scenario's simulated users on one selector loop and collects their results."""
+    def __init__(self, host, port, scenario, channel_ids):
+        self.host = host
+        self.port = port
+        self.scenario = scenario
+        self.channel_ids = channel_ids
+        self.sel = selectors.DefaultSelector()
+        self.timers = []  # heap of (due, n, callback), due in time.monotonic()
+        self.timer_ids = 0
+        self.stopping = False
+        self.histograms = {}  # {verb: LatencyHistogram}
+        self.errors = {}  # {"VERB RESPONSE": count}
+        self.lag = LatencyHistogram()  # how late timers fired; high values mean this process is saturated
+        self.events = 0
+        self.logged_in = 0
+        self.connect_errors = 0
+        self.dropped = 0
+
+    def at(self, due, callback):
+        self.timer_ids += 1
+        heapq.heappush(self.timers, (due, self.timer_ids, callback))
+
+    def record(self, verb, elapsed, response):
+        histogram = self.histograms.setdefault(verb, LatencyHistogram())
+        failed = response in ERROR_RESPONSES or response == "NO_RESPONSE"
+        if failed:
+            key = f"{verb} {response}"
+            self.errors[key] = self.errors.get(key, 0) + 1
+        if elapsed is None:
+            histogram.errors += 1
+        else:
+            histogram.record(elapsed, failed)
+
+    def run(self, users, start_at, stop_at, drain=5.0):
+        """Start users[i] at start_at[i], stop acting at stop_at, then log everyone out."""
+        for user, due in zip(users, start_at):
+            self.at(due, user.start)
+        self.at(stop_at, lambda: self.stop(users))
+        drain_until = None
+        while True:
+            now = time.monotonic()
+            while self.timers and self.timers[0][0] <= now:
+                due, _, callback = heapq.heappop(self.timers)
+                self.lag.record(now - due)
+                callback()
+            if self.stopping:
+                if drain_until is None:
+                    drain_until = now + drain
+                if now > drain_until or all(user.dead or not user.waiting for user in users):
+                    break
+            timeout = min(self.timers[0][0] - now, 0.1) if self.timers else 0.1
+            for key, mask in self.sel.select(max(timeout, 0)):
+                key.data.on_ready(mask)
+        for user in users:
+            if user.waiting and not user.dead:
+                user.close(lost=True)
+            user.close()
+        self.sel.close()
+
+    def stop(self, users):
+        self.stopping = True
+        for user in users:
+            user.finish()
+
+    def results(self):
+        return {"histograms": self.histograms, "errors": self.errors, "lag": self.lag, "events": self.events,
+                "logged_in": self.logged_in, "connect_errors": self.connect_errors, "dropped": self.dropped}
+
+
+def simulated_users(scenario, seed):
+    """(group, username, seed) for every simulated user, shuffled so the groups ramp up together."""
+    users = [(group, f"{scenario['prefix']}_{group['name']}{i}") for group in scenario["groups"]
+             for i in range(group["count"])]
+    random.Random(seed).shuffle(users)
+    return [(group, name, seed * 1_000_003 + n) for n, (group, name) in enumerate(users)]
+
+
+def run_slice(host, port, scenario, channel_ids, specs, start_at, stop_at, results):
+    """Process body: run the simulated users in specs and put their results on the results queue."""
+    runner = LoadRunner(host, port, scenario, channel_ids)
+    users = [SimulatedUser(runner, group, name, random.Random(seed)) for group, name, seed in specs]
+    runner.run(users, start_at, stop_at)
+    results.put(runner.results())
+
+
+def merge_results(parts):
+    merged = {"histograms": {}, "errors": {}, "lag": LatencyHistogram(), "events": 0,
+              "logged_in": 0, "connect_errors": 0, "dropped": 0}
+    for part in parts:
+        for verb, histogram in part["histograms"].items():
+            merged["histograms"].setdefault(verb, LatencyHistogram()).merge(histogram)
+        for key, count in part["errors"].items():
+            merged["errors"][key] = merged["errors"].get(key, 0) + count
+        merged["lag"].merge(part["lag"])
+        for key in ("events", "logged_in", "connect_errors", "dropped"):
+            merged[key] += part[key]
+    return merged
+
+
+def format_ms(seconds):
+    return f"{seconds * 1e3:.2f}"
+
+
+def print_report(scenario, results, elapsed, users, processes):
+    groups = ", ".join(f"{g['count']} {g['name']} ({g['kind']})" for g in scenario["groups"])
+    print(f"[LoadClient] {users} simulated users: {groups}; {scenario['channels']} channels, "
+          f"{elapsed:.1f} s, {processes} process(es)")
+    print(f"[LoadClient] logged in {results['logged_in']}, connect errors {results['connect_errors']}, "
+          f"dropped by server {results['dropped']}")
+    print(f"{'command':>18} {'count':>9} {'per s':>9} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    total = LatencyHistogram()
+    for verb in sorted(results["histograms"]):
+        histogram = results["histograms"][verb]
+        total.merge(histogram)
+        s = histogram.summary()
+        print(f"{verb:>18} {s['count']:>9} {s['count'] / elapsed:>9.1f} {s['errors']:>7} "
+              f"{format_ms(s['p50']):>8} {format_ms(s['p95']):>8} {format_ms(s['p99']):>8} {format_ms(s['max']):>8}")
+    s = total.summary()
+    print(f"{'total':>18} {s['count']:>9} {s['count'] / elapsed:>9.1f} {s['errors']:>7} "
+          f"{format_ms(s['p50']):>8} {format_ms(s['p95']):>8} {format_ms(s['p99']):>8} {format_ms(s['max']):>8}")
+    print(f"[LoadClient] pushed events received: {results['events']} ({results['events'] / elapsed:.1f}/s)")
+    for key, count in sorted(results["errors"].items()):
+        print(f"[LoadClient] error {key}: {count}")
+    lag = results["lag"].percentile(99)
+    print(f"[LoadClient] load generator timer lag p99: {format_ms(lag)} ms")
+    if lag > 0.05:
+        print("[LoadClient] The load generator itself is falling behind; latencies include its delay. "
+              "Use more --processes or fewer users.")
+
+
+def report_json(scenario, results, elapsed, users, processes):
+    return {
+        "scenario": scenario,
+        "users": users,
+        "processes": processes,
+        "elapsed": elapsed,
+        "logged_in": results["logged_in"],
+        "connect_errors": results["connect_errors"],
+        "dropped": results["dropped"],
+        "events": results["events"],
+        "errors": results["errors"],
+        "commands": {verb: histogram.summary() for verb, histogram in results["histograms"].items()},
+        "timer_lag_p99": results["lag"].percentile(99),
+    }
+
+
+def run_scenario(host, port, path, processes=1, seed=1, report=None):
+    """Run a scenario file against a server with no UI and print throughput, errors and latencies."""
+    scenario = load_scenario(path)
+    channel_ids = prepare(host, port, scenario)
+    specs = simulated_users(scenario, seed)
+    print(f"[LoadClient] Prepared {len(channel_ids)} channels; starting {len(specs)} simulated users")
+    begin = time.monotonic() + 0.5
+    start_at = [begin + scenario["ramp_up"] * n / max(len(specs), 1) for n in range(len(specs))]
+    stop_at = begin + scenario["ramp_up"] + scenario["duration"]
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=run_slice, args=(host, port, scenario, channel_ids, specs[p::processes],
+                                                              start_at[p::processes], stop_at, results))
+               for p in range(processes)]
+    for worker in workers:
+        worker.start()
+    parts = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    elapsed = stop_at - begin
+    merged = merge_results(parts)
+    print_report(scenario, merged, elapsed, len(specs), processes)
+    if report:
+        with open(report, "w") as f:
+            json.dump(report_json(scenario, merged, elapsed, len(specs), processes), f, indent=2)
+        print(f"[LoadClient] Wrote {report}")
+    return merged
@@ -1,7 +1,5 @@
 import tkinter as tk
 from tkinter import messagebox
-import socket
-import errno
 
 class LoginUI:
     def __init__(self, conn, on_complete):
@@ -35,17 +33,9 @@ class LoginUI:
     def send_command(self, command):
         """Send a command to the server and get response."""
         try:
-            self.conn.sendall(command.encode())
-            # Since the socket is non-blocking, loop until we get the response
-            while True:
-                try:
-                    response = self.conn.recv(1024).decode().strip()
-                    if response:
-                        return response
-                except socket.error as e:
-                    if e.errno != errno.EWOULDBLOCK:
-                        raise e
-                    continue
+            self.conn.send_command(command)
+            # Since the socket is non-blocking, wait until the response frame is complete
+            return self.conn.recv_frame().strip()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to communicate with server: {e}")
             return ""
@@ -66,11 +56,13 @@ class LoginUI:
             if name:
                 response = self.send_command(f"VISITOR {name}")
                 if response.startswith("WELCOME_VISITOR"):
-                    _, _, user_id = response.split()  # Extract user_id from WELCOME_VISITOR name user_id
+                    fields = response.split()  # WELCOME_VISITOR name user_id [session_token]
+                    user_id = fields[2]
+                    token = fields[3] if len(fields) > 3 else None
                     messagebox.showinfo("Success", f"Welcome, {name}!")
                     visitor_window.destroy()
                     self.root.destroy()
-                    self.on_complete("visitor", name, user_id)
+                    self.on_complete("visitor", name, user_id, token)
                 else:
                     messagebox.showerror("Error", response)
             else:
@@ -99,11 +91,13 @@ class LoginUI:
             if username and password:
                 response = self.send_command(f"LOGIN {username} {password}")
                 if response.startswith("LOGIN_SUCCESS"):
-                    user_id = response.split()[1]  # Extract user_id from LOGIN_SUCCESS user_id
+                    fields = response.split()  # LOGIN_SUCCESS user_id [session_token]
+                    user_id = fields[1]
+                    token = fields[2] if len(fields) > 2 else None
                     messagebox.showinfo("Success", "Login successful!")
                     login_window.destroy()
                     self.root.destroy()
-                    self.on_complete("authenticated", username, user_id)
+                    self.on_complete("authenticated", username, user_id, token)
                 else:
                     messagebox.showerror("Error", "Login failed: " + response)
             else:
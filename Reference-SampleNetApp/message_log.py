@@ -0,0 +1,307 @@
+import bisect
+import json
+import os
+import threading
+from collections import OrderedDict
+
+SEGMENT_SUFFIX = ".log"
+SPARSE_INDEX_INTERVAL = 128  # records between entries of a segment's sparse offset index
+READ_ATTEMPTS = 3  # reads re-list the segments when a compaction in another process removed one
+
+
+class MessageLog:
+    """Append-only message store with one directory of segment files per channel.
+
+    Layout: <directory>/<channel_id>/<first_seq>.log, one JSON record per line.
+    Sending a message appends a single line to the channel's active segment, so the
+    write cost does not depend on how much history exists. Segments rotate at
+    segment_max_bytes; compact() merges small closed segments and drops records torn
+    by a crash. The first sequence number in each file name lets readers find the
+    segment holding any message without opening the others, and a sparse index of
+    byte offsets inside each segment lets read_range() seek close to any message.
+
+    Reads and compaction of a channel hold the channel's lock, so a merge never
+    removes a segment under a reader of this process. A reader in another process
+    (ReplicaMessageLog) can still lose that race; it then lists the segments again
+    and retries, skipping records a merged segment repeats.
+    """
+    def __init__(self, directory, segment_max_bytes=1024 * 1024, compact_target_bytes=16 * 1024 * 1024,
+                 max_open_files=256):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.compact_target_bytes = compact_target_bytes
+        self.max_open_files = max_open_files
+        self.handles = OrderedDict()  # {channel_id: file} LRU of open active segments
+        self.next_seq = {}  # {channel_id: seq of the next message}
+        self.sparse_index = {}  # {segment path: (inode, [seq], [byte offset]) every SPARSE_INDEX_INTERVAL records}
+        self.channel_locks = {}  # {channel_id: RLock} held by reads and compaction of the channel
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def channel_dir(self, channel_id):
+        return os.path.join(self.directory, str(channel_id))
+
+    def segments(self, channel_id):
+        """Return [(first_seq, path)] of a channel's segments in sequence order."""
+        channel_dir = self.channel_dir(channel_id)
+        if not os.path.isdir(channel_dir):
+            return []
+        result = []
+        for name in os.listdir(channel_dir):
+            if name.endswith(SEGMENT_SUFFIX):
+                result.append((int(name[:-len(SEGMENT_SUFFIX)]), os.path.join(channel_dir, name)))
+        return sorted(result)
+
+    def channel_lock(self, channel_id):
+        with self.lock:
+            return self.channel_locks.setdefault(str(channel_id), threading.RLock())
+
+    def _read_channel(self, channel_id, read):
+        """Run read() under the channel's lock, starting over if a segment vanished (merged by another process)."""
+        with self.channel_lock(channel_id):
+            for attempt in range(READ_ATTEMPTS):
+                try:
+                    return read()
+                except FileNotFoundError:
+                    if attempt == READ_ATTEMPTS - 1:
+                        raise
+
+    def channel_ids(self):
+        return [name for name in os.listdir(self.directory) if os.path.isdir(os.path.join(self.directory, name))]
+
+    @staticmethod
+    def read_segment(path, offset=0):
+        """Yield the records of one segment from a byte offset, skipping lines torn by a crash."""
+        with open(path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # torn final write
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def _index_segment(self, path):
+        """Scan a segment once and remember the byte offset of every SPARSE_INDEX_INTERVAL-th record."""
+        seqs, offsets = [], []
+        offset = 0
+        count = 0
+        with open(path, "rb") as f:
+            inode = os.fstat(f.fileno()).st_ino
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                if count % SPARSE_INDEX_INTERVAL == 0:
+                    try:
+                        seqs.append(json.loads(line)["seq"])
+                        offsets.append(offset)
+                    except (ValueError, KeyError):
+                        pass
+                offset += len(line)
+                count += 1
+        with self.lock:
+            self.sparse_index[path] = (inode, seqs, offsets)
+        return seqs, offsets
+
+    def _seek_offset(self, path, seq):
+        """Byte offset of the last indexed record at or before seq in a segment."""
+        with self.lock:
+            index = self.sparse_index.get(path)
+        if index is not None and index[0] == os.stat(path).st_ino:
+            _, seqs, offsets = index
+        else:
+            # Not indexed yet, or a merge replaced the file since
+            seqs, offsets = self._index_segment(path)
+        position = bisect.bisect_right(seqs, seq) - 1
+        return offsets[position] if position >= 0 else 0
+
+    def read_range(self, channel_id, start, stop):
+        """Return the records with start <= seq < stop, reading only the segments that hold them."""
+        return self._read_channel(channel_id, lambda: self._read_range(channel_id, start, stop))
+
+    def _read_range(self, channel_id, start, stop):
+        segments = self.segments(channel_id)
+        firsts = [first for first, _ in segments]
+        records = []
+        for first, path in segments[max(0, bisect.bisect_right(firsts, start) - 1):]:
+            if first >= stop:
+                break
+            for record in self.read_segment(path, self._seek_offset(path, start)):
+                if record["seq"] >= stop:
+                    return records
+                if record["seq"] >= start and (not records or record["seq"] > records[-1]["seq"]):
+                    records.append(record)
+        return records
+
+    def tail(self, channel_id, count):
+        """Return (newest count records, seq of the next message) reading segments from the newest back."""
+        return self._read_channel(channel_id, lambda: self._tail(channel_id, count))
+
+    def _tail(self, channel_id, count):
+        records = []
+        segments = self.segments(channel_id)
+        for _, path in reversed(segments):
+            older = list(self.read_segment(path))
+            if records:
+                older = [record for record in older if record["seq"] < records[0]["seq"]]
+            records[:0] = older
+            if len(records) >= count:
+                break
+        next_seq = records[-1]["seq"] + 1 if records else (segments[-1][0] if segments else 0)
+        with self.lock:
+            self.next_seq.setdefault(str(channel_id), next_seq)
+        return records[-count:] if count else [], next_seq
+
+    def load_channel(self, channel_id):
+        return self._read_channel(channel_id, lambda: self._load_channel(channel_id))
+
+    def _load_channel(self, channel_id):
+        records = []
+        for _, path in self.segments(channel_id):
+            for record in self.read_segment(path):
+                if not records or record["seq"] > records[-1]["seq"]:
+                    records.append(record)
+        return records
+
+    def load_all(self):
+        """Replay every segment; returns {channel_id: [records]} and primes the sequence counters."""
+        messages = {}
+        for channel_id in self.channel_ids():
+            records = self.load_channel(channel_id)
+            if records:
+                messages[channel_id] = records
+            with self.lock:
+                self.next_seq[channel_id] = records[-1]["seq"] + 1 if records else 0
+        return messages
+
+    def append(self, channel_id, record):
+        """Append one message; assigns and returns its per-channel sequence number."""
+        channel_id = str(channel_id)
+        with self.lock:
+            seq = self.next_seq.get(channel_id)
+            if seq is None:
+                seq = self._recover_next_seq(channel_id)
+            record = dict(record, seq=seq)
+            f = self._active_segment(channel_id, seq)
+            f.write(json.dumps(record, separators=(",", ":")).encode() + b"\n")
+            f.flush()
+            self.next_seq[channel_id] = seq + 1
+        return seq
+
+    def _recover_next_seq(self, channel_id):
+        segments = self.segments(channel_id)
+        if not segments:
+            return 0
+        last = None
+        for last in self.read_segment(segments[-1][1]):
+            pass
+        return last["seq"] + 1 if last else segments[-1][0]
+
+    def _active_segment(self, channel_id, seq):
+        f = self.handles.get(channel_id)
+        if f is not None:
+            self.handles.move_to_end(channel_id)
+            if f.tell() < self.segment_max_bytes:
+                return f
+            f.close()
+            del self.handles[channel_id]
+            path = self._segment_path(channel_id, seq)
+        else:
+            segments = self.segments(channel_id)
+            if segments and os.path.getsize(segments[-1][1]) < self.segment_max_bytes:
+                path = segments[-1][1]
+                self._truncate_torn_tail(path)
+            else:
+                path = self._segment_path(channel_id, seq)
+        os.makedirs(self.channel_dir(channel_id), exist_ok=True)
+        f = open(path, "ab")
+        self.handles[channel_id] = f
+        while len(self.handles) > self.max_open_files:
+            _, old = self.handles.popitem(last=False)
+            old.close()
+        return f
+
+    def _segment_path(self, channel_id, first_seq):
+        return os.path.join(self.channel_dir(channel_id), f"{first_seq:012d}{SEGMENT_SUFFIX}")
+
+    @staticmethod
+    def _truncate_torn_tail(path):
+        """Cut a partially written last line so new records start on a clean line."""
+        with open(path, "rb+") as f:
+            data = f.read()
+            end = data.rfind(b"\n") + 1
+            if end != len(data):
+                f.truncate(end)
+
+    def compact(self, channel_id):
+        """Merge adjacent closed segments up to compact_target_bytes; returns segments removed."""
+        with self.channel_lock(channel_id):
+            return self._compact(channel_id)
+
+    def _compact(self, channel_id):
+        # Appends only ever go to the newest segment, so every older one is closed
+        segments = self.segments(channel_id)[:-1]
+        removed = 0
+        group = []
+        group_size = 0
+        for seq, path in segments + [(None, None)]:
+            size = os.path.getsize(path) if path else 0
+            if path is None or group_size + size > self.compact_target_bytes:
+                if len(group) > 1:
+                    self._merge(group)
+                    removed += len(group) - 1
+                group, group_size = [], 0
+            if path is not None:
+                group.append(path)
+                group_size += size
+        return removed
+
+    def _merge(self, paths):
+        target = paths[0]
+        tmp = target + ".compact"
+        with open(tmp, "wb") as out:
+            for path in paths:
+                for record in self.read_segment(path):
+                    out.write(json.dumps(record, separators=(",", ":")).encode() + b"\n")
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, target)
+        for path in paths[1:]:
+            os.remove(path)
+        with self.lock:
+            for path in paths:
+                self.sparse_index.pop(path, None)
+
+    def compact_all(self, min_segments=4):
+        """Compact every channel that has accumulated at least min_segments segments."""
+        removed = 0
+        for channel_id in self.channel_ids():
+            if len(self.segments(channel_id)) >= min_segments:
+                removed += self.compact(channel_id)
+        return removed
+
+    def close(self):
+        with self.lock:
+            for f in self.handles.values():
+                f.close()
+            self.handles.clear()
+
+
+class ReplicaMessageLog(MessageLog):
+    """Read-only view of a message log another process appends to (--workers mode).
+
+    Workers other than worker 0 apply every message worker 0 stores, so append()
+    only takes the seq worker 0 gave the record and advances the sequence counter
+    past it; the record itself reaches disk through worker 0. A message this
+    worker already read from disk while loading is not counted twice.
+    """
+    def append(self, channel_id, record):
+        channel_id = str(channel_id)
+        seq = record["seq"]
+        with self.lock:
+            self.next_seq[channel_id] = max(self.next_seq.get(channel_id, 0), seq + 1)
+        return seq
+
+    def compact_all(self, min_segments=4):
+        return 0
@@ -0,0 +1,134 @@
+import bisect
+import threading
+from collections import OrderedDict, deque
+
+
+class TieredMessageStore:
+    """Channel history with a bounded hot tier in memory and everything else on disk.
+
+    Every channel keeps its newest hot_size messages in a ring buffer. Older
+    messages stay in the backend (MessageLog or SqliteStore) and are read on
+    demand in fixed pages of page_size sequence numbers. The last cache_pages
+    cold pages are kept in an LRU. Memory is therefore bounded by
+    channels * hot_size + cache_pages * page_size records, whatever the history size.
+    """
+    def __init__(self, backend, hot_size=200, page_size=100, cache_pages=64):
+        self.backend = backend
+        self.hot_size = hot_size
+        self.page_size = page_size
+        self.cache_pages = cache_pages
+        self.hot = {}  # {channel_id: deque of the newest records}
+        self.next_seq = {}  # {channel_id: seq of the next message}
+        self.cold_pages = OrderedDict()  # {(channel_id, page number): [records]} LRU
+        self.lock = threading.Lock()
+        self.hot_hits = 0
+        self.cold_hits = 0
+        self.cold_misses = 0
+        self.hot_evictions = 0
+        self.page_evictions = 0
+
+    def load(self):
+        """Fill the hot tier of every channel from the tail of the backend."""
+        for channel_id in self.backend.channel_ids():
+            records, next_seq = self.backend.tail(channel_id, self.hot_size)
+            if next_seq:
+                self.hot[channel_id] = deque(records, maxlen=self.hot_size)
+                self.next_seq[channel_id] = next_seq
+
+    def append(self, channel_id, record):
+        """Persist a message through the backend and keep it in the hot tier; returns its seq."""
+        seq = self.backend.append(channel_id, record)
+        record = dict(record, seq=seq)
+        with self.lock:
+            hot = self.hot.setdefault(channel_id, deque(maxlen=self.hot_size))
+            if hot and hot[-1]["seq"] >= seq:
+                return seq  # a replica that loaded the record from disk before it came over the bus
+            if len(hot) == self.hot_size:
+                self.hot_evictions += 1  # oldest hot record now only lives on disk
+            hot.append(record)
+            self.next_seq[channel_id] = seq + 1
+        return seq
+
+    def count(self, channel_id):
+        return self.next_seq.get(channel_id, 0)
+
+    def channel_ids(self):
+        return list(self.next_seq)
+
+    def read(self, channel_id, start, stop):
+        """Return the records with start <= seq < stop from the hot tier and cold pages."""
+        with self.lock:
+            hot = list(self.hot.get(channel_id, ()))
+        hot_first = hot[0]["seq"] if hot else self.count(channel_id)
+        records = []
+        if start < hot_first:
+            cold_stop = min(stop, hot_first)
+            for page in range(start // self.page_size, (cold_stop - 1) // self.page_size + 1):
+                for record in self._cold_page(channel_id, page):
+                    if start <= record["seq"] < cold_stop:
+                        records.append(record)
+        if stop > hot_first:
+            with self.lock:
+                self.hot_hits += 1
+            records.extend(self._hot_range(hot, hot_first, max(start, hot_first), stop))
+        return records
+
+    @staticmethod
+    def _hot_range(hot, hot_first, start, stop):
+        """Return the hot records with start <= seq < stop; hot is sorted by seq."""
+        records = hot[start - hot_first:stop - hot_first]
+        if records and records[0]["seq"] == start and records[-1]["seq"] == start + len(records) - 1:
+            return records
+        # A seq is missing (e.g. a torn record skipped during recovery): look the range up by seq
+        seqs = [record["seq"] for record in hot]
+        return hot[bisect.bisect_left(seqs, start):bisect.bisect_left(seqs, stop)]
+
+    def _cold_page(self, channel_id, page):
+        key = (channel_id, page)
+        with self.lock:
+            records = self.cold_pages.get(key)
+            if records is not None:
+                self.cold_pages.move_to_end(key)
+                self.cold_hits += 1
+                return records
+            self.cold_misses += 1
+        records = self.backend.read_range(channel_id, page * self.page_size, (page + 1) * self.page_size)
+        if len(records) < self.page_size:
+            return records  # the channel's last page is still filling up; only cache complete pages
+        with self.lock:
+            self.cold_pages[key] = records
+            while len(self.cold_pages) > self.cache_pages:
+                self.cold_pages.popitem(last=False)
+                self.page_evictions += 1
+        return records
+
+    def page(self, channel_id, before=None, after=None, limit=50):
+        """Return (records, has_older, has_newer) for up to limit messages with after < seq < before.
+
+        With only after set the page starts right after it; otherwise it ends right
+        before before (or at the newest message).
+        """
+        end_seq = self.count(channel_id)
+        low = 0 if after is None else max(0, after + 1)
+        high = end_seq if before is None else min(end_seq, before)
+        if after is not None and before is None:
+            start, stop = low, min(high, low + limit)
+        else:
+            start, stop = max(low, high - limit), high
+        if start >= stop:
+            return [], min(start, stop) > 0, max(start, stop) < end_seq
+        return self.read(channel_id, start, stop), start > 0, stop < end_seq
+
+    def stats(self):
+        with self.lock:
+            return {
+                "channels": len(self.hot),
+                "hot_records": sum(len(hot) for hot in self.hot.values()),
+                "cold_pages": len(self.cold_pages),
+                "cold_records": sum(len(records) for records in self.cold_pages.values()),
+                "hot_hits": self.hot_hits,
+                "cold_hits": self.cold_hits,
+                "cold_misses": self.cold_misses,
+                "hot_evictions": self.hot_evictions,
+                "page_evictions": self.page_evictions,
+            }
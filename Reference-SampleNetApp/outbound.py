@@ -0,0 +1,93 @@
+import threading
+from collections import deque
+
+# What to do when a client's outbound queue is full:
+#   drop_oldest_presence - discard the oldest queued presence (STATUS) frame to make room;
+#                          if none is queued the client is too far behind and is disconnected
+#   disconnect           - disconnect the slow client straight away
+OVERFLOW_POLICIES = ("drop_oldest_presence", "disconnect")
+
+
+class OutboundQueue:
+    """Bounded queue of encoded frames waiting to be written to one client.
+
+    Producers (handlers, broadcasts) only append to the queue; a writer drains it,
+    so a client whose TCP buffer is full can no longer stall the sender.
+    on_ready() is called whenever the writer has something new to do.
+    """
+    def __init__(self, max_frames, policy="drop_oldest_presence", on_ready=None):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy!r}, expected one of {OVERFLOW_POLICIES}")
+        self.max_frames = max_frames
+        self.policy = policy
+        self.on_ready = on_ready
+        self.frames = deque()  # (frame, is_presence)
+        self.cond = threading.Condition()
+        self.closed = False
+        self.overflowed = False
+        self.dropped = 0
+        self.sent = 0
+        self.max_depth = 0
+
+    def put(self, frame, presence=False):
+        """Queue a frame; returns False if it was dropped or the client must be disconnected."""
+        with self.cond:
+            if self.closed or self.overflowed:
+                return False
+            if len(self.frames) >= self.max_frames and not self._make_room():
+                self.overflowed = True
+                self.cond.notify()
+            else:
+                self.frames.append((frame, presence))
+                self.max_depth = max(self.max_depth, len(self.frames))
+                self.cond.notify()
+        if self.on_ready:
+            self.on_ready()
+        return not self.overflowed
+
+    def _make_room(self):
+        if self.policy == "drop_oldest_presence":
+            for index, (_, is_presence) in enumerate(self.frames):
+                if is_presence:
+                    del self.frames[index]
+                    self.dropped += 1
+                    return True
+        return False
+
+    def take(self, max_bytes=65536, timeout=None):
+        """Pop queued frames (up to about max_bytes) joined into one buffer.
+
+        With a timeout of None this returns immediately; otherwise it waits up to
+        timeout seconds for data. Returns b"" when nothing is queued.
+        """
+        with self.cond:
+            if timeout is not None and not self.frames and not self.closed and not self.overflowed:
+                self.cond.wait(timeout)
+            chunks = []
+            size = 0
+            while self.frames and (not chunks or size + len(self.frames[0][0]) <= max_bytes):
+                frame, _ = self.frames.popleft()
+                chunks.append(frame)
+                size += len(frame)
+            self.sent += len(chunks)
+            return b"".join(chunks)
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.frames.clear()
+            self.cond.notify_all()
+
+    @property
+    def depth(self):
+        return len(self.frames)
+
+    def stats(self):
+        with self.cond:
+            return {
+                "depth": len(self.frames),
+                "max_depth": self.max_depth,
+                "dropped": self.dropped,
+                "sent": self.sent,
+                "overflowed": self.overflowed,
+            }
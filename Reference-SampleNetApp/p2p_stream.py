@@ -59,7 +59,7 @@ class P2PStream:
             logging.info(f"[P2PStream] Server socket is listening at {self.server_socket.getsockname()}")
 
             msg = f"START_STREAM {self.user_id} {self.channel_id} {host} {self.stream_port}"
-            self.conn.sendall(msg.encode())
+            self.conn.send_command(msg)
             logging.info(f"[P2PStream] Sent START_STREAM for user {self.user_id}")
 
             self.stream_thread = threading.Thread(target=self.stream_video, daemon=True)
@@ -187,7 +187,7 @@ class P2PStream:
         # Send STOP_STREAM message
         try:
             msg = f"STOP_STREAM {self.user_id} {self.channel_id}"
-            self.conn.sendall(msg.encode())
+            self.conn.send_command(msg)
             logging.info(f"[P2PStream] Sent STOP_STREAM for user {self.user_id}")
         except Exception as e:
             logging.error(f"[P2PStream] Error sending STOP_STREAM: {e}")
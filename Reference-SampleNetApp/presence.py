@@ -0,0 +1,59 @@
+import time
+
+from delayed_flush import DelayedFlush
+
+
+class PresenceAggregator(DelayedFlush):
+    """Coalesces status changes per user and hands them out in periodic batches.
+
+    update() only records the latest status of a user, together with the sessions
+    that should see it (the union over every coalesced change, taken when each
+    change happened, so a visitor's Offline still reaches the channels they just
+    left). A background thread calls deliver_fn({user_id: (status, audience)})
+    once the oldest pending change is delay (the presence window) seconds old, so
+    a user who flips status or reconnects ten times within a window produces one
+    update. With a delay of 0 every update is delivered synchronously. flush()
+    delivers pending updates immediately.
+    """
+    def __init__(self, deliver_fn, window=0.25):
+        super().__init__("presence", window)
+        self.deliver_fn = deliver_fn
+        self.pending = {}  # {user_id: (latest status, set of sessions to tell)}
+        self.updates = 0
+        self.coalesced = 0
+
+    def update(self, user_id, status, audience):
+        with self.cond:
+            self.updates += 1
+            if user_id in self.pending:
+                self.coalesced += 1  # the earlier status never goes out
+                audience = self.pending[user_id][1] | audience
+            self.pending[user_id] = (status, audience)
+            flush_now = self.schedule()
+        if flush_now:
+            self.flush()
+
+    def take(self):
+        pending, self.pending = self.pending, {}
+        return pending
+
+    def write(self, pending):
+        try:
+            self.deliver_fn(pending)
+        except Exception as e:
+            # keep the batch for the retry; a status that came in since is newer and wins
+            with self.cond:
+                for user_id, (status, audience) in pending.items():
+                    if user_id in self.pending:
+                        status, newer_audience = self.pending[user_id]
+                        audience = audience | newer_audience
+                    self.pending[user_id] = (status, audience)
+                self.pending_since = self.pending_since or time.monotonic()
+            print(f"[Server] Error delivering {len(pending)} presence updates, will retry: {e}")
+            return False
+        return True
+
+    def stats(self):
+        with self.cond:
+            return {"updates": self.updates, "coalesced": self.coalesced, "flushes": self.flushes,
+                    "pending": len(self.pending)}
@@ -1,8 +1,31 @@
 import socket
+import selectors
+import argparse
+import threading
 from threading import Thread
 from peer_manager import PeerManager
+from framing import FrameDecoder, encode_frame, encode_frames
+from command_registry import CommandRegistry
+from outbound import OutboundQueue, OVERFLOW_POLICIES
+from message_log import MessageLog, ReplicaMessageLog
+from message_store import TieredMessageStore
+from sqlite_store import SqliteStore
+from connection_logger import ConnectionLogger
+from write_behind import WriteBehind, write_json_atomic
+from presence import PresenceAggregator
+from session_resume import ResumeRegistry
+from state_locks import StripedLock
+from state_bus import BusHub, StateBus
+import itertools
 import json
 import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import atexit
+import signal
 from datetime import datetime
 
 # Initialize peer tracker
@@ -10,69 +33,43 @@ peer_manager = PeerManager()
 
 USER_DB_FILE = 'users.json'
 CHANNEL_DB_FILE = 'channels.json'
-MESSAGE_DB_FILE = 'messages.json'
+MESSAGE_DB_FILE = 'messages.json'  # legacy single-file store, imported into the message log once
+MESSAGE_LOG_DIR = 'message_log'
+MESSAGE_LOG_COMPACT_INTERVAL = 600  # seconds between background compactions of the message log
+SQLITE_DB_FILE = 'segment_chat.db'  # used with --storage sqlite
+MESSAGE_PAGE_DEFAULT = 50  # messages per GET_MESSAGES_PAGE response unless limit= is given
+MESSAGE_PAGE_MAX = 500
+MESSAGE_HOT_SIZE = 200  # newest messages per channel kept in memory
+MESSAGE_COLD_PAGE_SIZE = 100  # messages per page read from disk for older history
+MESSAGE_COLD_CACHE_PAGES = 64  # cold pages kept in the LRU cache
+PERSIST_MAX_STALENESS = 1.0  # seconds a users/channels change may wait before it is written (0 = write-through)
 LOG_FILE = 'connection_log.txt'
-MAX_LOG_RECORDS = 10000
+MAX_LOG_BYTES = 2 * 1024 * 1024  # rotate connection_log.txt at this size
+LOG_FLUSH_INTERVAL = 0.5  # seconds a connection log record may sit in the writer's buffer
+PRESENCE_WINDOW = 0.25  # seconds status changes are coalesced per user before going out (0 = send immediately)
+RESUME_GRACE_PERIOD = 30.0  # seconds a dropped session keeps its memberships and can be resumed (0 = clean up at once)
+RESUME_BUFFER_SIZE = 1000  # events kept per session for replay on RESUME
+LOCK_STRIPES = 64  # locks shared out over channel IDs and over user IDs
+WORKER_COUNT = 1  # --workers: server processes sharing the port; worker 0 owns the files
+WORKER_INDEX = 0
+LOG_LEVEL = "info"  # info: one NOTIFICATION_FANOUT record per broadcast; debug: also one NOTIFICATION_SENT per recipient
+EVENT_LOOP_BACKLOG = 1024
+RECV_BUFFER_SIZE = 65536
+OUTBOUND_QUEUE_SIZE = 1000  # frames buffered per client before the overflow policy applies
+OUTBOUND_OVERFLOW_POLICY = "drop_oldest_presence"
 
-# Initialize log record counter
-log_record_count = 0
-
-def initialize_log():
-    """Initialize the log file and count existing records if the file exists."""
-    global log_record_count
-    if os.path.exists(LOG_FILE):
-        try:
-            with open(LOG_FILE, 'r') as f:
-                log_record_count = sum(1 for _ in f)
-            print(f"[Server] Log file {LOG_FILE} exists with {log_record_count} records.")
-        except Exception as e:
-            print(f"[Server] Error reading log file {LOG_FILE}: {e}. Starting with empty log.")
-            log_record_count = 0
-            with open(LOG_FILE, 'w') as f:
-                pass  # Create an empty log file
-    else:
-        print(f"[Server] Creating new log file {LOG_FILE}.")
-        with open(LOG_FILE, 'w') as f:
-            pass  # Create an empty log file
-        log_record_count = 0
-
-def rotate_log_file():
-    """Rotate the log file if it exceeds MAX_LOG_RECORDS."""
-    global log_record_count
-    if log_record_count >= MAX_LOG_RECORDS:
-        print(f"[Server] Log file {LOG_FILE} has reached {log_record_count} records. Rotating log file.")
-        # Backup the current log file with a timestamp
-        timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        backup_file = f"connection_log_{timestamp}.txt"
-        try:
-            os.rename(LOG_FILE, backup_file)
-            print(f"[Server] Backed up log file to {backup_file}.")
-        except Exception as e:
-            print(f"[Server] Error backing up log file to {backup_file}: {e}.")
-        # Create a new empty log file
-        with open(LOG_FILE, 'w') as f:
-            pass
-        log_record_count = 0
-        print(f"[Server] Created new log file {LOG_FILE}.")
+connection_logger = ConnectionLogger(LOG_FILE, MAX_LOG_BYTES, LOG_FLUSH_INTERVAL)
+bus_event = threading.local()  # --workers: remote (another worker's client caused it) and the changes worker 0 is recording
 
 def log_connection(event_type, source, details):
-    """Log a connection event to the log file."""
-    global log_record_count
-    timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"[{timestamp}] {event_type} | Source: {source} | Details: {details}\n"
-    
-    # Rotate log file if necessary
-    rotate_log_file()
-    
-    try:
-        with open(LOG_FILE, 'a') as f:
-            f.write(log_entry)
-        log_record_count += 1
-        print(f"[Server] Logged: {log_entry.strip()}")
-    except Exception as e:
-        print(f"[Server] Error writing to log file {LOG_FILE}: {e}")
+    """Log a connection event; the background connection_logger writes it to LOG_FILE."""
+    if getattr(bus_event, "remote", False) and not event_type.startswith("NOTIFICATION_"):
+        return  # a change caused by another worker's client, which logs it; deliveries here are still ours
+    connection_logger.log(event_type, source, details)
 
 def load_users():
+    if storage is not None:
+        return storage.load_users()
     if os.path.exists(USER_DB_FILE):
         if os.path.getsize(USER_DB_FILE) == 0:
             print(f"[Server] Warning: {USER_DB_FILE} is empty. Initializing with empty dictionary.")
@@ -87,12 +84,30 @@ def load_users():
         print(f"[Server] {USER_DB_FILE} not found. Starting with empty dictionary.")
         return {"users": {}, "next_user_id": 1}
 
-def save_users():
-    with open(USER_DB_FILE, 'w') as f:
-        json.dump(user_db, f)
+def save_users(*usernames):
+    """Mark the given users (none: only the ID counter) dirty; users_writer flushes them within PERSIST_MAX_STALENESS."""
+    if WORKER_INDEX == 0:
+        users_writer.mark_dirty(*usernames)
+
+def user_db_snapshot(usernames=None):
+    """A copy of the user database (or of the given users) that registrations and logins cannot change while it is written."""
+    with id_lock:
+        names = users.keys() if usernames is None else [name for name in usernames if name in users]
+        return {"users": {username: dict(users[username]) for username in names}, "next_user_id": next_user_id}
+
+def write_users(usernames):
+    if storage is not None:
+        # Only the users changed since the last flush; the JSON file is always written whole
+        storage.save_users(user_db_snapshot(usernames))
+        print(f"[Server] Saved {len(usernames)} users to {storage.path}")
+        return
+    snapshot = user_db_snapshot()
+    write_json_atomic(USER_DB_FILE, snapshot)
     print(f"[Server] Saved users to {USER_DB_FILE}")
 
 def load_channels():
+    if storage is not None:
+        return storage.load_channels()
     if os.path.exists(CHANNEL_DB_FILE):
         if os.path.getsize(CHANNEL_DB_FILE) == 0:
             print(f"[Server] Warning: {CHANNEL_DB_FILE} is empty. Initializing with empty dictionary.")
@@ -107,11 +122,36 @@ def load_channels():
         print(f"[Server] {CHANNEL_DB_FILE} not found. Starting with empty dictionary.")
         return {"channels": {}, "next_id": 1}
 
-def save_channels():
-    with open(CHANNEL_DB_FILE, 'w') as f:
-        json.dump(channel_db, f)
+def save_channels(*channel_ids):
+    """Mark the given channels dirty; channels_writer flushes them within PERSIST_MAX_STALENESS."""
+    if WORKER_INDEX == 0:
+        channels_writer.mark_dirty(*channel_ids)
+
+def channel_db_snapshot(channel_ids=None):
+    """The channel database (or the given channels) as stored: member sets become lists, in join order."""
+    current = channels
+    ids = current.keys() if channel_ids is None else [channel_id for channel_id in channel_ids if channel_id in current]
+    return {"channels": {channel_id: dict(current[channel_id], members=list(current[channel_id]["members"]))
+                         for channel_id in ids},
+            "next_id": channel_id_counter}
+
+def write_channels(channel_ids):
+    if storage is not None:
+        storage.save_channels(channel_db_snapshot(channel_ids))
+        print(f"[Server] Saved {len(channel_ids)} channels to {storage.path}")
+        return
+    snapshot = channel_db_snapshot()
+    write_json_atomic(CHANNEL_DB_FILE, snapshot)
     print(f"[Server] Saved channels to {CHANNEL_DB_FILE}")
 
+users_writer = WriteBehind("users", write_users, PERSIST_MAX_STALENESS)
+channels_writer = WriteBehind("channels", write_channels, PERSIST_MAX_STALENESS)
+
+def flush_state():
+    """Write any pending users/channels changes now (called on shutdown)."""
+    users_writer.flush()
+    channels_writer.flush()
+
 def load_messages():
     if os.path.exists(MESSAGE_DB_FILE):
         if os.path.getsize(MESSAGE_DB_FILE) == 0:
@@ -127,49 +167,262 @@ def load_messages():
         print(f"[Server] {MESSAGE_DB_FILE} not found. Starting with empty dictionary.")
         return {"messages": {}}
 
-def save_messages():
-    with open(MESSAGE_DB_FILE, 'w') as f:
-        json.dump(message_db, f)
-    print(f"[Server] Saved messages to {MESSAGE_DB_FILE}")
+def import_legacy_messages(log):
+    """Copy messages.json into an empty message log (the first start after the switch to the log)."""
+    if log.channel_ids():
+        return
+    legacy_messages = load_messages()["messages"]
+    for channel_id, channel_messages in legacy_messages.items():
+        for msg in channel_messages:
+            log.append(channel_id, msg)
+    if legacy_messages:
+        print(f"[Server] Imported {sum(len(m) for m in legacy_messages.values())} messages from {MESSAGE_DB_FILE} into {MESSAGE_LOG_DIR}/")
+
+def load_message_history():
+    """Open the tiered message store over the active backend, importing messages.json the first time."""
+    if storage is None and WORKER_INDEX == 0:
+        import_legacy_messages(message_log)
+    store = TieredMessageStore(message_log, MESSAGE_HOT_SIZE, MESSAGE_COLD_PAGE_SIZE, MESSAGE_COLD_CACHE_PAGES)
+    store.load()
+    channel_ids = store.channel_ids()
+    print(f"[Server] Indexed {sum(store.count(cid) for cid in channel_ids)} messages in {len(channel_ids)} channels "
+          f"from {storage.path if storage is not None else MESSAGE_LOG_DIR + '/'}, newest {MESSAGE_HOT_SIZE} per channel in memory")
+    return store
+
+def compact_message_log_periodically():
+    """Background thread: merge small closed message log segments."""
+    while True:
+        time.sleep(MESSAGE_LOG_COMPACT_INTERVAL)
+        try:
+            removed = message_log.compact_all()
+            if removed:
+                print(f"[Server] Compacted message log, removed {removed} segments")
+        except Exception as e:
+            print(f"[Server] Error compacting message log: {e}")
+
+def start_background_tasks():
+    Thread(target=compact_message_log_periodically, daemon=True).start()
+    Thread(target=expire_detached_sessions, daemon=True).start()
+
+storage = None  # SqliteStore with --storage sqlite; None keeps the JSON files and message log
+
+def load_state():
+    """(Re)load users, channels and message history from the active storage backend."""
+    global user_db, users, next_user_id, channel_db, channels, channel_id_counter, message_log, message_store
+    user_db = load_users()
+    users = user_db["users"]
+    next_user_id = user_db["next_user_id"]
 
-user_db = load_users()
-users = user_db["users"]
-next_user_id = user_db["next_user_id"]
+    channel_db = load_channels()
+    channels = channel_db["channels"]
+    channel_id_counter = channel_db["next_id"]
+    for channel in channels.values():
+        channel["members"] = dict.fromkeys(channel["members"])
+    rebuild_membership_index()
 
-channel_db = load_channels()
-channels = channel_db["channels"]
-channel_id_counter = channel_db["next_id"]
+    if storage is not None:
+        message_log = storage
+    else:
+        # Workers other than 0 only read the log worker 0 appends to
+        message_log = (ReplicaMessageLog if WORKER_INDEX else MessageLog)(MESSAGE_LOG_DIR)
+    message_store = load_message_history()
+    rebuild_user_indexes()
+
+# channel["members"] is a dict used as an insertion-ordered set ({user_id: None}): membership
+# checks are O(1) and join order is kept for GET_CHANNELS and the files. Like the member
+# lists before it, it is replaced on every change (copy-on-write), never changed in place.
+user_channels = {}  # {user_id: frozenset(channel_id)} the channels each user is a member of
+
+def rebuild_membership_index():
+    """Rebuild user_channels from the loaded channels."""
+    user_channels.clear()
+    for channel_id, channel in channels.items():
+        for user_id in channel["members"]:
+            user_channels[user_id] = user_channels.get(user_id, frozenset()) | {channel_id}
+
+def add_member(channel_id, user_id):
+    """Make user_id a member of channel_id (holding the channel's stripe)."""
+    channel = channels[channel_id]
+    channel["members"] = {**channel["members"], user_id: None}
+    with user_locks.hold(user_id):
+        user_channels[user_id] = user_channels.get(user_id, frozenset()) | {channel_id}
+
+def remove_member(channel_id, user_id):
+    """Take user_id out of channel_id (holding the channel's stripe)."""
+    channel = channels[channel_id]
+    members = dict(channel["members"])
+    members.pop(user_id, None)
+    channel["members"] = members
+    with user_locks.hold(user_id):
+        remaining = user_channels.get(user_id, frozenset()) - {channel_id}
+        if remaining:
+            user_channels[user_id] = remaining
+        else:
+            user_channels.pop(user_id, None)
+
+def json_message_history():
+    """{channel_id: [records]} of the JSON backend: the message log, or messages.json if there is none."""
+    if os.path.isdir(MESSAGE_LOG_DIR):
+        log = MessageLog(MESSAGE_LOG_DIR)
+        try:
+            return log.load_all()
+        finally:
+            log.close()
+    return {channel_id: [dict(record, seq=seq) for seq, record in enumerate(records)]
+            for channel_id, records in load_messages()["messages"].items()}
 
-message_db = load_messages()
-messages = message_db["messages"]
+def use_sqlite_storage(path):
+    """Use the SQLite backend (before load_state), migrating the JSON state into it the first time."""
+    global storage
+    store = SqliteStore(path)
+    if store.is_empty():
+        user_data, channel_data, history = load_users(), load_channels(), json_message_history()
+        store.import_state(user_data, channel_data, history)
+        print(f"[Server] Migrated {len(user_data['users'])} users, {len(channel_data['channels'])} channels and "
+              f"{sum(len(m) for m in history.values())} messages from JSON into {path}")
+    storage = store
 
-connected_clients = []
+message_log = None
+
+# Serialized GET_CHANNELS response, rebuilt lazily after channels_changed()
+# Starts from the clock so versions held by clients never repeat after a server restart
+channels_version = time.time_ns() // 1000  # bumped on every create/join/leave
+channels_snapshot = None  # (channels_version, cached response), None when stale
+channel_lines = {}  # {channel_id: serialized CHANNEL line} for channels unchanged since last render
+channels_snapshot_lock = threading.Lock()
+
+# Shared state is changed under the stripe of the channel or user it belongs to, so handlers
+# working on different channels or users do not wait for each other. Containers that are
+# read on hot paths (channels, member lists, connected_clients, the delivery indexes) are
+# copy-on-write: writers publish a new object, so readers iterate them without a lock.
+channel_locks = StripedLock("channels", LOCK_STRIPES)  # channel membership, streams and message order
+user_locks = StripedLock("users", LOCK_STRIPES)  # status and live sessions of one user
+id_lock = threading.RLock()  # user/channel ID counters, usernames and visitor names
+clients_lock = threading.Lock()  # replacing connected_clients
+
+connected_clients = []  # logged-in ClientSessions, copy-on-write
+open_sessions = {}  # {conn: ClientSession} every accepted connection, logged in or not
 visitor_ids = {}
 visitor_statuses = {}  # New dictionary to track visitor statuses
 livestreamers = {}  # {channel_id: (user_id, ip, port)} to track active livestreamers
 
+# Reverse indexes kept in sync with users/visitor_ids so hot-path lookups are O(1)
+user_id_to_username = {}  # {user_id: username} for registered users
+visitor_id_to_name = {}  # {visitor_id: name}
+client_addr_to_username = {}  # {"ip:port": username} for logged-in users
+
+def rebuild_user_indexes():
+    """Rebuild the reverse indexes from the loaded user database."""
+    user_id_to_username.clear()
+    client_addr_to_username.clear()
+    for username, info in users.items():
+        user_id_to_username[info["user_id"]] = username
+        if "client_addr" in info:
+            client_addr_to_username[info["client_addr"]] = username
+
+if __name__ != "__main__":
+    # Imported (benchmarks, tools): the JSON files. Run as the server, the state is loaded
+    # once the command line has chosen the storage backend.
+    load_state()
+
+def add_connected_client(session):
+    global connected_clients
+    with clients_lock:
+        connected_clients = connected_clients + [session]
+
+def replace_connected_client(old, new):
+    """Put new in old's place (RESUME), or append it if old is already gone."""
+    global connected_clients
+    with clients_lock:
+        clients = [new if session is old else session for session in connected_clients]
+        if old not in connected_clients:
+            clients.append(new)
+        connected_clients = clients
+
+def remove_connected_client(session):
+    """Drop a session from connected_clients; False if it was not there."""
+    global connected_clients
+    with clients_lock:
+        if session not in connected_clients:
+            return False
+        connected_clients = [other for other in connected_clients if other is not session]
+        return True
+
+# Live delivery indexes: only sessions that are connected right now. The values are
+# frozensets replaced under the user's or channel's stripe, so broadcasts use them as is.
+user_sessions = {}  # {user_id: frozenset(ClientSession)} a user may be logged in from several clients
+channel_sessions = {}  # {channel_id: frozenset(ClientSession)} connected members of each channel
+
+def index_session(session):
+    """Make a logged-in session reachable through the live delivery indexes."""
+    with user_locks.hold(session.user_id):
+        user_sessions[session.user_id] = user_sessions.get(session.user_id, frozenset()) | {session}
+    # After publishing the session: a concurrent join either sees it or is seen here
+    for channel_id in user_channels.get(session.user_id, ()):
+        with channel_locks.hold(channel_id):
+            if session.user_id in channels[channel_id]["members"]:  # not left since user_channels was read
+                channel_sessions[channel_id] = channel_sessions.get(channel_id, frozenset()) | {session}
+
+def unindex_session(session):
+    """Drop a disconnecting session from the live delivery indexes."""
+    with user_locks.hold(session.user_id):
+        sessions = user_sessions.get(session.user_id, frozenset()) - {session}
+        if sessions:
+            user_sessions[session.user_id] = sessions
+        else:
+            user_sessions.pop(session.user_id, None)
+    # Only the user's own channels: a leave takes every session of the user out of the channel it leaves
+    for channel_id in user_channels.get(session.user_id, ()):
+        with channel_locks.hold(channel_id):
+            members = channel_sessions.get(channel_id, frozenset()) - {session}
+            if members:
+                channel_sessions[channel_id] = members
+            else:
+                channel_sessions.pop(channel_id, None)
+
+def add_member_sessions(channel_id, user_id):
+    """A user joined or created a channel: start delivering its traffic to their sessions (holding the channel's stripe)."""
+    sessions = user_sessions.get(user_id)
+    if sessions:
+        channel_sessions[channel_id] = channel_sessions.get(channel_id, frozenset()) | sessions
+
+def remove_member_sessions(channel_id, user_id):
+    """A user left a channel: stop delivering its traffic to their sessions (holding the channel's stripe).
+
+    Matched by user_id rather than through user_sessions, so a session that is being
+    unindexed concurrently does not stay behind in the channel it just left.
+    """
+    members = channel_sessions.get(channel_id)
+    if members is None:
+        return
+    members = frozenset(session for session in members if session.user_id != user_id)
+    if members:
+        channel_sessions[channel_id] = members
+    else:
+        channel_sessions.pop(channel_id, None)
+
 # Initialize the log file at server startup
-initialize_log()
+connection_logger.start()
 
 def get_user_id_by_username(username, is_visitor=False):
     if is_visitor:
         return visitor_ids.get(username)
-    for user, info in users.items():
-        if user == username:
-            return info["user_id"]
+    if username in users:
+        return users[username]["user_id"]
     return None
 
 def get_username_by_user_id(user_id):
-    for username, info in users.items():
-        if info["user_id"] == user_id:
-            return username
-    for username, vid in visitor_ids.items():
-        if vid == user_id:
-            return username
-    return None
+    username = user_id_to_username.get(user_id)
+    if username is not None:
+        return username
+    return visitor_id_to_name.get(user_id)
 
 def is_visitor(user_id):
-    return user_id in visitor_ids.values()
+    return user_id in visitor_id_to_name
+
+def member_kind(user_id):
+    """How a channel member is listed: GET_CHANNELS keeps visitors and regular members apart."""
+    return "visitor" if is_visitor(user_id) else "regular"
 
 def get_status(user_id):
     username = get_username_by_user_id(user_id)
@@ -179,128 +432,387 @@ def get_status(user_id):
         return visitor_statuses[user_id]
     return "Offline"
 
-def broadcast(message, exclude_conn=None):
+def log_fanout(scope, message, frame, recipients, failed):
+    """Log one NOTIFICATION_FANOUT record for a broadcast; per-recipient records only at LOG_LEVEL debug."""
+    if not recipients:
+        return
+    delivered = len(recipients) - len(failed)
+    failures = f" ({', '.join(failed)})" if failed else ""
+    log_connection("NOTIFICATION_FANOUT", "Centralized Server",
+                   f"Broadcast to {scope}: recipients={len(recipients)} bytes={delivered * len(frame)} failed={len(failed)}{failures}: {message}")
+    if LOG_LEVEL == "debug":
+        for username in recipients:
+            if username not in failed:
+                log_connection("NOTIFICATION_SENT", "Centralized Server", f"Broadcasted message to {username} ({scope}): {message}")
+
+resume_registry = ResumeRegistry(RESUME_GRACE_PERIOD, RESUME_BUFFER_SIZE)
+
+# Pushed events carry a server-wide sequence number so a resumed client can say what it last saw
+event_seq = itertools.count(1)
+
+def encode_event(message):
+    """Return (seq, frame) for a pushed event: an EVENT <seq> line followed by the message."""
+    seq = next(event_seq)
+    return seq, encode_frame(f"EVENT {seq}\n{message}")
+
+def broadcast(message, exclude_conn=None, presence=False):
     print(f"[Server] Broadcasting message: {message}")
-    for client_conn, _, client_username, _ in connected_clients:
-        if client_conn != exclude_conn:
-            try:
-                client_conn.sendall(f"{message}\n".encode())
-                # Log the broadcast notification
-                log_connection("NOTIFICATION_SENT", "Centralized Server", f"Broadcasted message to {client_username}: {message}")
-            except Exception as e:
-                print(f"[Server] Failed to send message to {client_username}: {e}")
+    seq, frame = encode_event(message)
+    recipients = []
+    failed = []
+    for session in connected_clients:
+        if session.conn != exclude_conn:
+            recipients.append(session.username)
+            if not session.send_event(seq, frame, presence):
+                failed.append(session.username)
+                print(f"[Server] Failed to queue message for {session.username}: outbound queue full")
+    log_fanout("all clients", message, frame, recipients, failed)
 
 def broadcast_to_channel(channel_id, message, exclude_conn=None):
     if channel_id not in channels:
         return
-    members = channels[channel_id]["members"]
-    print(f"[Server] Broadcasting to channel {channel_id} (members: {members}): {message}")
-    for client_conn, _, client_username, client_user_id in connected_clients:
-        if exclude_conn and client_conn == exclude_conn:
+    sessions = channel_sessions.get(channel_id, ())  # a frozenset, replaced rather than changed by joins and leaves
+    print(f"[Server] Broadcasting to channel {channel_id} ({len(sessions)} connected members): {message}")
+    seq, frame = encode_event(message)
+    recipients = []
+    failed = []
+    for session in sessions:
+        if exclude_conn and session.conn == exclude_conn:
             continue
-        if client_user_id in members:
-            try:
-                client_conn.sendall(f"{message}\n".encode())
-                # Log the broadcast notification to the channel
-                log_connection("NOTIFICATION_SENT", "Centralized Server", f"Broadcasted message to {client_username} in channel {channel_id}: {message}")
-            except Exception as e:
-                print(f"[Server] Failed to send message to {client_username} in channel {channel_id}: {e}")
+        recipients.append(session.username)
+        if not session.send_event(seq, frame):
+            failed.append(session.username)
+            print(f"[Server] Failed to queue message for {session.username} in channel {channel_id}: outbound queue full")
+    log_fanout(f"channel {channel_id}", message, frame, recipients, failed)
 
-def handle_visitor(data, conn):
+# Presence routing counters: what was sent versus what a STATUS broadcast to everyone per change would cost
+presence_stats = {"deliveries": 0, "frames": 0, "naive_deliveries": 0}
+presence_stats_lock = threading.Lock()
+
+def presence_audience(user_id):
+    """Connected sessions that share at least one channel with user_id, plus the user's own sessions."""
+    audience = set(user_sessions.get(user_id, ()))
+    for channel_id in user_channels.get(user_id, ()):
+        audience.update(channel_sessions.get(channel_id, ()))
+    return audience
+
+def broadcast_presence(user_id, status, exclude_conn=None):
+    """Queue STATUS <user_id> <status> for the clients that can see user_id in one of their channels.
+
+    Clients that share no channel with the user never display their status, and
+    fetch it with GET_STATUSES when they join a channel with them. The change goes
+    through presence_aggregator, which keeps only the latest status per user within
+    PRESENCE_WINDOW and sends each client one frame per window.
+    """
+    audience = {session for session in presence_audience(user_id) if not (exclude_conn and session.conn == exclude_conn)}
+    # A broadcast reaches every logged-in session except the sender's
+    naive = len(connected_clients) - sum(1 for session in user_sessions.get(user_id, ()) if session.conn == exclude_conn)
+    with presence_stats_lock:
+        presence_stats["naive_deliveries"] += max(naive, 0)
+    print(f"[Server] Presence change STATUS {user_id} {status} for {len(audience)} sessions")
+    presence_aggregator.update(user_id, status, audience)
+
+def deliver_presence(pending):
+    """Send coalesced presence changes: one frame per session, STATUS_BATCH when it carries several."""
+    lines = {}  # {session: [STATUS lines]}
+    for user_id, (status, audience) in pending.items():
+        for session in audience:
+            lines.setdefault(session, []).append(f"STATUS {user_id} {status}")
+    recipients = []
+    failed = []
+    total_bytes = 0
+    for session, status_lines in lines.items():
+        if session.closed and not session.detached:
+            continue
+        if len(status_lines) == 1:
+            seq, frame = encode_event(status_lines[0])
+        else:
+            seq, frame = encode_event("\n".join([f"STATUS_BATCH {len(status_lines)}"] + status_lines))
+        recipients.append(session.username)
+        if session.send_event(seq, frame, presence=True):
+            total_bytes += len(frame)
+        else:
+            failed.append(session.username)
+            print(f"[Server] Failed to queue presence for {session.username}: outbound queue full")
+    with presence_stats_lock:
+        presence_stats["deliveries"] += sum(len(status_lines) for status_lines in lines.values())
+        presence_stats["frames"] += len(recipients)
+    if recipients:
+        failures = f" ({', '.join(failed)})" if failed else ""
+        log_connection("NOTIFICATION_FANOUT", "Centralized Server",
+                       f"Presence batch of {len(pending)} users: recipients={len(recipients)} bytes={total_bytes} "
+                       f"failed={len(failed)}{failures}")
+        if LOG_LEVEL == "debug":
+            for username in recipients:
+                if username not in failed:
+                    log_connection("NOTIFICATION_SENT", "Centralized Server", f"Sent presence batch to {username}")
+
+presence_aggregator = PresenceAggregator(deliver_presence, PRESENCE_WINDOW)
+
+def handle_get_presence_stats(data):
+    with presence_stats_lock:
+        stats = dict(presence_stats)
+    stats.update(presence_aggregator.stats())
+    naive = stats["naive_deliveries"]
+    saved = 100.0 * (naive - stats["frames"]) / naive if naive else 0.0
+    return (f"PRESENCE updates={stats['updates']} coalesced={stats['coalesced']} batches={stats['flushes']} "
+            f"deliveries={stats['deliveries']} frames={stats['frames']} naive_deliveries={naive} saved={saved:.1f}%")
+
+def commit(change, conn=None):
+    """Apply one state change here; while worker 0 runs a replicated action, also record it for the other workers.
+
+    conn is the connection of the client that caused the change, if it is connected
+    to this worker: it does not get the resulting event pushed, as its response says it.
+    """
+    apply_change(change, conn)
+    changes = getattr(bus_event, "changes", None)
+    if changes is not None:
+        changes.append(change)
+
+def apply_change(change, conn):
+    CHANGE_APPLIERS[change["op"]](change, conn)
+
+def apply_add_user(change, conn):
     global next_user_id
-    name = data.split()[1]
-    visitor_ids[name] = f"v{next_user_id}"
-    user_id = visitor_ids[name]
-    visitor_statuses[user_id] = "Online"  # Set visitor status to Online
-    next_user_id += 1
-    user_db["next_user_id"] = next_user_id
+    username, user_id = change["username"], change["user_id"]
+    with id_lock:
+        users[username] = {
+            "password": change["password"],
+            "status": "Offline",
+            "user_id": user_id
+        }
+        user_id_to_username[user_id] = username
+        next_user_id = max(next_user_id, int(user_id) + 1)
+        user_db["users"] = users
+        user_db["next_user_id"] = next_user_id
+    save_users(username)
+
+def apply_add_visitor(change, conn):
+    global next_user_id
+    name, user_id = change["name"], change["user_id"]
+    with id_lock:
+        visitor_statuses[user_id] = "Online"  # Set visitor status to Online
+        visitor_id_to_name[user_id] = name
+        visitor_ids[name] = user_id
+        next_user_id = max(next_user_id, int(user_id[1:]) + 1)
+        user_db["next_user_id"] = next_user_id
     save_users()
+    # A new visitor shares no channel yet, so this only counts towards the presence stats
+    broadcast_presence(user_id, "Online", exclude_conn=conn)
+
+def apply_forget_visitor(change, conn):
+    user_id = change["user_id"]
+    with user_locks.hold(user_id), id_lock:
+        visitor_name = visitor_id_to_name.pop(user_id, None)
+        # The name may since have been reused by a newer visitor
+        if visitor_name and visitor_ids.get(visitor_name) == user_id:
+            del visitor_ids[visitor_name]
+        visitor_statuses.pop(user_id, None)
+
+def apply_status(change, conn):
+    user_id, status = change["user_id"], change["status"]
+    with user_locks.hold(user_id):  # statuses of one user are applied and announced in order
+        if is_visitor(user_id):
+            visitor_statuses[user_id] = status
+        else:
+            username = get_username_by_user_id(user_id)
+            users[username]["status"] = status
+            save_users(username)
+        # Tell the clients that share a channel with this user
+        broadcast_presence(user_id, status, exclude_conn=conn)
+        if change.get("deliver_now"):
+            presence_aggregator.flush()
+
+def apply_client_addr(change, conn):
+    username, client_addr = change["username"], change["client_addr"]
+    users[username]["client_addr"] = client_addr
+    client_addr_to_username[client_addr] = username
+    save_users(username)
+
+def apply_forget_client_addr(change, conn):
+    username, client_addr = change["username"], change["client_addr"]
+    users[username].pop("client_addr", None)
+    if client_addr_to_username.get(client_addr) == username:
+        del client_addr_to_username[client_addr]
+    save_users(username)
+
+def apply_add_channel(change, conn):
+    global channel_id_counter, channels
+    channel_id, user_id, channel_name = change["channel_id"], change["host"], change["name"]
+    with id_lock:
+        channels = {**channels, channel_id: {
+            "name": channel_name,
+            "host": user_id,
+            "members": {user_id: None}
+        }}
+        channel_id_counter = max(channel_id_counter, int(channel_id) + 1)
+        channel_db["channels"] = channels
+        channel_db["next_id"] = channel_id_counter
+    with channel_locks.hold(channel_id):
+        add_member(channel_id, user_id)  # indexes the host in user_channels
+        save_channels(channel_id)
+        channels_changed(channel_id)
+        add_member_sessions(channel_id, user_id)
+        broadcast(f"CHANNEL_ADDED {channel_id} {user_id} {member_kind(user_id)} {channel_name}")
+
+def apply_join(change, conn):
+    channel_id, user_id = change["channel_id"], change["user_id"]
+    with channel_locks.hold(channel_id):
+        add_member(channel_id, user_id)
+        save_channels(channel_id)
+        channels_changed(channel_id)
+        add_member_sessions(channel_id, user_id)
+        broadcast(f"MEMBER_JOINED {channel_id} {user_id} {member_kind(user_id)}")
+
+def apply_leave(change, conn):
+    channel_id, user_id = change["channel_id"], change["user_id"]
+    with channel_locks.hold(channel_id):
+        remove_member(channel_id, user_id)
+        save_channels(channel_id)
+        channels_changed(channel_id)
+        remove_member_sessions(channel_id, user_id)
+        broadcast(f"MEMBER_LEFT {channel_id} {user_id}")
+
+def apply_message(change, conn):
+    channel_id, user_id, message, timestamp = change["channel_id"], change["user_id"], change["message"], change["timestamp"]
+    with channel_locks.hold(channel_id):  # messages of one channel get seqs and go out in the same order
+        record = {
+            "user_id": user_id,
+            "message": message,
+            "timestamp": timestamp,
+            "seq": change.get("seq")  # set when replayed from worker 0; otherwise the store assigns it
+        }
+        # Recorded in the change, so the other workers use worker 0's seq
+        change["seq"] = record["seq"] = message_store.append(channel_id, record)
+
+        # Determine the source of the message (Centralized Server or Channel Hosting)
+        source = "Centralized Server"
+        if channel_id in livestreamers:
+            streamer_id, _, _ = livestreamers[channel_id]
+            if user_id == streamer_id:
+                source = f"Channel Hosting (Streamer ID: {streamer_id})"
+
+        # Log the message with the source
+        log_connection("MESSAGE_SENT", source, f"User {user_id} sent message in channel {channel_id}: {message}")
+
+        broadcast_to_channel(channel_id, f"MESSAGE {channel_id} {user_id} {timestamp} | {message}")
+
+def apply_start_stream(change, conn):
+    channel_id, user_id, ip, port = change["channel_id"], change["user_id"], change["ip"], change["port"]
+    with channel_locks.hold(channel_id):
+        livestreamers[channel_id] = (user_id, ip, port)
+        set_stream_owner(user_id, channel_id, conn)
+        broadcast_to_channel(channel_id, f"LIVESTREAM_START {user_id} {channel_id} {ip} {port}", exclude_conn=conn)
+        # Log the stream start
+        log_connection("STREAM_START", "Centralized Server", f"User {user_id} started streaming in channel {channel_id} at {ip}:{port}")
+
+def apply_stop_stream(change, conn):
+    channel_id, user_id = change["channel_id"], change["user_id"]
+    with channel_locks.hold(channel_id):
+        del livestreamers[channel_id]
+        set_stream_owner(user_id, channel_id, None)
+        broadcast_to_channel(channel_id, f"LIVESTREAM_STOP {user_id} {channel_id}", exclude_conn=conn)
+        # Log the stream stop
+        log_connection("STREAM_STOP", "Centralized Server", f"User {user_id} stopped streaming in channel {channel_id}")
+
+def handle_visitor(data, conn):
+    name = data.split()[1]
+    with id_lock:
+        user_id = f"v{next_user_id}"
+        commit({"op": "add_visitor", "name": name, "user_id": user_id}, conn)
     print(f"[Server] Registered visitor {name} with ID {user_id}")
-    # Broadcast the visitor's status to other clients
-    broadcast(f"STATUS {user_id} Online", exclude_conn=conn)
     return f"WELCOME_VISITOR {name} {user_id}"
 
-def handle_login(data, conn):
+def handle_login(data, addr, conn=None):
     _, username, password = data.split()
     if username in users and users[username]["password"] == password:
         user_id = users[username]["user_id"]
-        current_status = users[username]["status"]
-        if current_status != "Invisible":
-            users[username]["status"] = "Online"
-            broadcast(f"STATUS {user_id} Online", exclude_conn=conn)
-        else:
-            print(f"[Server] Retaining Invisible status for {username} (ID: {user_id}) on login")
-        save_users()
+        with user_locks.hold(user_id):
+            current_status = users[username]["status"]
+            if current_status != "Invisible":
+                commit({"op": "status", "user_id": user_id, "status": "Online"}, conn)
+            else:
+                print(f"[Server] Retaining Invisible status for {username} (ID: {user_id}) on login")
+            if addr is not None:
+                # The address other clients reach this user's P2P stream on (GET_PEERS)
+                commit({"op": "client_addr", "username": username, "client_addr": f"{addr[0]}:{addr[1]}"}, conn)
         print(f"[Server] Login successful for {username} (ID: {user_id}), status: {users[username]['status']}")
         return f"LOGIN_SUCCESS {user_id}"
     print(f"[Server] Login failed for {username}")
     return "LOGIN_FAILED"
 
 def handle_register(data):
-    global next_user_id
     _, username, password = data.split()
-    if username in users:
-        print(f"[Server] Username {username} already taken")
-        return "USERNAME_TAKEN"
-    users[username] = {
-        "password": password,
-        "status": "Offline",
-        "user_id": str(next_user_id)
-    }
-    next_user_id += 1
-    user_db["users"] = users
-    user_db["next_user_id"] = next_user_id
-    save_users()
+    with id_lock:
+        if username in users:
+            print(f"[Server] Username {username} already taken")
+            return "USERNAME_TAKEN"
+        commit({"op": "add_user", "username": username, "password": password, "user_id": str(next_user_id)})
     print(f"[Server] Registered new user {username} with ID {users[username]['user_id']}")
     return "REGISTER_SUCCESS"
 
-def handle_get_username(data):
-    _, user_id = data.split()
+def username_line(user_id):
     username = get_username_by_user_id(user_id)
     if username:
-        print(f"[Server] Username request for user_id {user_id}: found username {username}")
         return f"USERNAME {user_id} {username}"
-    print(f"[Server] Username request for user_id {user_id}: not found")
     return f"USERNAME_NOT_FOUND {user_id}"
 
+def handle_get_username(data):
+    _, user_id = data.split()
+    response = username_line(user_id)
+    print(f"[Server] Username request for user_id {user_id}: {response}")
+    return response
+
+def handle_get_usernames(data):
+    """GET_USERNAMES <user_id> [<user_id> ...]: one USERNAME/USERNAME_NOT_FOUND line per ID."""
+    user_ids = data.split()[1:]
+    if not user_ids:
+        return "INVALID_COMMAND"
+    print(f"[Server] Username request for {len(user_ids)} user_ids")
+    return "\n".join(username_line(user_id) for user_id in user_ids)
+
 def handle_get_status(data):
     _, user_id = data.split()
     status = get_status(user_id)
     print(f"[Server] Status request for user_id {user_id}: {status}")
     return f"STATUS {user_id} {status}"
 
+def handle_get_statuses(data):
+    """GET_STATUSES <user_id> [<user_id> ...]: one STATUS line per ID."""
+    user_ids = data.split()[1:]
+    if not user_ids:
+        return "INVALID_COMMAND"
+    print(f"[Server] Status request for {len(user_ids)} user_ids")
+    return "\n".join(f"STATUS {user_id} {get_status(user_id)}" for user_id in user_ids)
+
 def handle_set_status(data, addr, conn):
     _, user_id, status = data.split()
-    username = get_username_by_user_id(user_id)
-    if is_visitor(user_id):
-        # Handle visitor status
-        if user_id in visitor_statuses:
-            if status in ["Online", "Offline", "Invisible"]:
-                visitor_statuses[user_id] = status
-                print(f"[Server] Set status of visitor {username} (ID: {user_id}) to {status}")
-                # Broadcast the status change to other clients
-                broadcast(f"STATUS {user_id} {status}", exclude_conn=conn)
-                return "STATUS_UPDATED"
-            else:
-                print(f"[Server] Invalid status {status} for visitor ID {user_id}")
-                return "INVALID_STATUS"
-        print(f"[Server] Visitor ID {user_id} not found for status update")
-        return "USER_NOT_FOUND"
-    else:
-        # Handle authenticated user status
-        if username and username in users:
-            if status in ["Online", "Offline", "Invisible"]:
-                users[username]["status"] = status
-                save_users()
-                print(f"[Server] Set status of {username} (ID: {user_id}) to {status}")
-                # Broadcast the status change to other clients
-                broadcast(f"STATUS {user_id} {status}", exclude_conn=conn)
-                return "STATUS_UPDATED"
-            else:
-                print(f"[Server] Invalid status {status} for user ID {user_id}")
-                return "INVALID_STATUS"
-        print(f"[Server] User ID {user_id} not found for status update")
-        return "USER_NOT_FOUND"
+    with user_locks.hold(user_id):
+        username = get_username_by_user_id(user_id)
+        if is_visitor(user_id):
+            # Handle visitor status
+            if user_id in visitor_statuses:
+                if status in ["Online", "Offline", "Invisible"]:
+                    commit({"op": "status", "user_id": user_id, "status": status}, conn)
+                    print(f"[Server] Set status of visitor {username} (ID: {user_id}) to {status}")
+                    return "STATUS_UPDATED"
+                else:
+                    print(f"[Server] Invalid status {status} for visitor ID {user_id}")
+                    return "INVALID_STATUS"
+            print(f"[Server] Visitor ID {user_id} not found for status update")
+            return "USER_NOT_FOUND"
+        else:
+            # Handle authenticated user status
+            if username and username in users:
+                if status in ["Online", "Offline", "Invisible"]:
+                    commit({"op": "status", "user_id": user_id, "status": status}, conn)
+                    print(f"[Server] Set status of {username} (ID: {user_id}) to {status}")
+                    return "STATUS_UPDATED"
+                else:
+                    print(f"[Server] Invalid status {status} for user ID {user_id}")
+                    return "INVALID_STATUS"
+            print(f"[Server] User ID {user_id} not found for status update")
+            return "USER_NOT_FOUND"
 
 def handle_get_peers(data, addr):
     peers = peer_manager.get_peers()
@@ -308,11 +820,7 @@ def handle_get_peers(data, addr):
     
     visible_peers = []
     for ip, port in peers:
-        username = None
-        for user, info in users.items():
-            if "client_addr" in info and info["client_addr"] == f"{ip}:{port}":
-                username = user
-                break
+        username = client_addr_to_username.get(f"{ip}:{port}")
         if username and users[username]["status"] != "Invisible":
             visible_peers.append((ip, port))
     
@@ -320,165 +828,208 @@ def handle_get_peers(data, addr):
     print(f"[Server] Sending peer list to {addr}: {peer_list}")
     return f"PEER_LIST {peer_list}" if peer_list else "PEER_LIST"
 
-def handle_create_channel(data):
+def handle_create_channel(data, conn=None):
     global channel_id_counter
     _, user_id, channel_name = data.split(maxsplit=2)
-    channel_id = str(channel_id_counter)
-    channels[channel_id] = {
-        "name": channel_name,
-        "host": user_id,
-        "members": [user_id]
-    }
-    channel_id_counter += 1
-    channel_db["channels"] = channels
-    channel_db["next_id"] = channel_id_counter
-    save_channels()
-    broadcast(f"UPDATE_CHANNELS {channel_id} {channel_name} {user_id}")
+    with id_lock:
+        channel_id = str(channel_id_counter)
+        channel_id_counter += 1
+    commit({"op": "add_channel", "channel_id": channel_id, "name": channel_name, "host": user_id}, conn)
     print(f"[Server] Created channel ID {channel_id} with name '{channel_name}', host={user_id}")
     return f"CHANNEL_CREATED {channel_id}"
 
-def handle_join_channel(data):
+def handle_join_channel(data, conn=None):
+    _, user_id, channel_id = data.split()
+    with channel_locks.hold(channel_id):
+        if channel_id in channels:
+            if user_id not in channels[channel_id]["members"]:
+                username = get_username_by_user_id(user_id)
+                if not username:
+                    print(f"[Server] Invalid user_id {user_id} for join request on channel {channel_id}")
+                    return "USER_NOT_FOUND"
+                commit({"op": "join", "channel_id": channel_id, "user_id": user_id}, conn)
+                print(f"[Server] User ID {user_id} joined channel {channel_id}")
+                # Notify the client if there's an active livestream in this channel
+                if channel_id in livestreamers:
+                    streamer_id, ip, port = livestreamers[channel_id]
+                    return f"JOIN_SUCCESS\nLIVESTREAM_START {streamer_id} {channel_id} {ip} {port}"
+                return "JOIN_SUCCESS"
+            else:
+                print(f"[Server] User ID {user_id} is already a member of channel {channel_id}")
+                return "ALREADY_MEMBER"
+        print(f"[Server] Channel {channel_id} not found for join request by user ID {user_id}")
+        return "CHANNEL_NOT_FOUND"
+
+def handle_leave_channel(data, conn=None):
     _, user_id, channel_id = data.split()
-    if channel_id in channels:
+    with channel_locks.hold(channel_id):
+        if channel_id not in channels:
+            print(f"[Server] Channel {channel_id} not found for leave request by user ID {user_id}")
+            return "CHANNEL_NOT_FOUND"
         if user_id not in channels[channel_id]["members"]:
-            username = get_username_by_user_id(user_id)
-            if not username:
-                print(f"[Server] Invalid user_id {user_id} for join request on channel {channel_id}")
-                return "USER_NOT_FOUND"
-            channels[channel_id]["members"].append(user_id)
-            channel_db["channels"] = channels
-            save_channels()
-            broadcast(f"UPDATE_CHANNELS {channel_id} {channels[channel_id]['name']} {channels[channel_id]['host']}")
-            print(f"[Server] User ID {user_id} joined channel {channel_id}")
-            # Notify the client if there's an active livestream in this channel
-            if channel_id in livestreamers:
-                streamer_id, ip, port = livestreamers[channel_id]
-                return f"JOIN_SUCCESS\nLIVESTREAM_START {streamer_id} {channel_id} {ip} {port}"
-            return "JOIN_SUCCESS"
+            print(f"[Server] User ID {user_id} is not a member of channel {channel_id}")
+            return "NOT_A_MEMBER"
+        if user_id == channels[channel_id]["host"]:
+            print(f"[Server] User ID {user_id} is the host of channel {channel_id} and cannot leave")
+            return "HOST_CANNOT_LEAVE"
+        commit({"op": "leave", "channel_id": channel_id, "user_id": user_id}, conn)
+        print(f"[Server] User ID {user_id} left channel {channel_id}")
+        return "LEAVE_SUCCESS"
+
+def format_channel(channel_id, channel):
+    members = channel["members"]
+    visitor_members = [member for member in members if is_visitor(member)]
+    regular_members = [member for member in members if not is_visitor(member)]
+    num_visitors = len(visitor_members)
+    num_regulars = len(regular_members)
+    visitor_members_str = " ".join(visitor_members) if visitor_members else ""
+    regular_members_str = " ".join(regular_members) if regular_members else ""
+    return (f"CHANNEL {channel_id} {channel['host']} {len(members)} {channel['name']} "
+            f"{num_visitors} {visitor_members_str} {num_regulars} {regular_members_str}")
+
+def channels_changed(channel_id=None):
+    """Bump the channel list version and drop the cached line of the channel that changed (None: all)."""
+    global channels_version, channels_snapshot
+    with channels_snapshot_lock:
+        channels_version += 1
+        if channel_id is None:
+            channel_lines.clear()
         else:
-            print(f"[Server] User ID {user_id} is already a member of channel {channel_id}")
-            return "ALREADY_MEMBER"
-    print(f"[Server] Channel {channel_id} not found for join request by user ID {user_id}")
-    return "CHANNEL_NOT_FOUND"
+            channel_lines.pop(channel_id, None)
+        channels_snapshot = None
 
-def handle_leave_channel(data):
-    _, user_id, channel_id = data.split()
-    if channel_id not in channels:
-        print(f"[Server] Channel {channel_id} not found for leave request by user ID {user_id}")
-        return "CHANNEL_NOT_FOUND"
-    if user_id not in channels[channel_id]["members"]:
-        print(f"[Server] User ID {user_id} is not a member of channel {channel_id}")
-        return "NOT_A_MEMBER"
-    if user_id == channels[channel_id]["host"]:
-        print(f"[Server] User ID {user_id} is the host of channel {channel_id} and cannot leave")
-        return "HOST_CANNOT_LEAVE"
-    channels[channel_id]["members"].remove(user_id)
-    channel_db["channels"] = channels
-    save_channels()
-    broadcast(f"UPDATE_CHANNELS {channel_id} {channels[channel_id]['name']} {channels[channel_id]['host']}")
-    print(f"[Server] User ID {user_id} left channel {channel_id}")
-    return "LEAVE_SUCCESS"
+def get_channels_snapshot():
+    """Return (version, serialized GET_CHANNELS response), re-rendering only changed channels.
+
+    A built snapshot is an immutable (version, text) pair, so readers take it
+    without a lock; only a rebuild after a change waits for channels_snapshot_lock.
+    """
+    global channels_snapshot
+    snapshot = channels_snapshot
+    if snapshot is not None:
+        return snapshot
+    with channels_snapshot_lock:
+        if channels_snapshot is None:
+            current = channels
+            for channel_id, channel in current.items():
+                if channel_id not in channel_lines:
+                    channel_lines[channel_id] = format_channel(channel_id, channel)
+            lines = [channel_lines[channel_id] for channel_id in current] or ["NO_CHANNELS"]
+            channels_snapshot = (channels_version, "\n".join([f"CHANNELS_VERSION {channels_version}"] + lines))
+            print(f"[Server] Rebuilt channel snapshot version {channels_version} ({len(current)} channels)")
+        return channels_snapshot
 
 def handle_get_channels(data):
-    if not channels:
-        print("[Server] No channels exist, responding with NO_CHANNELS")
-        return "NO_CHANNELS"
-    response = []
-    for channel_id, channel in channels.items():
-        members = channel["members"]
-        visitor_members = [member for member in members if is_visitor(member)]
-        regular_members = [member for member in members if not is_visitor(member)]
-        num_visitors = len(visitor_members)
-        num_regulars = len(regular_members)
-        visitor_members_str = " ".join(visitor_members) if visitor_members else ""
-        regular_members_str = " ".join(regular_members) if regular_members else ""
-        channel_message = (f"CHANNEL {channel_id} {channel['host']} {len(members)} {channel['name']} "
-                          f"{num_visitors} {visitor_members_str} {num_regulars} {regular_members_str}")
-        response.append(channel_message)
-        print(f"[Server] Sending channel info: {channel_message}")
-    return "\n".join(response)
+    _, snapshot = get_channels_snapshot()
+    return snapshot
+
+def handle_get_channels_if_newer(data):
+    """GET_CHANNELS_IF_NEWER <version>: the snapshot only if it changed since that version."""
+    parts = data.split()
+    if len(parts) != 2 or not parts[1].isdigit():
+        return "INVALID_COMMAND"
+    if int(parts[1]) >= channels_version:
+        return f"NOT_MODIFIED {channels_version}"
+    _, snapshot = get_channels_snapshot()
+    return snapshot
 
 def handle_send_message(data, conn):
     _, user_id, channel_id, message = data.split(maxsplit=3)
-    if is_visitor(user_id):
-        username = get_username_by_user_id(user_id)
-        print(f"[Server] Visitor {username} (ID: {user_id}) attempted to send a message to channel {channel_id}")
-        return "VISITOR_NOT_ALLOWED"
-    if channel_id not in channels:
-        print(f"[Server] Channel {channel_id} not found for message from user ID {user_id}")
-        return "CHANNEL_NOT_FOUND"
-    if user_id not in channels[channel_id]["members"]:
-        print(f"[Server] User ID {user_id} is not a member of channel {channel_id}")
-        return "NOT_A_MEMBER"
-    
-    timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
-    if channel_id not in messages:
-        messages[channel_id] = []
-    messages[channel_id].append({
-        "user_id": user_id,
-        "message": message,
-        "timestamp": timestamp
-    })
-    message_db["messages"] = messages
-    save_messages()
-    print(f"[Server] Stored message in channel {channel_id} from user ID {user_id}: {message}")
-    
-    # Determine the source of the message (Centralized Server or Channel Hosting)
-    source = "Centralized Server"
-    if channel_id in livestreamers:
-        streamer_id, _, _ = livestreamers[channel_id]
-        if user_id == streamer_id:
-            source = f"Channel Hosting (Streamer ID: {streamer_id})"
-    
-    # Log the message with the source
-    log_connection("MESSAGE_SENT", source, f"User {user_id} sent message in channel {channel_id}: {message}")
-    
-    broadcast_to_channel(channel_id, f"MESSAGE {channel_id} {user_id} {timestamp} | {message}")
-    return "MESSAGE_SENT"
+    with channel_locks.hold(channel_id):  # messages of one channel get seqs and go out in the same order
+        if is_visitor(user_id):
+            username = get_username_by_user_id(user_id)
+            print(f"[Server] Visitor {username} (ID: {user_id}) attempted to send a message to channel {channel_id}")
+            return "VISITOR_NOT_ALLOWED"
+        if channel_id not in channels:
+            print(f"[Server] Channel {channel_id} not found for message from user ID {user_id}")
+            return "CHANNEL_NOT_FOUND"
+        if user_id not in channels[channel_id]["members"]:
+            print(f"[Server] User ID {user_id} is not a member of channel {channel_id}")
+            return "NOT_A_MEMBER"
+        timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
+        commit({"op": "message", "channel_id": channel_id, "user_id": user_id, "message": message,
+                "timestamp": timestamp}, conn)
+        print(f"[Server] Stored message in channel {channel_id} from user ID {user_id}: {message}")
+        return "MESSAGE_SENT"
 
 def handle_get_messages(data):
     _, channel_id = data.split()
     if channel_id not in channels:
         print(f"[Server] Channel {channel_id} not found for message retrieval")
         return "CHANNEL_NOT_FOUND"
-    if channel_id not in messages or not messages[channel_id]:
+    count = message_store.count(channel_id)
+    if not count:
         print(f"[Server] No messages in channel {channel_id}")
         return "NO_MESSAGES"
     response = []
-    for msg in messages[channel_id]:
+    for msg in message_store.read(channel_id, 0, count):
         response.append(f"MESSAGE {channel_id} {msg['user_id']} {msg['timestamp']} | {msg['message']}")
     print(f"[Server] Retrieved messages for channel {channel_id}: {len(response)} messages")
     return "\n".join(response)
 
-def handle_start_stream(data, conn):
-    _, user_id, channel_id, ip, port = data.split()
+def handle_get_messages_page(data):
+    """GET_MESSAGES_PAGE <channel_id> [before=<seq>] [after=<seq>] [limit=<n>]"""
+    parts = data.split()
+    if len(parts) < 2:
+        return "INVALID_PAGE_REQUEST"
+    channel_id = parts[1]
+    cursors = {"before": None, "after": None, "limit": MESSAGE_PAGE_DEFAULT}
+    for part in parts[2:]:
+        key, _, value = part.partition("=")
+        if key not in cursors or not value.isdigit():
+            return "INVALID_PAGE_REQUEST"
+        cursors[key] = int(value)
     if channel_id not in channels:
-        print(f"[Server] Channel {channel_id} not found for START_STREAM by user ID {user_id}")
+        print(f"[Server] Channel {channel_id} not found for message page retrieval")
         return "CHANNEL_NOT_FOUND"
-    if user_id not in channels[channel_id]["members"]:
-        print(f"[Server] User ID {user_id} is not a member of channel {channel_id}")
-        return "NOT_A_MEMBER"
-    livestreamers[channel_id] = (user_id, ip, port)
-    broadcast_to_channel(channel_id, f"LIVESTREAM_START {user_id} {channel_id} {ip} {port}", exclude_conn=conn)
-    print(f"[Server] User {user_id} started streaming in channel {channel_id} at {ip}:{port}")
-    # Log the stream start
-    log_connection("STREAM_START", "Centralized Server", f"User {user_id} started streaming in channel {channel_id} at {ip}:{port}")
-    return "STREAM_STARTED"
+    limit = max(1, min(cursors["limit"], MESSAGE_PAGE_MAX))
+    page, has_older, has_newer = message_store.page(channel_id, cursors["before"], cursors["after"], limit)
+    first = page[0]["seq"] if page else "-"
+    last = page[-1]["seq"] if page else "-"
+    response = [f"MESSAGES_PAGE {channel_id} count={len(page)} first={first} last={last} older={int(has_older)} newer={int(has_newer)}"]
+    for msg in page:
+        response.append(f"MESSAGE {channel_id} {msg['user_id']} {msg['timestamp']} | {msg['message']}")
+    print(f"[Server] Retrieved page of {len(page)} messages for channel {channel_id} (before={cursors['before']}, after={cursors['after']})")
+    return "\n".join(response)
+
+def set_stream_owner(user_id, channel_id, conn):
+    """Record that the session on conn now owns user_id's stream in channel_id (None: nobody).
+
+    Only the owning session's end stops the stream, so a user who logs in again
+    keeps a stream the new login started. With --workers, conn is None on the
+    workers that did not receive the command, and none of their sessions owns it.
+    """
+    for session in user_sessions.get(user_id, ()):
+        if session.conn is conn:
+            session.streams.add(channel_id)
+        else:
+            session.streams.discard(channel_id)
+
+def handle_start_stream(data, conn):
+    _, user_id, channel_id, ip, port = data.split()
+    with channel_locks.hold(channel_id):
+        if channel_id not in channels:
+            print(f"[Server] Channel {channel_id} not found for START_STREAM by user ID {user_id}")
+            return "CHANNEL_NOT_FOUND"
+        if user_id not in channels[channel_id]["members"]:
+            print(f"[Server] User ID {user_id} is not a member of channel {channel_id}")
+            return "NOT_A_MEMBER"
+        commit({"op": "start_stream", "channel_id": channel_id, "user_id": user_id, "ip": ip, "port": port}, conn)
+        print(f"[Server] User {user_id} started streaming in channel {channel_id} at {ip}:{port}")
+        return "STREAM_STARTED"
 
 def handle_stop_stream(data, conn):
     _, user_id, channel_id = data.split()
-    if channel_id not in channels:
-        print(f"[Server] Channel {channel_id} not found for STOP_STREAM by user ID {user_id}")
-        return "CHANNEL_NOT_FOUND"
-    if channel_id in livestreamers and livestreamers[channel_id][0] == user_id:
-        del livestreamers[channel_id]
-        broadcast_to_channel(channel_id, f"LIVESTREAM_STOP {user_id} {channel_id}", exclude_conn=conn)
-        print(f"[Server] User {user_id} stopped streaming in channel {channel_id}")
-        # Log the stream stop
-        log_connection("STREAM_STOP", "Centralized Server", f"User {user_id} stopped streaming in channel {channel_id}")
-        return "STREAM_STOPPED"
-    print(f"[Server] No active stream found for user {user_id} in channel {channel_id}")
-    return "NO_STREAM"
+    with channel_locks.hold(channel_id):
+        if channel_id not in channels:
+            print(f"[Server] Channel {channel_id} not found for STOP_STREAM by user ID {user_id}")
+            return "CHANNEL_NOT_FOUND"
+        if channel_id in livestreamers and livestreamers[channel_id][0] == user_id:
+            commit({"op": "stop_stream", "channel_id": channel_id, "user_id": user_id}, conn)
+            print(f"[Server] User {user_id} stopped streaming in channel {channel_id}")
+            return "STREAM_STOPPED"
+        print(f"[Server] No active stream found for user {user_id} in channel {channel_id}")
+        return "NO_STREAM"
 
 def handle_get_active_streams(data):
     _, channel_id = data.split()
@@ -492,130 +1043,515 @@ def handle_get_active_streams(data):
     print(f"[Server] No active streams in channel {channel_id}")
     return "NO_ACTIVE_STREAM"
 
+def handle_get_stats(data):
+    stats = command_registry.stats()
+    if not stats:
+        return "NO_STATS"
+    response = []
+    # Verbs that consumed the most total server time come first
+    for verb, s in sorted(stats.items(), key=lambda item: item[1]["mean"] * item[1]["count"], reverse=True):
+        response.append(f"STAT {verb} count={s['count']} errors={s['errors']} "
+                        f"p50_ms={s['p50'] * 1000:.3f} p95_ms={s['p95'] * 1000:.3f} "
+                        f"p99_ms={s['p99'] * 1000:.3f} max_ms={s['max'] * 1000:.3f}")
+    print(f"[Server] Sending stats for {len(response)} commands")
+    return "\n".join(response)
+
+def handle_get_store_stats(data):
+    s = message_store.stats()
+    print("[Server] Sending message store stats")
+    return (f"STORE channels={s['channels']} hot_records={s['hot_records']} cold_pages={s['cold_pages']} "
+            f"cold_records={s['cold_records']} hot_hits={s['hot_hits']} cold_hits={s['cold_hits']} "
+            f"cold_misses={s['cold_misses']} hot_evictions={s['hot_evictions']} page_evictions={s['page_evictions']}")
+
+command_registry = CommandRegistry()
+command_registry.register("VISITOR", lambda data, addr, conn: handle_visitor(data, conn))
+command_registry.register("LOGIN", lambda data, addr, conn: handle_login(data, addr, conn))
+command_registry.register("REGISTER", lambda data, addr, conn: handle_register(data))
+command_registry.register("GET_USERNAME", lambda data, addr, conn: handle_get_username(data))
+command_registry.register("GET_STATUS", lambda data, addr, conn: handle_get_status(data))
+command_registry.register("GET_USERNAMES", lambda data, addr, conn: handle_get_usernames(data))
+command_registry.register("GET_STATUSES", lambda data, addr, conn: handle_get_statuses(data))
+command_registry.register("SET_STATUS", lambda data, addr, conn: handle_set_status(data, addr, conn))
+command_registry.register("GET_PEERS", lambda data, addr, conn: handle_get_peers(data, addr))
+command_registry.register("CREATE_CHANNEL", lambda data, addr, conn: handle_create_channel(data, conn))
+command_registry.register("JOIN_CHANNEL", lambda data, addr, conn: handle_join_channel(data, conn))
+command_registry.register("LEAVE_CHANNEL", lambda data, addr, conn: handle_leave_channel(data, conn))
+command_registry.register("GET_CHANNELS", lambda data, addr, conn: handle_get_channels(data))
+command_registry.register("GET_CHANNELS_IF_NEWER", lambda data, addr, conn: handle_get_channels_if_newer(data))
+command_registry.register("SEND_MESSAGE", lambda data, addr, conn: handle_send_message(data, conn))
+command_registry.register("GET_MESSAGES", lambda data, addr, conn: handle_get_messages(data))
+command_registry.register("GET_MESSAGES_PAGE", lambda data, addr, conn: handle_get_messages_page(data))
+command_registry.register("START_STREAM", lambda data, addr, conn: handle_start_stream(data, conn))
+command_registry.register("STOP_STREAM", lambda data, addr, conn: handle_stop_stream(data, conn))
+command_registry.register("GET_ACTIVE_STREAMS", lambda data, addr, conn: handle_get_active_streams(data))
+command_registry.register("GET_STATS", lambda data, addr, conn: handle_get_stats(data))
+command_registry.register("GET_STORE_STATS", lambda data, addr, conn: handle_get_store_stats(data))
+
+# Every change to users, channels, messages, presence and streams goes through commit() as
+# one of these ops, so in --workers mode the other workers can apply exactly what worker 0 did.
+CHANGE_APPLIERS = {
+    "add_user": apply_add_user,
+    "add_visitor": apply_add_visitor,
+    "forget_visitor": apply_forget_visitor,
+    "status": apply_status,
+    "client_addr": apply_client_addr,
+    "forget_client_addr": apply_forget_client_addr,
+    "add_channel": apply_add_channel,
+    "join": apply_join,
+    "leave": apply_leave,
+    "message": apply_message,
+    "start_stream": apply_start_stream,
+    "stop_stream": apply_stop_stream,
+}
+
+def get_verb(data):
+    parts = data.split(maxsplit=1)
+    return parts[0] if parts else ""
+
 def process_command(data, addr, conn):
     print(f"[Server] Processing command from {addr}: {data}")
-    if data.startswith("VISITOR"):
-        return handle_visitor(data, conn)
-    elif data.startswith("LOGIN"):
-        return handle_login(data, conn)
-    elif data.startswith("REGISTER"):
-        return handle_register(data)
-    elif data.startswith("GET_USERNAME"):
-        return handle_get_username(data)
-    elif data.startswith("GET_STATUS"):
-        return handle_get_status(data)
-    elif data.startswith("SET_STATUS"):
-        return handle_set_status(data, addr, conn)
-    elif data.startswith("GET_PEERS"):
-        return handle_get_peers(data, addr)
-    elif data.startswith("CREATE_CHANNEL"):
-        return handle_create_channel(data)
-    elif data.startswith("JOIN_CHANNEL"):
-        return handle_join_channel(data)
-    elif data.startswith("LEAVE_CHANNEL"):
-        return handle_leave_channel(data)
-    elif data.startswith("GET_CHANNELS"):
-        return handle_get_channels(data)
-    elif data.startswith("SEND_MESSAGE"):
-        return handle_send_message(data, conn)
-    elif data.startswith("GET_MESSAGES"):
-        return handle_get_messages(data)
-    elif data.startswith("START_STREAM"):
-        return handle_start_stream(data, conn)
-    elif data.startswith("STOP_STREAM"):
-        return handle_stop_stream(data, conn)
-    elif data.startswith("GET_ACTIVE_STREAMS"):
-        return handle_get_active_streams(data)
-    else:
+    response = command_registry.dispatch(get_verb(data), data, addr, conn)
+    if response is None:
         print(f"[Server] Invalid command from {addr}: {data}")
         return "INVALID_COMMAND"
+    return response
+
+class ClientSession:
+    """Per-connection state shared by the threaded and event-loop server modes."""
+    def __init__(self, conn, addr, on_ready=None):
+        self.conn = conn
+        self.addr = addr
+        self.username = None
+        self.user_id = None
+        self.decoder = FrameDecoder()
+        self.outbound = OutboundQueue(OUTBOUND_QUEUE_SIZE, OUTBOUND_OVERFLOW_POLICY, on_ready)
+        self.pending = b""  # eventloop mode: bytes taken from the queue but not yet written
+        self.events = selectors.EVENT_READ
+        self.closed = False
+        self.disconnecting = False
+        self.resume = None  # ResumeState of the logged-in user, None before login or after LOGOUT
+        self.detached = False  # connection gone, state kept for RESUME_GRACE_PERIOD
+        self.replaced = False  # a RESUME moved this session's state to another connection
+        self.streams = set()  # channel IDs this login started the current livestream in
+
+    def send(self, message, presence=False):
+        """Queue one message for this client without blocking the caller."""
+        return self.send_frame(encode_frame(message), presence)
+
+    def send_event(self, seq, frame, presence=False):
+        """Push an event frame: it is recorded for RESUME and delivered to the connection now bound to it.
+
+        While the connection is detached the event is only recorded. A session whose
+        state was taken over by RESUME forwards to the new connection, so a broadcast
+        that picked up the old session just before the swap is not lost.
+        """
+        state = self.resume
+        if state is None:
+            return self.send_frame(frame, presence)
+        with state.lock:
+            state.record(seq, frame)
+            live = state.session
+            if live.detached:
+                return True
+            return live.send_frame(frame, presence)
+
+    def send_frame(self, frame, presence=False):
+        queued = self.outbound.put(frame, presence)
+        if not queued and self.outbound.overflowed:
+            self.disconnect_slow_consumer()
+        return queued
+
+    def disconnect_slow_consumer(self):
+        """Shut the socket down so the reader (thread or event loop) runs the normal cleanup."""
+        if self.closed or self.disconnecting:
+            return
+        self.disconnecting = True
+        print(f"[Server] Outbound queue for {self.addr} overflowed, disconnecting slow client")
+        try:
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
 
-def handle_client_messages(conn, addr, username=None, user_id=None):
+def open_session(conn, addr):
+    """Register a freshly accepted connection and return its session."""
+    peer_manager.add_peer(addr)
     # Log the initial connection
     log_connection("CONNECTION_ESTABLISHED", "Centralized Server", f"Client connected from {addr}")
-    
+    session = ClientSession(conn, addr)
+    open_sessions[conn] = session
+    return session
+
+def issue_resume_token(session):
+    """Give a freshly logged-in session a token it can RESUME with after a dropped connection."""
+    session.resume = resume_registry.issue(session.username, session.user_id)
+    session.resume.session = session
+    return session.resume.token
+
+def handle_resume(data, session):
+    """RESUME <token> <last_event_seq>: bind a dropped session to this connection and replay what it missed."""
+    parts = data.split()
+    if len(parts) != 3 or not parts[2].isdigit():
+        return "INVALID_COMMAND"
+    if session.user_id:
+        print(f"[Server] RESUME from {session.addr} rejected: connection already logged in as {session.user_id}")
+        return "RESUME_FAILED"
+    state = resume_registry.get(parts[1])
+    if state is None:
+        print(f"[Server] RESUME from {session.addr} with unknown or expired token")
+        return "RESUME_FAILED"
+    with state.lock:
+        missed = state.missed_since(int(parts[2]))
+        if missed is None or not resume_registry.attach(state):
+            print(f"[Server] RESUME for {state.username} (ID: {state.user_id}) failed: events since {parts[2]} are gone")
+            return "RESUME_FAILED"
+        old = state.session
+        session.username, session.user_id, session.resume = state.username, state.user_id, state
+        session.streams = old.streams
+        state.session = session
+        old.replaced = True
+        if missed:
+            session.send_frame(b"".join(missed))
+    # Outside state.lock, which broadcasts take while holding a channel stripe. Until the
+    # swap below, events that still reach the old session are forwarded by old.send_event.
+    replace_connected_client(old, session)
+    index_session(session)
+    unindex_session(old)
+    if not old.closed:
+        # A half-open connection the client has given up on
+        try:
+            old.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    if not is_visitor(session.user_id):
+        run_replicated("client_addr", {"username": session.username, "addr": list(session.addr)}, wait=False)
+    print(f"[Server] Resumed {session.username} (ID: {session.user_id}) on {session.addr}, replayed {len(missed)} events")
+    log_connection("CONNECTION_RESUMED", "Centralized Server",
+                   f"Client {session.username} (ID: {session.user_id}) resumed from {session.addr}, replayed {len(missed)} events")
+    return f"RESUMED {session.user_id} {len(missed)}"
+
+def handle_logout(session):
+    """LOGOUT: end the session for good when the connection closes, without a resume grace period."""
+    if session.resume is not None:
+        resume_registry.discard(session.resume)
+        session.resume = None
+    return "LOGGED_OUT"
+
+def handle_get_session_stats(data):
+    stats = resume_registry.stats()
+    return (f"SESSIONS resumable={stats['sessions']} detached={stats['detached']} "
+            f"resumed={stats['resumed']} expired={stats['expired']}")
+
+command_registry.register("RESUME", lambda data, addr, conn: handle_resume(data, open_sessions[conn]))
+command_registry.register("GET_SESSION_STATS", lambda data, addr, conn: handle_get_session_stats(data))
+command_registry.register("LOGOUT", lambda data, addr, conn: handle_logout(open_sessions[conn]))
+
+def handle_session_command(session, data):
+    """Run one command for a session and return the response to send back."""
+    conn, addr = session.conn, session.addr
+    print(f"[Server] Message from {addr}: {data}")
+    verb = get_verb(data)
+    if state_bus is not None and verb in REPLICATED_VERBS:
+        response = replicate_command(data, addr, conn)
+    else:
+        response = process_command(data, addr, conn)
+    if verb == "LOGIN" and response.startswith("LOGIN_SUCCESS"):
+        session.username = data.split()[1]
+        session.user_id = response.split()[1]
+        add_connected_client(session)
+        index_session(session)
+        response = f"{response} {issue_resume_token(session)}"
+        print(f"[Server] Added {session.username} (ID: {session.user_id}) to connected clients")
+    elif verb == "VISITOR" and response.startswith("WELCOME_VISITOR"):
+        session.username = data.split()[1]
+        session.user_id = response.split()[2]
+        add_connected_client(session)
+        index_session(session)
+        response = f"{response} {issue_resume_token(session)}"
+        print(f"[Server] Added visitor {session.username} (ID: {session.user_id}) to connected clients")
+    return response
+
+state_bus = None  # StateBus in --workers mode
+leader_lock = threading.Lock()  # --workers: worker 0 runs one replicated action at a time
+
+# Commands that change users, channels, messages, presence or streams. With --workers only
+# worker 0 runs them (so user and channel IDs and message seqs are assigned in one place) and
+# publishes the changes they committed; every other worker applies those changes in the same
+# order and pushes the resulting events to its own clients.
+REPLICATED_VERBS = {"REGISTER", "VISITOR", "LOGIN", "SET_STATUS", "CREATE_CHANNEL", "JOIN_CHANNEL",
+                    "LEAVE_CHANNEL", "SEND_MESSAGE", "START_STREAM", "STOP_STREAM"}
+
+def run_command_action(args, conn):
+    addr = tuple(args["addr"]) if args["addr"] else None
+    return process_command(args["data"], addr, conn)
+
+def client_addr_action(args, conn):
+    """RESUME: the user's P2P address is now the one of the resumed connection."""
+    username = args["username"]
+    if username in users:
+        commit({"op": "client_addr", "username": username, "client_addr": f"{args['addr'][0]}:{args['addr'][1]}"}, conn)
+
+def forget_client_addr_action(args, conn):
+    forget_client_addr(args["username"], args["addr"])
+
+def end_session_action(args, conn):
+    if not is_visitor(args["user_id"]):
+        forget_client_addr(args["username"], args["addr"])
+    drop_user_state(args["username"], args["user_id"], args["streams"], args["last_session"])
+
+# Actions that commit changes; args must be JSON-serializable, as they travel over the state bus
+REPLICATED_ACTIONS = {
+    "command": run_command_action,
+    "client_addr": client_addr_action,
+    "forget_client_addr": forget_client_addr_action,
+    "end_session": end_session_action,
+}
+
+def run_replicated(action, args, conn=None, wait=True):
+    """Run a state-changing action here, or with --workers on worker 0 with every worker applying its changes.
+
+    Returns the action's result once this worker has applied its changes; with
+    wait=False a worker other than 0 only sends the action off and returns None.
+    """
+    if state_bus is None:
+        return REPLICATED_ACTIONS[action](args, conn)
+    if WORKER_INDEX == 0:
+        return lead_action(action, args, conn, WORKER_INDEX, None)
+    event = {"kind": "action", "action": action, "args": args}
+    if not wait:
+        state_bus.publish(dict(event, worker=WORKER_INDEX))
+        return None
+    return state_bus.submit(event, conn=conn)
+
+def lead_action(action, args, conn, origin, request):
+    """Worker 0: run a replicated action and publish the changes it committed, with the result for its origin."""
+    with leader_lock:
+        bus_event.changes = []
+        bus_event.remote = origin != WORKER_INDEX
+        try:
+            result = REPLICATED_ACTIONS[action](args, conn)
+        except Exception as e:
+            print(f"[Server] Error running replicated {action} {args}: {e}")
+            result = None
+        finally:
+            changes = bus_event.changes
+            bus_event.changes = None
+            bus_event.remote = False
+        if changes or request is not None:
+            state_bus.publish({"kind": "changes", "worker": origin, "reply": request, "result": result,
+                               "changes": changes})
+        return result
+
+def replicate_command(data, addr, conn):
+    """--workers: run a state-changing command on worker 0; returns its response once this worker applied it."""
+    try:
+        return run_replicated("command", {"data": data, "addr": list(addr) if addr else None}, conn) or "INVALID_COMMAND"
+    except ConnectionError as e:
+        # The bus is gone and this worker is stopping: no worker applies anything any more
+        print(f"[Server] Could not replicate command from {addr}: {e}")
+        return "SERVER_BUSY"
+
+def apply_bus_event(event, addr, conn):
+    """Apply one state bus event; conn is set on the worker whose client the event answers."""
+    if event["kind"] == "action":
+        if WORKER_INDEX == 0:
+            lead_action(event["action"], event["args"], None, event["worker"], event.get("request"))
+        return None
+    if event["kind"] == "changes" and WORKER_INDEX != 0:  # worker 0 applied them when it ran the action
+        bus_event.remote = event["worker"] != WORKER_INDEX
+        try:
+            for change in event["changes"]:
+                apply_change(change, conn)
+        finally:
+            bus_event.remote = False
+    return event.get("result")
+
+def handle_get_bus_stats(data):
+    if state_bus is None:
+        return "BUS workers=1 worker=0"
+    stats = state_bus.stats()
+    return (f"BUS workers={WORKER_COUNT} worker={WORKER_INDEX} published={stats['published']} "
+            f"applied={stats['applied']} pending={stats['pending']}")
+
+command_registry.register("GET_BUS_STATS", lambda data, addr, conn: handle_get_bus_stats(data))
+
+def handle_session_data(session, data):
+    """Feed received bytes to the session and answer every complete command.
+
+    Pipelined commands are processed in arrival order and their responses are
+    queued as one write, in the same order.
+    """
+    responses = [handle_session_command(session, command) for command in session.decoder.feed(data)]
+    if responses:
+        session.send_frame(encode_frames(responses))
+
+def close_session(session):
+    """Clean up server state for a session whose connection has gone away.
+
+    A logged-in session with a resume token is only detached: it keeps its
+    memberships and records the events pushed to it, and end_session runs once
+    RESUME_GRACE_PERIOD passes without a RESUME.
+    """
+    if session.closed:
+        return
+    session.closed = True
+    session.outbound.close()
+    open_sessions.pop(session.conn, None)
+    if session.replaced:
+        print(f"[Server] Connection {session.addr} of {session.username} (ID: {session.user_id}) closed after RESUME elsewhere")
+    elif session.user_id and session.resume is not None and resume_registry.grace_period > 0:
+        detach_session(session)
+    else:
+        end_session(session)
+    peer_manager.remove_peer(session.addr)
+    session.conn.close()
+
+def forget_client_addr(username, addr):
+    """Drop the P2P address of a registered user whose control connection (addr) is gone.
+
+    Kept if the user has since logged in again from another address.
+    """
+    client_addr = f"{addr[0]}:{addr[1]}"
+    if username in users and users[username].get("client_addr") == client_addr:
+        commit({"op": "forget_client_addr", "username": username, "client_addr": client_addr})
+
+def detach_session(session):
+    session.detached = True
+    if not is_visitor(session.user_id):
+        run_replicated("forget_client_addr", {"username": session.username, "addr": list(session.addr)}, wait=False)
+    resume_registry.detach(session.resume)
+    print(f"[Server] Client {session.username} (ID: {session.user_id}) disconnected; resumable for {resume_registry.grace_period}s")
+    log_connection("CONNECTION_SUSPENDED", "Centralized Server",
+                   f"Client {session.username} (ID: {session.user_id}) disconnected from {session.addr}, "
+                   f"resumable for {resume_registry.grace_period}s")
+
+def expire_detached_sessions():
+    """Background thread: end the detached sessions whose grace period ran out."""
+    while True:
+        time.sleep(1.0)
+        for state in resume_registry.expired():
+            try:
+                print(f"[Server] Resume grace period over for {state.username} (ID: {state.user_id})")
+                end_session(state.session)
+            except Exception as e:
+                print(f"[Server] Error ending expired session of {state.username}: {e}")
+
+def end_session(session):
+    """Remove a user's connection-bound state for good: delivery indexes, visitor identity, streams."""
+    addr = session.addr
+    username, user_id = session.username, session.user_id
+    if session.resume is not None:
+        resume_registry.discard(session.resume)
+    if username and user_id:
+        print(f"[Server] Client {username} (ID: {user_id}) is disconnecting. Processing cleanup...")
+        unindex_session(session)
+        # A detached session can expire after the user logged in again: leave their state to the new session
+        run_replicated("end_session", {"username": username, "user_id": user_id, "addr": list(addr),
+                                       "streams": sorted(session.streams), "last_session": user_id not in user_sessions},
+                       wait=False)
+    if remove_connected_client(session):
+        print(f"[Server] Removed {username} (ID: {user_id}) from connected clients")
+        # Log the disconnection
+        log_connection("CONNECTION_CLOSED", "Centralized Server", f"Client {username} (ID: {user_id}) disconnected from {addr}")
+
+def drop_user_state(username, user_id, streams=(), last_session=True):
+    """Stop the streams an ended session started and, after the user's last session, forget a visitor."""
+    if last_session and is_visitor(user_id):
+        # Handle visitor
+        print(f"[Server] Visitor {username} (ID: {user_id}) is logging out. Removing from channels...")
+        if user_id in visitor_statuses:
+            # Deliver Offline now, while the channel members are still the audience and before MEMBER_LEFT
+            commit({"op": "status", "user_id": user_id, "status": "Offline", "deliver_now": True})
+        channels_updated = []
+        for channel_id in user_channels.get(user_id, ()):
+            with channel_locks.hold(channel_id):
+                channel = channels[channel_id]
+                if user_id not in channel["members"]:
+                    continue
+                commit({"op": "leave", "channel_id": channel_id, "user_id": user_id})
+                channels_updated.append(channel_id)
+                print(f"[Server] Removed visitor {username} (ID: {user_id}) from channel {channel_id} ({channel['name']})")
+        if channels_updated:
+            print(f"[Server] Updated channels.json after removing visitor {username} (ID: {user_id})")
+        else:
+            print(f"[Server] No channels updated for visitor {username} (ID: {user_id}) - they were not in any channels")
+        # Remove the visitor from visitor_ids and visitor_statuses
+        if user_id in visitor_id_to_name:
+            commit({"op": "forget_visitor", "user_id": user_id})
+            print(f"[Server] Removed visitor {username} (ID: {user_id}) from visitor_ids and visitor_statuses")
+        else:
+            print(f"[Server] Visitor ID {user_id} not found in visitor_ids during cleanup")
+    # Stop the active streams this session started
+    for channel_id in streams:
+        with channel_locks.hold(channel_id):
+            if livestreamers.get(channel_id, (None,))[0] == user_id:
+                commit({"op": "stop_stream", "channel_id": channel_id, "user_id": user_id})
+                print(f"[Server] Stopped stream for user {user_id} in channel {channel_id} due to disconnect")
+
+def handle_get_queue_stats(data):
+    sessions = sorted(list(open_sessions.values()), key=lambda session: session.outbound.depth, reverse=True)
+    if not sessions:
+        return "NO_CONNECTIONS"
+    response = []
+    for session in sessions:
+        q = session.outbound.stats()
+        response.append(f"QUEUE {session.addr[0]}:{session.addr[1]} {session.user_id or '-'} "
+                        f"depth={q['depth']} max_depth={q['max_depth']} dropped={q['dropped']} sent={q['sent']}")
+    print(f"[Server] Sending outbound queue stats for {len(response)} connections")
+    return "\n".join(response)
+
+command_registry.register("GET_QUEUE_STATS", lambda data, addr, conn: handle_get_queue_stats(data))
+
+def handle_get_lock_stats(data):
+    """One LOCKS line per striped lock: acquisitions and how many had to wait."""
+    lines = []
+    for locks in (channel_locks, user_locks):
+        stats = locks.stats()
+        lines.append(f"LOCKS {locks.name} stripes={stats['stripes']} acquired={stats['acquired']} contended={stats['contended']}")
+    return "\n".join(lines)
+
+command_registry.register("GET_LOCK_STATS", lambda data, addr, conn: handle_get_lock_stats(data))
+command_registry.register("GET_PRESENCE_STATS", lambda data, addr, conn: handle_get_presence_stats(data))
+
+def client_writer(session):
+    """Threaded mode: drain a session's outbound queue onto its socket."""
+    queue = session.outbound
+    while True:
+        data = queue.take(timeout=1.0)
+        if data:
+            try:
+                session.conn.sendall(data)
+            except OSError as e:
+                print(f"[Server] Failed to write to {session.addr}: {e}")
+                break
+        if queue.closed or queue.overflowed:
+            return
+    # Wake the reader thread so it runs the normal disconnect cleanup
+    try:
+        session.conn.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+def handle_client_messages(session):
+    """Threaded mode: serve one client on its own thread until it disconnects."""
+    conn, addr = session.conn, session.addr
     try:
         while True:
-            data = conn.recv(1024).decode()
+            data = conn.recv(RECV_BUFFER_SIZE)
             if not data:
                 print(f"[Server] Peer {addr} disconnected gracefully")
                 break
-            print(f"[Server] Message from {addr}: {data}")
-            response = process_command(data, addr, conn)
-            if data.startswith("LOGIN") and response.startswith("LOGIN_SUCCESS"):
-                username = data.split()[1]
-                user_id = response.split()[1]
-                connected_clients.append((conn, addr, username, user_id))
-                users[username]["client_addr"] = f"{addr[0]}:{addr[1]}"
-                save_users()
-                print(f"[Server] Added {username} (ID: {user_id}) to connected clients")
-            elif data.startswith("VISITOR"):
-                username = data.split()[1]
-                user_id = response.split()[2]
-                connected_clients.append((conn, addr, username, user_id))
-                print(f"[Server] Added visitor {username} (ID: {user_id}) to connected clients")
-            conn.sendall(f"{response}\n".encode())
+            handle_session_data(session, data)
     except ConnectionResetError:
         print(f"[Server] Peer {addr} disconnected abruptly")
     except Exception as e:
         print(f"[Server] Error handling client {addr}: {e}")
     finally:
-        if username and user_id:
-            print(f"[Server] Client {username} (ID: {user_id}) is disconnecting. Processing cleanup...")
-            if not is_visitor(user_id):
-                # Handle authenticated user
-                if username in users:
-                    if "client_addr" in users[username]:
-                        del users[username]["client_addr"]
-                        save_users()
-            else:
-                # Handle visitor
-                print(f"[Server] Visitor {username} (ID: {user_id}) is logging out. Removing from channels...")
-                channels_updated = False
-                for channel_id, channel in channels.items():
-                    if user_id in channel["members"]:
-                        channel["members"].remove(user_id)
-                        channels_updated = True
-                        print(f"[Server] Removed visitor {username} (ID: {user_id}) from channel {channel_id} ({channel['name']})")
-                        broadcast(f"UPDATE_CHANNELS {channel_id} {channel['name']} {channel['host']}")
-                if channels_updated:
-                    channel_db["channels"] = channels
-                    save_channels()
-                    print(f"[Server] Updated channels.json after removing visitor {username} (ID: {user_id})")
-                else:
-                    print(f"[Server] No channels updated for visitor {username} (ID: {user_id}) - they were not in any channels")
-                # Remove the visitor from visitor_ids and visitor_statuses
-                visitor_name = None
-                for name, vid in list(visitor_ids.items()):
-                    if vid == user_id:
-                        visitor_name = name
-                        break
-                if visitor_name:
-                    del visitor_ids[visitor_name]
-                    print(f"[Server] Removed visitor {visitor_name} (ID: {user_id}) from visitor_ids")
-                else:
-                    print(f"[Server] Visitor ID {user_id} not found in visitor_ids during cleanup")
-                if user_id in visitor_statuses:
-                    del visitor_statuses[user_id]
-                    print(f"[Server] Removed visitor {username} (ID: {user_id}) from visitor_statuses")
-                    broadcast(f"STATUS {user_id} Offline", exclude_conn=conn)
-            # Stop any active streams by this user
-            for channel_id in list(livestreamers.keys()):
-                if livestreamers[channel_id][0] == user_id:
-                    del livestreamers[channel_id]
-                    broadcast_to_channel(channel_id, f"LIVESTREAM_STOP {user_id} {channel_id}")
-                    print(f"[Server] Stopped stream for user {user_id} in channel {channel_id} due to disconnect")
-        if (conn, addr, username, user_id) in connected_clients:
-            connected_clients.remove((conn, addr, username, user_id))
-            print(f"[Server] Removed {username} (ID: {user_id}) from connected clients")
-            # Log the disconnection
-            log_connection("CONNECTION_CLOSED", "Centralized Server", f"Client {username} (ID: {user_id}) disconnected from {addr}")
-        peer_manager.remove_peer(addr)
-        conn.close()
+        close_session(session)
 
 def new_connection(conn, addr):
-    peer_manager.add_peer(addr)
-    handle_client_messages(conn, addr)
+    session = open_session(conn, addr)
+    Thread(target=client_writer, args=(session,), daemon=True).start()
+    handle_client_messages(session)
 
 
 def get_host_default_interface_ip(): #get server IP
@@ -632,22 +1568,270 @@ def get_host_default_interface_ip(): #get server IP
     return ip
 
 
-def server_program(host, port): #the server's program
+def create_server_socket(host, port, backlog):
     serversocket = socket.socket() #create a TCP connection
+    serversocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if WORKER_COUNT > 1:
+        # Every worker binds the same port; the kernel spreads new connections over them
+        serversocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     serversocket.bind((host, port)) #binds it to (host, port)
+    serversocket.listen(backlog)
+    return serversocket
 
-    serversocket.listen(10) #Listens for connection with a backlog of 10 (just accept 10 clients at a time)
+
+def server_program(host, port): #the server's program, one thread per client
+    serversocket = create_server_socket(host, port, 10) #Listens for connection with a backlog of 10 (just accept 10 clients at a time)
     while True:
         conn, addr = serversocket.accept() #blocking commands, the program will be blocked until a connection to this socket happen
         #accept connection to this socket
-        nconn = Thread(target=new_connection, args=(conn, addr)) #method is new_connection, arguments is conn, addr
+        nconn = Thread(target=new_connection, args=(conn, addr), daemon=True) #method is new_connection, arguments is conn, addr
         #spawning a new thread per client (to support multi-connection) and execute new_connection method
+        #daemon, so SIGTERM (e.g. from run_workers) stops the server without waiting for clients to hang up
         nconn.start()
 
 
+class EventLoop:
+    """eventloop mode: one thread owns every client socket through a selector.
+
+    Sockets are non-blocking. Handlers only queue outbound frames; the loop
+    writes them when the socket is writable, so a slow client never stalls it.
+    """
+    def __init__(self, serversocket):
+        self.serversocket = serversocket
+        self.sel = selectors.DefaultSelector()
+        self.sel.register(serversocket, selectors.EVENT_READ, "accept")
+        # Lets other threads wake select() when they queue frames for a client
+        self.wake_r, self.wake_w = socket.socketpair()
+        self.wake_r.setblocking(False)
+        self.wake_w.setblocking(False)
+        self.sel.register(self.wake_r, selectors.EVENT_READ, "wake")
+        self.ready = set()
+        self.ready_lock = threading.Lock()
+        self.thread_id = None
+
+    def run(self):
+        self.thread_id = threading.get_ident()
+        while True:
+            for key, mask in self.sel.select():
+                if key.data == "accept":
+                    self.accept()
+                elif key.data == "wake":
+                    try:
+                        while self.wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    session = key.data
+                    if mask & selectors.EVENT_READ:
+                        self.read(session)
+                    if mask & selectors.EVENT_WRITE and not session.closed:
+                        self.flush(session)
+            self.flush_ready()
+
+    def accept(self):
+        try:
+            conn, addr = self.serversocket.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        session = open_session(conn, addr)
+        session.outbound.on_ready = lambda: self.notify_writable(session)
+        self.sel.register(conn, selectors.EVENT_READ, session)
+
+    def read(self, session):
+        addr = session.addr
+        try:
+            data = session.conn.recv(RECV_BUFFER_SIZE)
+            if data:
+                handle_session_data(session, data)
+                return
+            print(f"[Server] Peer {addr} disconnected gracefully")
+        except BlockingIOError:
+            return
+        except ConnectionResetError:
+            print(f"[Server] Peer {addr} disconnected abruptly")
+        except Exception as e:
+            print(f"[Server] Error handling client {addr}: {e}")
+        self.close(session)
+
+    def notify_writable(self, session):
+        with self.ready_lock:
+            self.ready.add(session)
+        if threading.get_ident() != self.thread_id:
+            try:
+                self.wake_w.send(b"\0")
+            except BlockingIOError:
+                pass  # a wake-up is already pending
+
+    def flush_ready(self):
+        with self.ready_lock:
+            ready, self.ready = self.ready, set()
+        for session in ready:
+            if not session.closed:
+                self.flush(session)
+
+    def flush(self, session):
+        """Write as much queued output as the socket accepts without blocking."""
+        if session.outbound.overflowed:
+            self.close(session)
+            return
+        try:
+            while True:
+                if not session.pending:
+                    session.pending = session.outbound.take()
+                    if not session.pending:
+                        break
+                sent = session.conn.send(session.pending)
+                session.pending = session.pending[sent:]
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            print(f"[Server] Failed to write to {session.addr}: {e}")
+            self.close(session)
+            return
+        events = selectors.EVENT_READ
+        if session.pending or session.outbound.depth:
+            events |= selectors.EVENT_WRITE
+        if events != session.events:
+            self.sel.modify(session.conn, events, session)
+            session.events = events
+
+    def close(self, session):
+        if session.closed:
+            return
+        self.sel.unregister(session.conn)
+        close_session(session)
+
+
+def event_loop_server_program(host, port): #single thread multiplexing every client with a selector
+    serversocket = create_server_socket(host, port, EVENT_LOOP_BACKLOG)
+    serversocket.setblocking(False)
+    EventLoop(serversocket).run()
+
+
+SERVER_MODES = {
+    "threaded": server_program,
+    "eventloop": event_loop_server_program,
+}
+
+
+def configure_worker(index, count, bus_path, version):
+    """Make this process worker <index> of <count> (--workers), connected to the state bus at bus_path.
+
+    Worker 0 writes users, channels and the message log; the others keep the same
+    state in memory from the bus, read history from worker 0's log and write only
+    their own connection log.
+    """
+    global WORKER_INDEX, WORKER_COUNT, connection_logger, channels_version, state_bus
+    WORKER_INDEX, WORKER_COUNT = index, count
+    channels_version = version  # same start everywhere, so GET_CHANNELS_IF_NEWER versions agree across workers
+    load_state()  # before joining the bus: events must not be applied to state that is not loaded yet
+    if index:
+        connection_logger.close()
+        base, ext = os.path.splitext(LOG_FILE)
+        connection_logger = ConnectionLogger(f"{base}.w{index}{ext}", MAX_LOG_BYTES, LOG_FLUSH_INTERVAL)
+        connection_logger.start()
+    state_bus = StateBus(bus_path, index, apply_bus_event)
+
+
+def run_workers(count):
+    """--workers: run the state bus hub and <count> server processes sharing the port."""
+    log = MessageLog(MESSAGE_LOG_DIR)
+    import_legacy_messages(log)  # before any worker reads the log
+    log.close()
+    bus_dir = tempfile.mkdtemp(prefix="segment_chat_bus_")
+    bus_path = os.path.join(bus_dir, "bus.sock")
+    hub = BusHub(bus_path, count)
+    Thread(target=hub.serve_forever, daemon=True).start()
+    connection_logger.close()  # the workers write the connection logs
+    command = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:]
+    workers = [subprocess.Popen(command + ["--worker-index", str(index), "--bus", bus_path,
+                                           "--channels-version", str(channels_version)])
+               for index in range(count)]
+    print(f"[Server] Started {count} workers, state bus at {bus_path}")
+    print("[Server] --workers is experimental: every state change runs on worker 0, so writes are not faster than with one process")
+
+    def stop(signum, frame):
+        for worker in workers:
+            worker.terminate()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        for worker in workers:
+            worker.wait()
+    finally:
+        shutil.rmtree(bus_dir, ignore_errors=True)
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog='Server',
+        description='Centralized Segment Chat server')
+    parser.add_argument('--mode', choices=sorted(SERVER_MODES), default='threaded',
+                        help='threaded: one thread per client; eventloop: one thread multiplexing all clients')
+    parser.add_argument('--host', help='IP address to listen on (default: the host default interface IP)')
+    parser.add_argument('--port', type=int, default=22236, help='Port number to listen on')
+    parser.add_argument('--queue-size', type=int, default=OUTBOUND_QUEUE_SIZE,
+                        help='Outbound frames buffered per client before the overflow policy applies')
+    parser.add_argument('--overflow-policy', choices=OVERFLOW_POLICIES, default=OUTBOUND_OVERFLOW_POLICY,
+                        help='What to do with a client whose outbound queue is full')
+    parser.add_argument('--storage', choices=['json', 'sqlite'], default='json',
+                        help='json: users.json, channels.json and the message log; sqlite: one WAL-mode database')
+    parser.add_argument('--db-file', default=SQLITE_DB_FILE,
+                        help='SQLite database path; created and filled from the JSON files on first use')
+    parser.add_argument('--max-staleness', type=float, default=PERSIST_MAX_STALENESS,
+                        help='Seconds a users/channels change may stay unsaved before it is written (0 = write-through)')
+    parser.add_argument('--presence-window', type=float, default=PRESENCE_WINDOW,
+                        help='Seconds status changes are coalesced per user before being sent (0 = send immediately)')
+    parser.add_argument('--resume-grace', type=float,
+                        help=f'Seconds a dropped session stays resumable with RESUME (0 = clean up at once; '
+                             f'default {RESUME_GRACE_PERIOD:g}, 0 with --workers)')
+    parser.add_argument('--log-echo', action='store_true',
+                        help='Also print every connection log record (printed by the log writer thread)')
+    parser.add_argument('--log-level', choices=['info', 'debug'], default=LOG_LEVEL,
+                        help='debug also writes one NOTIFICATION_SENT record per broadcast recipient')
+    parser.add_argument('--workers', type=int, default=WORKER_COUNT,
+                        help='Experimental, not faster: server processes sharing the port through SO_REUSEPORT and a state bus; '
+                             'every state change runs on worker 0 (needs --storage json and --mode threaded)')
+    # Set by run_workers for the processes it starts
+    parser.add_argument('--worker-index', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--bus', help=argparse.SUPPRESS)
+    parser.add_argument('--channels-version', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.workers > 1 and args.storage != 'json':
+        parser.error('--workers needs --storage json')
+    if args.workers > 1 and args.mode != 'threaded':
+        # A replicated command waits for worker 0's answer, which would stall every connection of the loop
+        parser.error('--workers needs --mode threaded')
+    if args.workers > 1 and args.resume_grace:
+        # Tokens and missed events live in the worker that issued them; most reconnects land on another one
+        parser.error('--workers needs --resume-grace 0: a session cannot be resumed on another worker')
+    if args.resume_grace is None:
+        args.resume_grace = 0 if args.workers > 1 else RESUME_GRACE_PERIOD
+    if args.workers > 1 and args.worker_index is None:
+        run_workers(args.workers)
+        sys.exit(0)
+    if args.storage == 'sqlite':
+        use_sqlite_storage(args.db_file)
+    if args.worker_index is not None:
+        configure_worker(args.worker_index, args.workers, args.bus, args.channels_version)
+    else:
+        load_state()
+    users_writer.delay = channels_writer.delay = args.max_staleness
+    presence_aggregator.delay = args.presence_window
+    resume_registry.grace_period = args.resume_grace
+    connection_logger.echo = args.log_echo
+    LOG_LEVEL = args.log_level
+    atexit.register(connection_logger.close)
+    atexit.register(flush_state)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # run atexit flushes on kill
+    OUTBOUND_QUEUE_SIZE = args.queue_size
+    OUTBOUND_OVERFLOW_POLICY = args.overflow_policy
+    start_background_tasks()
     #hostname = socket.gethostname()
-    hostip = get_host_default_interface_ip() #return the server IP
-    port = 22236 #using port 22236 on server IP
-    print("Listening on: {}:{}".format(hostip,port)) #print out server IP and Port
-    server_program(hostip, port) #run server's program with server's IP and port
\ No newline at end of file
+    hostip = args.host or get_host_default_interface_ip() #return the server IP
+    port = args.port #using port 22236 on server IP by default
+    print("Listening on: {}:{} ({} mode{})".format(hostip, port, args.mode,
+                                                 f", worker {WORKER_INDEX}/{WORKER_COUNT}" if WORKER_COUNT > 1 else "")) #print out server IP and Port
+    SERVER_MODES[args.mode](hostip, port) #run server's program with server's IP and port
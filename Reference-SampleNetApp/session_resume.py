@@ -0,0 +1,99 @@
+import secrets
+import threading
+import time
+from collections import deque
+
+
+class ResumeState:
+    """What survives a dropped connection: the identity behind a token and the events pushed to it.
+
+    events holds (seq, frame) for the last buffer_size events pushed to the
+    session, in the order they were queued, so a client that reconnects with the
+    seq of the last event it received gets exactly the frames that followed it.
+    session is the ClientSession currently bound to the token.
+    """
+    def __init__(self, token, username, user_id, buffer_size):
+        self.token = token
+        self.username = username
+        self.user_id = user_id
+        self.events = deque(maxlen=buffer_size)
+        self.evicted = 0  # events pushed out of the buffer; a resume from before them is impossible
+        self.session = None
+        self.detached_at = None  # monotonic time the connection dropped, None while connected
+        self.lock = threading.Lock()  # orders record() with the outbound queue of the bound session
+
+    def record(self, seq, frame):
+        if len(self.events) == self.events.maxlen:
+            self.evicted += 1
+        self.events.append((seq, frame))
+
+    def missed_since(self, last_seq):
+        """Frames pushed after the event last_seq, or None if some of them were already evicted.
+
+        last_seq 0 means the client never received an event.
+        """
+        frames = []
+        for seq, frame in reversed(self.events):
+            if seq == last_seq:
+                frames.reverse()
+                return frames
+            frames.append(frame)
+        if last_seq == 0 and not self.evicted:
+            frames.reverse()
+            return frames
+        return None
+
+
+class ResumeRegistry:
+    """Session tokens issued at login, kept grace_period seconds after their connection drops."""
+    def __init__(self, grace_period=30.0, buffer_size=1000):
+        self.grace_period = grace_period
+        self.buffer_size = buffer_size
+        self.states = {}  # {token: ResumeState}
+        self.lock = threading.Lock()
+        self.resumed = 0
+        self.expired_count = 0
+
+    def issue(self, username, user_id):
+        state = ResumeState(secrets.token_urlsafe(18), username, user_id, self.buffer_size)
+        with self.lock:
+            self.states[state.token] = state
+        return state
+
+    def detach(self, state):
+        with self.lock:
+            state.detached_at = time.monotonic()
+
+    def get(self, token):
+        with self.lock:
+            return self.states.get(token)
+
+    def attach(self, state):
+        """Mark a state as bound to a live connection again; False if it expired in the meantime."""
+        with self.lock:
+            if self.states.get(state.token) is not state:
+                return False
+            state.detached_at = None
+            self.resumed += 1
+            return True
+
+    def discard(self, state):
+        with self.lock:
+            self.states.pop(state.token, None)
+
+    def expired(self):
+        """Remove and return the states whose connection has been gone longer than grace_period."""
+        deadline = time.monotonic() - self.grace_period
+        with self.lock:
+            expired = [state for state in self.states.values()
+                       if state.detached_at is not None and state.detached_at <= deadline]
+            for state in expired:
+                del self.states[state.token]
+            self.expired_count += len(expired)
+        return expired
+
+    def stats(self):
+        with self.lock:
+            detached = sum(1 for state in self.states.values() if state.detached_at is not None)
+            return {"sessions": len(self.states), "detached": detached, "resumed": self.resumed,
+                    "expired": self.expired_count}
@@ -0,0 +1,209 @@
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    status TEXT NOT NULL,
+    user_id TEXT NOT NULL UNIQUE,
+    client_addr TEXT
+);
+CREATE TABLE IF NOT EXISTS channels (
+    channel_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    host TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS channel_members (
+    channel_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (channel_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS channel_members_user ON channel_members (user_id);
+CREATE TABLE IF NOT EXISTS messages (
+    channel_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    message TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    PRIMARY KEY (channel_id, seq)
+);
+CREATE INDEX IF NOT EXISTS messages_channel_time ON messages (channel_id, timestamp);
+CREATE INDEX IF NOT EXISTS messages_user ON messages (user_id);
+"""
+
+
+class SqliteStore:
+    """SQLite (WAL mode) storage for users, channels and messages.
+
+    load_users/save_users and load_channels/save_channels take and return the same
+    dictionaries as the JSON files, so server.py keeps its call sites. For messages
+    it offers the MessageLog interface (append, load_all, channel_ids, compact_all,
+    read_range, tail), so the tiered message store pages through it like the log.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()  # one connection shared by every handler thread
+
+    def get_meta(self, key, default):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return int(row[0]) if row else default
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def is_empty(self):
+        with self.lock:
+            for table in ("users", "channels", "messages"):
+                if self.conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                    return False
+            return True
+
+    def load_users(self):
+        with self.lock:
+            users = {}
+            for username, password, status, user_id, client_addr in self.conn.execute(
+                    "SELECT username, password, status, user_id, client_addr FROM users"):
+                users[username] = {"password": password, "status": status, "user_id": user_id}
+                if client_addr is not None:
+                    users[username]["client_addr"] = client_addr
+            return {"users": users, "next_user_id": self.get_meta("next_user_id", 1)}
+
+    def save_users(self, user_db, usernames=None):
+        """Upsert users (all of them, or only the given usernames) in one transaction."""
+        users = user_db["users"]
+        names = users.keys() if usernames is None else [name for name in usernames if name in users]
+        rows = [(name, users[name]["password"], users[name]["status"], users[name]["user_id"],
+                 users[name].get("client_addr")) for name in names]
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT INTO users (username, password, status, user_id, client_addr) VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(username) DO UPDATE SET password = excluded.password, status = excluded.status, "
+                    "user_id = excluded.user_id, client_addr = excluded.client_addr", rows)
+                self._set_meta("next_user_id", user_db["next_user_id"])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def load_channels(self):
+        with self.lock:
+            channels = {}
+            for channel_id, name, host in self.conn.execute("SELECT channel_id, name, host FROM channels"):
+                channels[channel_id] = {"name": name, "host": host, "members": []}
+            for channel_id, user_id in self.conn.execute(
+                    "SELECT channel_id, user_id FROM channel_members ORDER BY channel_id, position"):
+                if channel_id in channels:
+                    channels[channel_id]["members"].append(user_id)
+            return {"channels": channels, "next_id": self.get_meta("next_channel_id", 1)}
+
+    def save_channels(self, channel_db, channel_ids=None):
+        """Replace channels (all of them, or only the given IDs) and their members in one transaction."""
+        channels = channel_db["channels"]
+        ids = list(channels.keys()) if channel_ids is None else [cid for cid in channel_ids if cid in channels]
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                for channel_id in ids:
+                    channel = channels[channel_id]
+                    self.conn.execute("INSERT OR REPLACE INTO channels (channel_id, name, host) VALUES (?, ?, ?)",
+                                      (channel_id, channel["name"], channel["host"]))
+                    self.conn.execute("DELETE FROM channel_members WHERE channel_id = ?", (channel_id,))
+                    self.conn.executemany(
+                        "INSERT INTO channel_members (channel_id, user_id, position) VALUES (?, ?, ?)",
+                        [(channel_id, user_id, position) for position, user_id in enumerate(channel["members"])])
+                self._set_meta("next_channel_id", channel_db["next_id"])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def append(self, channel_id, record):
+        """Store one message; assigns and returns its per-channel sequence number."""
+        channel_id = str(channel_id)
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                row = self.conn.execute("SELECT MAX(seq) FROM messages WHERE channel_id = ?", (channel_id,)).fetchone()
+                seq = row[0] + 1 if row[0] is not None else 0
+                self.conn.execute(
+                    "INSERT INTO messages (channel_id, seq, user_id, message, timestamp) VALUES (?, ?, ?, ?, ?)",
+                    (channel_id, seq, record["user_id"], record["message"], record["timestamp"]))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return seq
+
+    @staticmethod
+    def _record(row):
+        seq, user_id, message, timestamp = row
+        return {"user_id": user_id, "message": message, "timestamp": timestamp, "seq": seq}
+
+    def load_channel(self, channel_id):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, user_id, message, timestamp FROM messages WHERE channel_id = ? ORDER BY seq",
+                (str(channel_id),)).fetchall()
+        return [self._record(row) for row in rows]
+
+    def load_all(self):
+        return {channel_id: self.load_channel(channel_id) for channel_id in self.channel_ids()}
+
+    def channel_ids(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT DISTINCT channel_id FROM messages")]
+
+    def read_range(self, channel_id, start, stop):
+        """Return the records with start <= seq < stop."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, user_id, message, timestamp FROM messages WHERE channel_id = ? AND seq >= ? AND seq < ? "
+                "ORDER BY seq", (str(channel_id), start, stop)).fetchall()
+        return [self._record(row) for row in rows]
+
+    def tail(self, channel_id, count):
+        """Return (newest count records, seq of the next message)."""
+        with self.lock:
+            row = self.conn.execute("SELECT MAX(seq) FROM messages WHERE channel_id = ?", (str(channel_id),)).fetchone()
+        next_seq = row[0] + 1 if row[0] is not None else 0
+        return self.read_range(channel_id, max(0, next_seq - count), next_seq), next_seq
+
+    def compact_all(self, min_segments=None):
+        """Checkpoint the WAL back into the database file; nothing else to compact."""
+        with self.lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return 0
+
+    def import_state(self, user_db, channel_db, messages):
+        """One-shot migration: copy users, channels and message history into the database."""
+        self.save_users(user_db)
+        self.save_channels(channel_db)
+        with self.lock:
+            self.conn.execute("BEGIN")
+            try:
+                for channel_id, records in messages.items():
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO messages (channel_id, seq, user_id, message, timestamp) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        [(str(channel_id), record.get("seq", seq), record["user_id"], record["message"],
+                          record["timestamp"]) for seq, record in enumerate(records)])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,156 @@
+import itertools
+import json
+import os
+import queue
+import selectors
+import signal
+import socket
+import threading
+
+from framing import FrameDecoder, encode_frame
+
+
+class BusHub:
+    """Hub of the state bus that --workers processes share, listening on a Unix socket.
+
+    Every frame a worker sends is forwarded to every worker, the sender included,
+    by this one thread, so all workers see the same events in the same order.
+    Forwarding only starts once all the workers are connected; until then their
+    events wait in the socket buffers, so no worker misses one.
+    """
+    def __init__(self, path, workers):
+        self.path = path
+        self.workers = workers
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        self.listener.listen(workers)
+        self.events = 0
+
+    def serve_forever(self):
+        conns = []
+        while len(conns) < self.workers:
+            conn, _ = self.listener.accept()
+            conns.append(conn)
+        self.listener.close()
+        sel = selectors.DefaultSelector()
+        decoders = {}
+        for conn in conns:
+            sel.register(conn, selectors.EVENT_READ)
+            decoders[conn] = FrameDecoder()
+        while True:
+            for key, _ in sel.select():
+                data = key.fileobj.recv(65536)
+                if not data:
+                    print("[Server] A worker left the state bus, stopping")
+                    for conn in conns:
+                        conn.close()
+                    return
+                frames = decoders[key.fileobj].feed(data)
+                if not frames:
+                    continue
+                self.events += len(frames)
+                batch = b"".join(encode_frame(frame) for frame in frames)
+                for conn in conns:
+                    conn.sendall(batch)
+
+
+class StateBus:
+    """A worker's connection to the BusHub.
+
+    publish() queues an event for the hub (a sender thread writes them, in order,
+    so the reader thread may publish without blocking on the hub); the reader
+    thread hands every event the hub forwards, this worker's own included, to
+    apply_fn(event, addr, conn) in hub order. submit() publishes an event and
+    waits for the event that answers it: one whose "worker" is this worker and
+    whose "reply" is the request ID submit() added. apply_fn then gets the addr
+    and conn given to submit() and its return value becomes submit()'s; every
+    other event is applied with None.
+    """
+    def __init__(self, path, worker_index, apply_fn):
+        self.worker_index = worker_index
+        self.apply_fn = apply_fn
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.outbox = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = {}  # {request id: waiter dict} for events submitted by this worker
+        self.request_ids = itertools.count(1)
+        self.closed = False
+        self.published = 0
+        self.applied = 0
+        threading.Thread(target=self._send, name="state-bus-send", daemon=True).start()
+        threading.Thread(target=self._run, name="state-bus", daemon=True).start()
+
+    def publish(self, event):
+        self.outbox.put(encode_frame(json.dumps(event, separators=(",", ":"))))
+
+    def submit(self, event, addr=None, conn=None):
+        """Publish an event and return apply_fn's result for its answer.
+
+        There is no timeout: the answer is what every worker applies, so giving up
+        early would tell the client something other than what happened. Raises
+        ConnectionError if the bus closes first (the worker is stopping then).
+        """
+        request_id = next(self.request_ids)
+        waiter = {"addr": addr, "conn": conn, "done": threading.Event(), "result": None}
+        with self.lock:
+            if self.closed:
+                raise ConnectionError("state bus closed")
+            self.pending[request_id] = waiter
+        self.publish(dict(event, worker=self.worker_index, request=request_id))
+        waiter["done"].wait()
+        if "error" in waiter:
+            raise ConnectionError(waiter["error"])
+        return waiter["result"]
+
+    def _send(self):
+        while True:
+            frames = [self.outbox.get()]
+            while not self.outbox.empty():
+                frames.append(self.outbox.get_nowait())
+            try:
+                self.sock.sendall(b"".join(frames))
+            except OSError as e:
+                print(f"[Server] Could not write to the state bus: {e}")
+                return
+            self.published += len(frames)
+
+    def _run(self):
+        decoder = FrameDecoder()
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except OSError:
+                data = b""
+            if not data:
+                # A worker that stops receiving events would diverge from the others
+                print("[Server] State bus closed, stopping worker")
+                with self.lock:
+                    self.closed = True
+                    waiters, self.pending = list(self.pending.values()), {}
+                for waiter in waiters:
+                    waiter["error"] = "state bus closed"
+                    waiter["done"].set()
+                os.kill(os.getpid(), signal.SIGTERM)
+                return
+            for frame in decoder.feed(data):
+                event = json.loads(frame)
+                waiter = None
+                if event.get("worker") == self.worker_index and event.get("reply") is not None:
+                    with self.lock:
+                        waiter = self.pending.pop(event["reply"], None)
+                addr, conn = (waiter["addr"], waiter["conn"]) if waiter else (None, None)
+                try:
+                    result = self.apply_fn(event, addr, conn)
+                except Exception as e:
+                    print(f"[Server] Error applying state bus event {event}: {e}")
+                    result = None
+                self.applied += 1
+                if waiter:
+                    waiter["result"] = result
+                    waiter["done"].set()
+
+    def stats(self):
+        with self.lock:
+            pending = len(self.pending)
+        return {"published": self.published, "applied": self.applied, "pending": pending}
@@ -0,0 +1,39 @@
+import threading
+import zlib
+from contextlib import contextmanager
+
+
+class StripedLock:
+    """A fixed set of locks shared out by key, e.g. one stripe per channel ID.
+
+    Two keys only contend when they hash to the same stripe, so with enough
+    stripes handlers working on different channels (or users) run side by side,
+    while everything touching one key is serialized. Stripes are reentrant, so a
+    handler may call a helper that locks the same key again. hold() takes several
+    keys at once in stripe order, which keeps multi-key holders from deadlocking.
+    """
+    def __init__(self, name, stripes=64):
+        self.name = name
+        self.locks = [threading.RLock() for _ in range(stripes)]
+        self.acquired = 0
+        self.contended = 0  # acquisitions that had to wait for another thread (counters are best effort)
+
+    def stripe(self, key):
+        return zlib.crc32(str(key).encode()) % len(self.locks)
+
+    @contextmanager
+    def hold(self, *keys):
+        locks = [self.locks[i] for i in sorted({self.stripe(key) for key in keys})]
+        for lock in locks:
+            if not lock.acquire(blocking=False):
+                self.contended += 1
+                lock.acquire()
+            self.acquired += 1
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def stats(self):
+        return {"stripes": len(self.locks), "acquired": self.acquired, "contended": self.contended}
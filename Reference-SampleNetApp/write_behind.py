@@ -0,0 +1,60 @@
+import json
+import os
+import time
+
+from delayed_flush import DelayedFlush
+
+
+def write_json_atomic(path, data):
+    """Write data as JSON to a temp file and rename it over path, so readers never see a partial file."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class WriteBehind(DelayedFlush):
+    """Coalesces save requests for one piece of state into periodic flushes.
+
+    mark_dirty(*keys) only records which records changed (e.g. usernames); a
+    background thread calls flush_fn(keys) with every key marked since the last
+    flush once the oldest unsaved change is delay (the --max-staleness) seconds
+    old, so a burst of changes costs one write. With a delay of 0 every
+    mark_dirty() flushes synchronously. flush() writes any pending change
+    immediately (used on shutdown).
+    """
+    def __init__(self, name, flush_fn, max_staleness=1.0):
+        super().__init__(name, max_staleness)
+        self.flush_fn = flush_fn
+        self.dirty_keys = set()
+        self.marks = 0
+
+    def mark_dirty(self, *keys):
+        with self.cond:
+            self.marks += 1
+            self.dirty_keys.update(keys)
+            flush_now = self.schedule()
+        if flush_now:
+            self.flush()
+
+    def take(self):
+        keys, self.dirty_keys = self.dirty_keys, set()
+        return keys
+
+    def write(self, keys):
+        try:
+            self.flush_fn(keys)
+        except Exception as e:
+            # e.g. a handler resized a dict mid-dump: stay dirty; flush() backs off and retries
+            with self.cond:
+                self.dirty_keys |= keys
+                self.pending_since = self.pending_since or time.monotonic()
+            print(f"[Server] Error flushing {self.name}, will retry: {e}")
+            return False
+        return True
+
+    def stats(self):
+        with self.cond:
+            return {"marks": self.marks, "flushes": self.flushes, "dirty": self.pending_since is not None}